@@ -1,19 +1,33 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 import json
 from io import StringIO
-import subprocess
 import sys
 import os
-import folium
-from streamlit_folium import st_folium
-import geopandas as gpd
-from shapely.wkt import loads
-import branca.colormap as cm
+
+# Plotting and GIS libraries (plotly, folium, streamlit_folium, geopandas,
+# branca) are imported inside the functions that use them, so a fresh worker
+# can render the Overview and About pages without loading them.
+# bench_import_time.py checks that this stays true.
+
+import cz_assets
+import cz_compare
+import cz_data
+import cz_maps
+import cz_memprof
+import cz_rank
+import cz_rworker
+import cz_schema
+import cz_shared
+import cz_table
+import cz_tiles
+import cz_viewport
+import cz_warmup
+
+# Countries whose maps are prebuilt at start-up, besides the default one
+MAX_WARM_COUNTRIES = 5
+DEFAULT_COUNTRY = "United Kingdom"
 
 # Page configuration
 st.set_page_config(
@@ -53,114 +67,203 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def create_sample_data():
-    """Create sample commuting zones data for demonstration"""
-    sample_data = {
-        'region': ['Europe'] * 67,
-        'fbcz_id': [f'Europe{i:03d}' for i in range(1, 68)],
-        'fbcz_id_num': list(range(1, 68)),
-        'cz_gen_ds': ['2023-03-01'] * 67,
-        'win_population': [
-            4442659, 4442659, 4442659, 4442659, 2883908,  # Top 5 UK zones
-            2000000, 1800000, 1600000, 1400000, 1200000,  # More UK zones
-        ] + [np.random.randint(50000, 1000000) for _ in range(57)],  # Random for demo
-        'win_roads_km': [np.random.randint(1000, 5000) for _ in range(67)],
-        'area': [
-            4877.340, 4673.963, 2435.145, 5708.196, 3386.769,  # Top 5 UK zones
-            3000, 2800, 2600, 2400, 2200,  # More UK zones
-        ] + [np.random.randint(500, 3000) for _ in range(57)],  # Random for demo
-        'country': ['United Kingdom'] * 67,
-        'geography_wkt': [
-            'POLYGON((-0.5 51.5, -0.4 51.5, -0.4 51.6, -0.5 51.6, -0.5 51.5))',  # London area
-            'POLYGON((-1.5 52.5, -1.4 52.5, -1.4 52.6, -1.5 52.6, -1.5 52.5))',  # Birmingham area
-            'POLYGON((-2.5 53.5, -2.4 53.5, -2.4 53.6, -2.5 53.6, -2.5 53.5))',  # Manchester area
-            'POLYGON((-3.5 54.5, -3.4 54.5, -3.4 54.6, -3.5 54.6, -3.5 54.5))',  # Liverpool area
-            'POLYGON((-4.5 55.5, -4.4 55.5, -4.4 55.6, -4.5 55.6, -4.5 55.5))',  # Glasgow area
-        ] + [
-            f'POLYGON(({-5 + i*0.1} {56 + i*0.1}, {-4.9 + i*0.1} {56 + i*0.1}, {-4.9 + i*0.1} {56.1 + i*0.1}, {-5 + i*0.1} {56.1 + i*0.1}, {-5 + i*0.1} {56 + i*0.1}))'
-            for i in range(62)
-        ]
-    }
-    
-    # Create summary data
-    summary_data = {
-        'country': ['United Kingdom'],
-        'total_zones': [67],
-        'total_population': [sum(sample_data['win_population'])],
-        'total_area': [sum(sample_data['area'])],
-        'avg_population': [np.mean(sample_data['win_population'])],
-        'avg_area': [np.mean(sample_data['area'])]
-    }
-    
-    return pd.DataFrame(sample_data), pd.DataFrame(summary_data)
+@st.cache_resource
+@cz_memprof.profiled("load_commuting_zones_data")
+def load_dataset():
+    """(shared dataset, whether it is the sample data), exporting it once per host
+
+    This runs on the warm-up thread, where Streamlit elements do nothing, so
+    the page script tells the user about the sample data (see main).
+    """
+    try:
+        return cz_shared.load_shared_dataset(cz_data.export_commuting_zones_data,
+                                             key=f"cz_data_v{cz_schema.SCHEMA_VERSION}"), False
+    except Exception:
+        data, summary = cz_data.create_sample_data()
+        return cz_shared.SharedDataset.from_frames(cz_schema.compact_zone_table(data), summary), True
+
+def load_shared_dataset():
+    """Attach to the host-wide shared dataset"""
+    return load_dataset()[0]
 
-@st.cache_data
 def load_commuting_zones_data():
     """Load commuting zones data using R script or fallback to sample data"""
-    try:
-        # Create R script to extract data with geometry
-        r_script = '''
-        library(CommutingZones)
-        library(dplyr)
-        library(jsonlite)
-        library(sf)
-        
-        # Load data
-        data(cz_data)
-        
-        # Convert to data frame and handle geometry
-        cz_df <- as.data.frame(cz_data)
-        
-        # Keep geometry for mapping
-        cz_df$geography_wkt <- as.character(cz_data$geography)
-        
-        # Convert to JSON
-        json_data <- toJSON(cz_df, pretty = TRUE)
-        
-        # Write to file
-        writeLines(json_data, "commuting_zones_data.json")
-        
-        # Also create a summary
-        summary_data <- cz_df %>%
-          group_by(country) %>%
-          summarise(
-            total_zones = n(),
-            total_population = sum(win_population, na.rm = TRUE),
-            total_area = sum(area, na.rm = TRUE),
-            avg_population = mean(win_population, na.rm = TRUE),
-            avg_area = mean(area, na.rm = TRUE)
-          )
-        
-        summary_json <- toJSON(summary_data, pretty = TRUE)
-        writeLines(summary_json, "summary_data.json")
-        
-        cat("Data exported successfully\\n")
-        '''
-        
-        # Write R script to file
-        with open("extract_data.R", "w") as f:
-            f.write(r_script)
-        
-        # Run R script
-        result = subprocess.run(["Rscript", "extract_data.R"], 
-                              capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            # Load the JSON data
-            with open("commuting_zones_data.json", "r") as f:
-                data = json.load(f)
-            
-            with open("summary_data.json", "r") as f:
-                summary = json.load(f)
-            
-            return pd.DataFrame(data), pd.DataFrame(summary)
-        else:
-            st.warning("R processing not available. Using sample data for demonstration.")
-            return create_sample_data()
-            
-    except Exception as e:
-        st.warning("R processing not available. Using sample data for demonstration.")
-        return create_sample_data()
+    dataset = load_shared_dataset()
+    return dataset.data, dataset.summary
+
+@st.cache_resource
+@cz_memprof.profiled()
+def get_zone_geometries():
+    """Parse the geometry of every zone once per process"""
+    dataset = load_shared_dataset()
+    return dataset.geometries(np.arange(len(dataset.data)))
+
+@st.cache_resource
+def get_country_statistics():
+    """Per-country zone count, population and area aggregates"""
+    data, _ = load_commuting_zones_data()
+    return data.groupby('country', observed=True).agg(
+        total_zones=('fbcz_id', 'size'),
+        total_population=('win_population', 'sum'),
+        total_area=('area', 'sum'),
+        avg_population=('win_population', 'mean'),
+    )
+
+@st.cache_resource
+def get_zone_table():
+    """Sort orders over the whole zone table, built once per process"""
+    data, _ = load_commuting_zones_data()
+    return cz_table.ZoneTable(data)
+
+@st.cache_resource
+def get_ranking_index():
+    """Rank orders of all zones per metric, built once per process"""
+    data, _ = load_commuting_zones_data()
+    return cz_rank.RankingIndex(data)
+
+@st.cache_resource
+def get_tile_pyramid():
+    """Manifest of the Overview raster tiles, rendered when the dataset changes"""
+    return cz_tiles.load_tile_pyramid(load_shared_dataset())
+
+@st.cache_resource
+def get_zone_index():
+    """Exact spatial index over every zone boundary, built once per process"""
+    import cz_spatial
+    data, _ = load_commuting_zones_data()
+    return cz_spatial.ZoneIndex(get_zone_geometries(), data['fbcz_id_num'].to_numpy())
+
+@st.cache_resource
+def get_zone_grid():
+    """Point-to-zone lookup grid stored with the shared dataset"""
+    import cz_spatial
+    return cz_spatial.load_zone_grid(load_shared_dataset(), index=get_zone_index())
+
+@st.cache_resource(max_entries=256)
+def get_country_bounds(country):
+    """(west, south, east, north) around a country's zones"""
+    import shapely
+    data, _ = load_commuting_zones_data()
+    positions = np.flatnonzero(data['country'].to_numpy() == country)
+    return tuple(float(v) for v in shapely.total_bounds(get_zone_geometries()[positions]))
+
+@st.cache_resource(max_entries=32)
+def get_viewport_layer(bounds, level, metric):
+    """Colored GeoJSON of the zones intersecting `bounds` and their count
+
+    Only the zones in view are simplified, so no process-wide copy of every
+    boundary is kept per level. The layer is None when more than
+    cz_viewport.MAX_VIEW_ZONES zones are in view.
+    """
+    positions = get_zone_index().query_bounds(bounds)
+    if len(positions) > cz_viewport.MAX_VIEW_ZONES:
+        return None, len(positions)
+    data, _ = load_commuting_zones_data()
+    geometries = cz_viewport.simplify_geometries(get_zone_geometries()[positions], level)
+    layer = cz_compare.country_layer(data.iloc[positions], geometries,
+                                     get_ranking_index().values[metric][positions],
+                                     get_color_scale(metric), cz_compare.METRIC_RAMPS[metric])
+    return layer, len(positions)
+
+@st.cache_resource
+def get_zip_table():
+    """The package's zip_to_cz lookup table, fetched once per process"""
+    return cz_rworker.get_worker().zip_to_cz()
+
+@st.cache_resource(max_entries=64)
+def get_geographic_map(selected_country, map_type="population"):
+    """Build and pre-render the geographic map of a country once per process"""
+    data, _ = load_commuting_zones_data()
+    map_obj = create_geographic_map(data, selected_country, map_type)
+    if map_obj is not None:
+        map_obj.render()
+    return map_obj
+
+@st.cache_resource
+def get_geojson_assets():
+    """Manifest of the static per-country GeoJSON assets, published when the dataset changes"""
+    return cz_assets.load_geojson_assets(load_shared_dataset())
+
+@st.cache_resource(max_entries=64)
+def get_asset_map(selected_country, map_type="population"):
+    """A country map whose zones the browser fetches from the cacheable GeoJSON assets"""
+    manifest = get_geojson_assets()
+    if selected_country not in manifest["countries"]:
+        return None
+    url = cz_assets.base_url(st.get_option("server.baseUrlPath") or "")
+    map_obj = cz_assets.asset_map(manifest, selected_country, map_type, url)
+    map_obj.render()
+    return map_obj
+
+def get_map(selected_country, map_type="population"):
+    """The asset-backed map once the assets are published, else the inline one"""
+    warmup = start_warmup()
+    if warmup.is_done("assets") and "assets" not in warmup.errors:
+        return get_asset_map(selected_country, map_type)
+    return get_geographic_map(selected_country, map_type)
+
+@st.cache_resource
+def get_color_scale(metric):
+    """Value range of a metric over all zones, shared by every comparison map"""
+    return cz_compare.color_scale(get_ranking_index(), metric)
+
+@st.cache_resource(max_entries=256)
+def get_country_layer(country, metric):
+    """One country's colored GeoJSON layer, built once per process"""
+    data, _ = load_commuting_zones_data()
+    positions = np.flatnonzero(data['country'].to_numpy() == country)
+    values = get_ranking_index().values[metric][positions]
+    return cz_compare.country_layer(data.iloc[positions], get_zone_geometries()[positions], values,
+                                    get_color_scale(metric), cz_compare.METRIC_RAMPS[metric])
+
+def get_request_counter():
+    """Country request counts shared by all processes on this host"""
+    return cz_warmup.RequestCounter(os.path.join(cz_shared.default_root(), "country_requests.json"))
+
+def prebuild_popular_maps():
+    """Build maps for the default and the most requested countries"""
+    data, _ = load_commuting_zones_data()
+    available = set(data['country'].unique())
+    countries = [DEFAULT_COUNTRY] + get_request_counter().most_requested(MAX_WARM_COUNTRIES)
+    for country in dict.fromkeys(countries):
+        if country in available:
+            for map_type in ("population", "area"):
+                get_map(country, map_type)
+
+@st.cache_resource
+def start_warmup():
+    """Warm every cache in a background thread, once per server process"""
+    return cz_warmup.Warmup([
+        ("dataset", load_commuting_zones_data),
+        ("geometries", get_zone_geometries),
+        ("aggregates", get_country_statistics),
+        ("table", get_zone_table),
+        ("rankings", get_ranking_index),
+        ("assets", get_geojson_assets),
+        ("maps", prebuild_popular_maps),
+        ("tiles", get_tile_pyramid),
+    ]).start()
+
+def show_country_metrics(selected_country):
+    """Show the precomputed key metrics of a country"""
+    stats = get_country_statistics()
+    if selected_country not in stats.index:
+        return
+    country_stats = stats.loc[selected_country]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total Zones", int(country_stats['total_zones']))
+    
+    with col2:
+        st.metric("Total Population", f"{country_stats['total_population']:,.0f}")
+    
+    with col3:
+        st.metric("Total Area", f"{country_stats['total_area']:,.0f} km²")
+    
+    with col4:
+        st.metric("Avg Population/Zone", f"{country_stats['avg_population']:,.0f}")
 
 @st.cache_data
 def get_available_countries(data):
@@ -169,93 +272,20 @@ def get_available_countries(data):
         return sorted(data['country'].unique())
     return []
 
-def create_geographic_map(data, selected_country, map_type="population"):
-    """Create a geographic map of commuting zones using folium"""
+@cz_memprof.profiled()
+def create_geographic_map(data, selected_country, map_type="population", values=None, geometries=None):
+    """Create a geographic map of commuting zones using folium (cz_maps.country_map)
+    
+    `values` (a Series indexed by fbcz_id, e.g. from
+    cz_aggregate.to_color_values) colors the zones instead of `map_type`.
+    `geometries` (aligned with `data`) defaults to the shared dataset's.
+    """
     if data is None or selected_country is None:
         return None
-    
-    # Filter data for selected country
-    country_data = data[data['country'] == selected_country].copy()
-    
-    if len(country_data) == 0:
-        return None
-    
     try:
-        # Convert WKT to GeoDataFrame
-        country_data['geometry'] = country_data['geography_wkt'].apply(loads)
-        gdf = gpd.GeoDataFrame(country_data, crs="EPSG:4326")
-        
-        # Calculate center of the map (handle geographic CRS properly)
-        try:
-            # Convert to a projected CRS for centroid calculation
-            gdf_projected = gdf.to_crs('EPSG:3857')
-            center_lat = gdf_projected.geometry.centroid.y.mean()
-            center_lon = gdf_projected.geometry.centroid.x.mean()
-            # Convert back to lat/lon
-            from pyproj import Transformer
-            transformer = Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
-            center_lon, center_lat = transformer.transform(center_lon, center_lat)
-        except:
-            # Fallback to simple mean if projection fails
-            center_lat = gdf.geometry.centroid.y.mean()
-            center_lon = gdf.geometry.centroid.x.mean()
-        
-        # Create base map
-        m = folium.Map(
-            location=[center_lat, center_lon],
-            zoom_start=6,
-            tiles='OpenStreetMap'
-        )
-        
-        # Choose color column based on map type
-        if map_type == "population":
-            color_column = 'win_population'
-            color_map = cm.LinearColormap(
-                colors=['lightblue', 'darkblue'],
-                vmin=gdf[color_column].min(),
-                vmax=gdf[color_column].max(),
-                caption='Population'
-            )
-        else:  # area
-            color_column = 'area'
-            color_map = cm.LinearColormap(
-                colors=['lightgreen', 'darkgreen'],
-                vmin=gdf[color_column].min(),
-                vmax=gdf[color_column].max(),
-                caption='Area (km²)'
-            )
-        
-        # Add zones to map
-        for idx, row in gdf.iterrows():
-            # Get color for this zone
-            color = color_map(row[color_column])
-            
-            # Create popup content
-            popup_content = f"""
-            <b>Zone: {row['fbcz_id']}</b><br>
-            Population: {row['win_population']:,.0f}<br>
-            Area: {row['area']:,.1f} km²<br>
-            Roads: {row['win_roads_km']:,.1f} km
-            """
-            
-            # Add polygon to map
-            folium.GeoJson(
-                row.geometry,
-                style_function=lambda x, color=color: {
-                    'fillColor': color,
-                    'color': 'black',
-                    'weight': 1,
-                    'fillOpacity': 0.7
-                },
-                popup=folium.Popup(popup_content, max_width=300),
-                tooltip=f"Zone: {row['fbcz_id']}"
-            ).add_to(m)
-        
-        # Add color map to map
-        color_map.add_to(m)
-        
-        return m
-        
+        if geometries is None:
+            geometries = get_zone_geometries()
+        return cz_maps.country_map(data, selected_country, map_type, values=values, geometries=geometries)
     except Exception as e:
         st.error(f"Error creating map: {str(e)}")
         return None
@@ -271,6 +301,8 @@ def create_commuting_zones_map(data, selected_country):
     if len(country_data) == 0:
         return None
     
+    import plotly.express as px
+    
     # Create choropleth map
     fig = px.choropleth(
         country_data,
@@ -290,75 +322,78 @@ def create_commuting_zones_map(data, selected_country):
     
     return fig
 
-def create_population_area_comparison(data, selected_country):
-    """Create comparison charts for population and area"""
-    if data is None or selected_country is None:
-        return None
-    
-    country_data = data[data['country'] == selected_country].copy()
+def create_country_comparison_chart(countries, metric):
+    """Per-country totals and the per-zone distribution of `metric`"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     
-    if len(country_data) == 0:
-        return None
+    stats = get_country_statistics().loc[countries]
+    rankings = get_ranking_index()
+    label = cz_rank.METRICS[metric][0]
+    zone_countries = rankings.data['country'].to_numpy()
     
-    # Create subplots
     fig = make_subplots(
-        rows=1, cols=2,
-        subplot_titles=('Population by Zone', 'Area by Zone'),
-        specs=[[{"type": "bar"}, {"type": "bar"}]]
+        rows=1, cols=3,
+        subplot_titles=('Total Population', 'Total Area (km²)', f'{label} by Zone'),
     )
-    
-    # Population chart
-    fig.add_trace(
-        go.Bar(
-            x=country_data['fbcz_id'],
-            y=country_data['win_population'],
-            name='Population',
-            marker_color='lightblue'
-        ),
-        row=1, col=1
-    )
-    
-    # Area chart
-    fig.add_trace(
-        go.Bar(
-            x=country_data['fbcz_id'],
-            y=country_data['area'],
-            name='Area (km²)',
-            marker_color='lightgreen'
-        ),
-        row=1, col=2
-    )
-    
-    fig.update_layout(
-        height=500,
-        title_text=f"Zone Comparison - {selected_country}",
-        title_x=0.5,
-        showlegend=False
-    )
-    
-    fig.update_xaxes(tickangle=45)
-    
+    fig.add_trace(go.Bar(x=countries, y=stats['total_population'], marker_color='lightblue',
+                         name='Population'), row=1, col=1)
+    fig.add_trace(go.Bar(x=countries, y=stats['total_area'], marker_color='lightgreen',
+                         name='Area (km²)'), row=1, col=2)
+    for country in countries:
+        values = rankings.values[metric][zone_countries == country]
+        fig.add_trace(go.Box(y=values[np.isfinite(values)], name=country, boxpoints=False), row=1, col=3)
+    
+    fig.update_layout(height=450, showlegend=False)
     return fig
 
-def create_zone_details_table(data, selected_country):
-    """Create detailed table of zones"""
-    if data is None or selected_country is None:
-        return None
-    
-    country_data = data[data['country'] == selected_country].copy()
-    
-    if len(country_data) == 0:
-        return None
-    
-    # Select relevant columns and format
-    display_data = country_data[['fbcz_id', 'win_population', 'area', 'win_roads_km']].copy()
-    display_data['win_population'] = display_data['win_population'].apply(lambda x: f"{x:,.0f}")
-    display_data['area'] = display_data['area'].apply(lambda x: f"{x:,.1f}")
-    display_data['win_roads_km'] = display_data['win_roads_km'].apply(lambda x: f"{x:,.1f}" if pd.notna(x) else "N/A")
-    
-    display_data.columns = ['Zone ID', 'Population', 'Area (km²)', 'Roads (km)']
+def create_population_area_comparison(data, selected_country):
+    """Create comparison charts for population and area"""
+    return cz_maps.population_area_comparison(data, selected_country)
+
+ZONE_TABLE_CONFIG = {
+    'fbcz_id': st.column_config.TextColumn(cz_table.TABLE_COLUMNS['fbcz_id']),
+    'country': st.column_config.TextColumn(cz_table.TABLE_COLUMNS['country']),
+    'region': st.column_config.TextColumn(cz_table.TABLE_COLUMNS['region']),
+    'win_population': st.column_config.NumberColumn(cz_table.TABLE_COLUMNS['win_population'], format="localized"),
+    'area': st.column_config.NumberColumn(cz_table.TABLE_COLUMNS['area'], format="%.1f"),
+    'win_roads_km': st.column_config.NumberColumn(cz_table.TABLE_COLUMNS['win_roads_km'], format="%.1f"),
+}
+
+def show_zone_table(selected_country, key="zones"):
+    """Show one page of the zone table, sorted and filtered on the server"""
+    table = get_zone_table()
     
-    return display_data
+    col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+    with col1:
+        scope = st.radio("Zones", [selected_country, "All countries"], horizontal=True, key=f"{key}_scope")
+    with col2:
+        search = st.text_input("Search zone ID or region", key=f"{key}_search")
+    with col3:
+        sort_by = st.selectbox("Sort by", list(cz_table.TABLE_COLUMNS), index=3,
+                               format_func=cz_table.TABLE_COLUMNS.get, key=f"{key}_sort")
+    with col4:
+        ascending = st.toggle("Ascending", value=False, key=f"{key}_ascending")
+    
+    country = None if scope == "All countries" else selected_country
+    page_size = 100
+    page_number = st.session_state.get(f"{key}_page", 1)
+    rows, total = table.page(page_number, page_size, sort_by=sort_by, ascending=ascending,
+                             country=country, search=search or None)
+    pages = max(1, -(-total // page_size))
+    if page_number > pages:
+        page_number = st.session_state[f"{key}_page"] = 1
+        rows, total = table.page(1, page_size, sort_by=sort_by, ascending=ascending,
+                                 country=country, search=search or None)
+    
+    st.dataframe(rows, column_config=ZONE_TABLE_CONFIG, hide_index=True, use_container_width=True)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input("Page", min_value=1, max_value=pages, key=f"{key}_page")
+    with col2:
+        first = (page_number - 1) * page_size
+        st.caption(f"Zones {min(first + 1, total):,}-{min(first + page_size, total):,} of {total:,} "
+                   f"(page {page_number} of {pages})")
 
 def main():
     # Header
@@ -368,12 +403,24 @@ def main():
     st.sidebar.title("Navigation")
     page = st.sidebar.selectbox(
         "Choose a page:",
-        ["Overview", "Geographic Maps", "Country Analysis", "Zone Details", "About"]
+        ["Overview", "Geographic Maps", "Country Analysis", "Compare Countries", "Zone Details", "Leaderboard",
+         "Match Locations", "About"]
     )
     
-    # Load data
-    with st.spinner("Loading commuting zones data..."):
-        data, summary = load_commuting_zones_data()
+    # Serve from the warm-up thread, waiting with progress while it is still cold
+    warmup = start_warmup()
+    if not warmup.is_done("dataset"):
+        progress = st.progress(0.0, text="Loading commuting zones data...")
+        while not warmup.wait("dataset", timeout=0.25):
+            progress.progress(warmup.fraction, text="Loading commuting zones data...")
+        progress.empty()
+    if not warmup.finished:
+        st.sidebar.progress(warmup.fraction, text=f"Warming caches: {warmup.status}")
+    
+    data, summary = load_commuting_zones_data()
+    if load_dataset()[1]:
+        st.warning("R processing not available. Using sample data for demonstration.")
+        st.session_state.sample_data = True
     
     if data is None:
         st.error("Failed to load data. Please check if the CommutingZones R package is installed.")
@@ -384,16 +431,43 @@ def main():
         st.info("🎯 **Demo Mode**: Using sample data for demonstration. For full functionality, run locally with R installed.")
     
     # Main content based on selected page
-    if page == "Overview":
-        show_overview(data, summary)
-    elif page == "Geographic Maps":
-        show_geographic_maps(data)
-    elif page == "Country Analysis":
-        show_country_analysis(data)
-    elif page == "Zone Details":
-        show_zone_details(data)
-    elif page == "About":
-        show_about()
+    with cz_memprof.track(f"page: {page}"):
+        if page == "Overview":
+            show_overview(data, summary)
+        elif page == "Geographic Maps":
+            show_geographic_maps(data)
+        elif page == "Country Analysis":
+            show_country_analysis(data)
+        elif page == "Compare Countries":
+            show_country_comparison(data)
+        elif page == "Zone Details":
+            show_zone_details(data)
+        elif page == "Leaderboard":
+            show_leaderboard(data)
+        elif page == "Match Locations":
+            show_location_matching(data)
+        elif page == "About":
+            show_about()
+
+    if cz_memprof.ENABLED:
+        show_memory_profile()
+
+def show_memory_profile():
+    """Sidebar panel of the CZ_MEMPROFILE instrumentation"""
+    with st.sidebar.expander("🧠 Memory profile", expanded=False):
+        st.metric("Resident memory", f"{cz_memprof.rss_bytes() / 2**20:,.0f} MB")
+        summary = cz_memprof.summary()
+        if summary.empty:
+            st.caption("Nothing recorded yet.")
+            return
+        st.dataframe(summary.round(2), use_container_width=True)
+        last = cz_memprof.records()[-1]
+        st.caption(f"Top allocation sites of the last block ({last['label']}):")
+        st.dataframe(pd.DataFrame(last["top_sites"], columns=["site", "bytes", "blocks"]),
+                     hide_index=True, use_container_width=True)
+        st.caption("Largest live allocations:")
+        st.dataframe(pd.DataFrame(cz_memprof.current_top_sites(), columns=["site", "bytes", "blocks"]),
+                     hide_index=True, use_container_width=True)
 
 def show_overview(data, summary):
     """Show overview page"""
@@ -417,6 +491,23 @@ def show_overview(data, summary):
         total_area = summary['total_area'].sum()
         st.metric("Total Area", f"{total_area:,.0f} km²")
     
+    # Continental map from pre-rendered raster tiles (no folium needed)
+    st.subheader("Commuting Zones Across Europe")
+    warmup = start_warmup()
+    if warmup.is_done("tiles") and "tiles" not in warmup.errors:
+        import streamlit.components.v1 as components
+        manifest = get_tile_pyramid()
+        metric = st.radio("Color zones by:", list(cz_tiles.METRICS), horizontal=True,
+                          format_func=lambda name: cz_tiles.METRICS[name][2], key="overview_metric")
+        url = cz_tiles.tile_url(manifest, metric, st.get_option("server.baseUrlPath"))
+        components.html(cz_tiles.overview_map_html(manifest, metric, url), height=520)
+    elif "tiles" in warmup.errors:
+        st.warning("The overview map could not be rendered.")
+    else:
+        st.info("The overview map is being rendered in the background and will appear on the next refresh.")
+    
+    import plotly.express as px
+    
     # Top countries by zones
     st.subheader("Top Countries by Number of Commuting Zones")
     top_countries = summary.nlargest(10, 'total_zones')
@@ -438,6 +529,8 @@ def show_overview(data, summary):
 def show_geographic_maps(data):
     """Show geographic maps page"""
     st.header("🗺️ Geographic Maps")
+    
+    from streamlit_folium import st_folium
     st.markdown("Explore commuting zones on actual geographic maps with real boundaries.")
     
     # Country selection
@@ -446,102 +539,111 @@ def show_geographic_maps(data):
     
     if selected_country:
         # Map type selection
-        map_type = st.radio("Choose map type:", ["Population", "Area"], horizontal=True)
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            map_type = st.radio("Choose map type:", ["Population", "Area"], horizontal=True)
+        with col2:
+            viewport_mode = st.toggle("Only draw zones in view", key="viewport_mode",
+                                      help="Send only the zones inside the visible map area, simplified for "
+                                           "the zoom level, and update them as you pan and zoom")
         
         # Create geographic map
         st.subheader(f"Geographic Map - {selected_country} ({map_type})")
         
-        with st.spinner("Creating geographic map..."):
-            map_obj = create_geographic_map(data, selected_country, map_type.lower())
-        
-        if map_obj:
-            # Display the map
-            st.markdown('<div class="map-container">', unsafe_allow_html=True)
-            st_folium(map_obj, width=800, height=600, returned_objects=[])
-            st.markdown('</div>', unsafe_allow_html=True)
+        get_request_counter().record(selected_country)
+        if viewport_mode:
+            show_viewport_map(selected_country, map_type.lower())
+        else:
+            with st.spinner("Creating geographic map..."):
+                map_obj = get_map(selected_country, map_type.lower())
             
-            # Map controls
-            col1, col2 = st.columns(2)
-            with col1:
-                st.info("💡 **Map Tips:**")
-                st.markdown("""
-                - Click on zones to see detailed information
-                - Hover over zones for zone IDs
-                - Use the color legend to understand the scale
-                - Zoom and pan to explore different areas
-                """)
+            if map_obj:
+                # Display the map
+                st.markdown('<div class="map-container">', unsafe_allow_html=True)
+                st_folium(map_obj, width=800, height=600, returned_objects=[], render=False)
+                st.markdown('</div>', unsafe_allow_html=True)
             
-            with col2:
-                st.info("🗺️ **Map Features:**")
-                st.markdown("""
-                - Real geographic boundaries
-                - Population/Area color coding
-                - Interactive popups with zone details
-                - OpenStreetMap base layer
-                """)
-        else:
-            st.warning("Could not create geographic map. Check if geometry data is available.")
+                # Map controls
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.info("💡 **Map Tips:**")
+                    st.markdown("""
+                    - Click on zones to see detailed information
+                    - Hover over zones for zone IDs
+                    - Use the color legend to understand the scale
+                    - Zoom and pan to explore different areas
+                    """)
+            
+                with col2:
+                    st.info("🗺️ **Map Features:**")
+                    st.markdown("""
+                    - Real geographic boundaries
+                    - Population/Area color coding
+                    - Interactive popups with zone details
+                    - OpenStreetMap base layer
+                    """)
+            else:
+                st.warning("Could not create geographic map. Check if geometry data is available.")
         
         # Zone statistics
-        country_data = data[data['country'] == selected_country]
-        if len(country_data) > 0:
+        if selected_country in get_country_statistics().index:
             st.subheader("Zone Statistics")
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total Zones", len(country_data))
-            
-            with col2:
-                total_pop = country_data['win_population'].sum()
-                st.metric("Total Population", f"{total_pop:,.0f}")
-            
-            with col3:
-                total_area = country_data['area'].sum()
-                st.metric("Total Area", f"{total_area:,.0f} km²")
-            
-            with col4:
-                avg_pop = country_data['win_population'].mean()
-                st.metric("Avg Population/Zone", f"{avg_pop:,.0f}")
+            show_country_metrics(selected_country)
+
+def show_viewport_map(selected_country, metric):
+    """A map that only receives the zones intersecting its current view"""
+    import folium
+    from streamlit_folium import st_folium
+    
+    # st_folium stores the bounds and zoom it last reported under its key, and
+    # reruns the page after every pan or zoom (there is no client-side
+    # debounce). The bounds are widened to whole tiles, so those reruns reuse
+    # the cached layer while the view stays within the same tiles
+    key = f"viewport_map_{selected_country}"
+    country_bounds = get_country_bounds(selected_country)
+    center, start_zoom = cz_viewport.fit_view(country_bounds, width=800, height=600)
+    bounds, zoom = cz_viewport.parse_view(st.session_state.get(key)) or (country_bounds, start_zoom)
+    level = cz_viewport.simplify_level(zoom)
+    layer, count = get_viewport_layer(cz_viewport.quantize_bounds(bounds, zoom), level, metric)
+    
+    # The base map stays the same across reruns; only the zone layer changes
+    label = cz_rank.METRICS[metric][0]
+    m = folium.Map(location=center, zoom_start=start_zoom, tiles='OpenStreetMap')
+    cz_compare.add_legend(m, get_color_scale(metric), label, cz_compare.METRIC_RAMPS[metric])
+    zones = folium.FeatureGroup(name="Zones in view")
+    if layer is not None:
+        cz_compare.zone_geojson(layer, label).add_to(zones)
+    st_folium(m, key=key, width=800, height=600, feature_group_to_add=zones, returned_objects=["bounds", "zoom"])
+    
+    if layer is None:
+        st.info(f"{count:,} zones in view: zoom in to draw them.")
+    else:
+        st.caption(f"{count:,} zones in view, simplified for zoom level {level}")
 
 def show_country_analysis(data):
     """Show country analysis page"""
     st.header("🏛️ Country Analysis")
     
+    from streamlit_folium import st_folium
+    
     # Country selection
     countries = get_available_countries(data)
     selected_country = st.selectbox("Select a country:", countries, index=countries.index("United Kingdom") if "United Kingdom" in countries else 0)
     
     if selected_country:
-        # Filter data for selected country
-        country_data = data[data['country'] == selected_country]
-        
         # Key metrics for selected country
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("Total Zones", len(country_data))
-        
-        with col2:
-            total_pop = country_data['win_population'].sum()
-            st.metric("Total Population", f"{total_pop:,.0f}")
-        
-        with col3:
-            total_area = country_data['area'].sum()
-            st.metric("Total Area", f"{total_area:,.0f} km²")
-        
-        with col4:
-            avg_pop = country_data['win_population'].mean()
-            st.metric("Avg Population/Zone", f"{avg_pop:,.0f}")
+        show_country_metrics(selected_country)
         
         # Geographic map
         st.subheader("Geographic Map")
         map_type = st.radio("Map type:", ["Population", "Area"], horizontal=True, key="analysis_map")
         
+        get_request_counter().record(selected_country)
         with st.spinner("Creating map..."):
-            map_obj = create_geographic_map(data, selected_country, map_type.lower())
+            map_obj = get_map(selected_country, map_type.lower())
         
         if map_obj:
-            st_folium(map_obj, width=800, height=500, returned_objects=[])
+            st_folium(map_obj, width=800, height=500, returned_objects=[], render=False)
         else:
             st.warning("No map data available for this country.")
         
@@ -553,15 +655,66 @@ def show_country_analysis(data):
         
         # Top zones
         st.subheader("Top 10 Zones by Population")
-        top_zones = country_data.nlargest(10, 'win_population')[['fbcz_id', 'win_population', 'area']]
-        top_zones['win_population'] = top_zones['win_population'].apply(lambda x: f"{x:,.0f}")
-        top_zones['area'] = top_zones['area'].apply(lambda x: f"{x:,.1f}")
-        st.dataframe(top_zones, use_container_width=True)
+        top_zones = get_ranking_index().top('population', 10, country=selected_country)
+        st.dataframe(
+            top_zones[['country_rank', 'fbcz_id', 'population']],
+            column_config={
+                'country_rank': st.column_config.NumberColumn("Rank"),
+                'fbcz_id': st.column_config.TextColumn("Zone ID"),
+                'population': st.column_config.NumberColumn("Population", format="localized"),
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+
+def show_country_comparison(data):
+    """Show several countries side by side on one map and in shared charts"""
+    st.header("⚖️ Compare Countries")
+    
+    from streamlit_folium import st_folium
+    
+    countries = get_available_countries(data)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected = st.multiselect("Countries to compare:", countries,
+                                  default=[DEFAULT_COUNTRY] if DEFAULT_COUNTRY in countries else countries[:2])
+    with col2:
+        metric = st.selectbox("Color zones by:", list(cz_compare.METRIC_RAMPS),
+                              format_func=lambda name: cz_rank.METRICS[name][0])
+    
+    if not selected:
+        st.info("Select one or more countries to compare.")
+        return
+    
+    # Layers are cached per country and share one Europe-wide color scale, so
+    # adding a country only builds that country's layer
+    label = cz_rank.METRICS[metric][0]
+    with st.spinner("Creating comparison map..."):
+        layers = {country: get_country_layer(country, metric) for country in selected}
+        map_obj = cz_compare.comparison_map(layers, get_color_scale(metric), label, cz_compare.METRIC_RAMPS[metric])
+    st_folium(map_obj, width=900, height=600, returned_objects=[])
+    st.caption("Colors use the same scale for every country, from the lowest zone in Europe to the 99th percentile.")
+    
+    st.subheader("Country Totals")
+    stats = get_country_statistics().loc[selected]
+    st.dataframe(
+        stats,
+        column_config={
+            'total_zones': st.column_config.NumberColumn("Zones", format="localized"),
+            'total_population': st.column_config.NumberColumn("Population", format="localized"),
+            'total_area': st.column_config.NumberColumn("Area (km²)", format="localized"),
+            'avg_population': st.column_config.NumberColumn("Avg Population/Zone", format="localized"),
+        },
+        use_container_width=True,
+    )
+    st.plotly_chart(create_country_comparison_chart(selected, metric), use_container_width=True)
 
 def show_zone_details(data):
     """Show detailed zone information"""
     st.header("📍 Zone Details")
     
+    from streamlit_folium import st_folium
+    
     # Country selection
     countries = get_available_countries(data)
     selected_country = st.selectbox("Select a country:", countries, key="zone_country", index=countries.index("United Kingdom") if "United Kingdom" in countries else 0)
@@ -577,6 +730,15 @@ def show_zone_details(data):
             
             # Zone details
             st.subheader(f"Zone: {selected_zone}")
+            rankings = get_ranking_index()
+            europe_rank, country_rank = rankings.zone_rank(selected_zone, 'population')
+            if europe_rank:
+                st.caption(f"Ranks #{country_rank:,} of {rankings.ranked_count('population', selected_country):,} "
+                           f"in {selected_country} and #{europe_rank:,} of "
+                           f"{rankings.ranked_count('population'):,} in Europe by population")
+            repair = str(zone_data.get('geometry_repair', 'ok'))
+            if repair != 'ok':
+                st.caption(f"⚠️ Boundary repaired when the dataset was built: {repair}")
             
             col1, col2 = st.columns(2)
             
@@ -612,15 +774,153 @@ def show_zone_details(data):
             
             # Zone map
             st.subheader("Zone Location")
-            zone_map = create_geographic_map(data, selected_country, "population")
+            zone_map = get_map(selected_country, "population")
             if zone_map:
-                st_folium(zone_map, width=600, height=400, returned_objects=[])
+                st_folium(zone_map, width=600, height=400, returned_objects=[], render=False)
             
             # All zones table
-            st.subheader("All Zones in Selected Country")
-            zones_table = create_zone_details_table(data, selected_country)
-            if zones_table is not None:
-                st.dataframe(zones_table, use_container_width=True)
+            st.subheader("All Zones")
+            show_zone_table(selected_country)
+
+def show_leaderboard(data):
+    """Show the cross-country zone leaderboard"""
+    st.header("🏆 Zone Leaderboard")
+    
+    rankings = get_ranking_index()
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        metric = st.selectbox("Rank zones by:", list(cz_rank.METRICS),
+                              format_func=lambda name: cz_rank.METRICS[name][0])
+    with col2:
+        scope = st.selectbox("Within:", ["All countries"] + list(rankings.countries))
+    with col3:
+        top_n = st.number_input("Show top", min_value=5, max_value=500, value=25, step=5)
+    
+    country = None if scope == "All countries" else scope
+    ranked = rankings.top(metric, int(top_n), country=country)
+    label = cz_rank.METRICS[metric][0]
+    st.caption(f"{rankings.ranked_count(metric, country):,} zones ranked by {label.lower()}")
+    st.dataframe(
+        ranked,
+        column_config={
+            'rank': st.column_config.NumberColumn("Europe rank"),
+            'fbcz_id': st.column_config.TextColumn("Zone ID"),
+            'country': st.column_config.TextColumn("Country"),
+            'country_rank': st.column_config.NumberColumn("Country rank"),
+            metric: st.column_config.NumberColumn(label, format="localized"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+
+def _guess_column(columns, candidates):
+    """Index of the first column whose lower-cased name is a candidate"""
+    lowered = [column.lower() for column in columns]
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered.index(candidate)
+    return 0
+
+def show_location_matching(data):
+    """Show the upload page matching a CSV of locations to zones"""
+    st.header("📤 Match Locations to Zones")
+    st.markdown("Upload a CSV with latitude/longitude or zipcode columns to add the commuting zone "
+                "(`fbcz_id`) of every row. The file is processed in chunks and the result is "
+                "written to a compressed CSV as it is produced.")
+    
+    import cz_match
+    
+    upload = st.file_uploader("CSV file", type=["csv"])
+    matched = st.session_state.get('matched_file')
+    if matched and (upload is None or matched[0] != upload.file_id):
+        # The result of a file that is no longer uploaded
+        matched[1].remove()
+        del st.session_state['matched_file']
+    if upload is None:
+        return
+    columns = list(pd.read_csv(upload, nrows=0).columns)
+    upload.seek(0)
+    
+    mode = st.radio("Match by:", ["Coordinates", "Zipcode"], horizontal=True)
+    col1, col2, col3 = st.columns(3)
+    if mode == "Coordinates":
+        with col1:
+            lat_col = st.selectbox("Latitude column", columns,
+                                   index=_guess_column(columns, ["latitude", "lat"]))
+        with col2:
+            lon_col = st.selectbox("Longitude column", columns,
+                                   index=_guess_column(columns, ["longitude", "lon", "lng", "long"]))
+        with col3:
+            snap_km = st.number_input("Snap to nearest zone within (km)", min_value=0.0, value=0.0, step=0.5)
+    else:
+        with col1:
+            zip_col = st.selectbox("Zipcode column", columns,
+                                   index=_guess_column(columns, ["zipcode", "zip", "postcode", "postal_code"]))
+        with col2:
+            country_col = st.selectbox("ISO3 country column (optional)", [None] + columns,
+                                       index=_guess_column([""] + columns, ["country_iso3", "iso3"]))
+    chunksize = st.select_slider("Rows per chunk", options=[10_000, 50_000, 100_000, 250_000], value=100_000)
+    
+    if st.button("Match zones", type="primary"):
+        try:
+            if mode == "Coordinates":
+                labels = data.set_index('fbcz_id_num')['fbcz_id'].astype(str)
+                matcher = cz_match.PointMatcher(get_zone_grid(), labels, lon_col=lon_col, lat_col=lat_col,
+                                                snap_tolerance=snap_km * 1000 or None)
+            else:
+                matcher = cz_match.ZipMatcher(get_zip_table(), zip_col=zip_col, country_col=country_col)
+        except Exception as e:
+            st.error(f"Could not prepare the zone lookup: {e}")
+            return
+        
+        progress = st.progress(0.0, text="Matching...")
+        stats = st.empty()
+        links = st.empty()
+        preview = st.empty()
+        
+        def report(state):
+            progress.progress(state.fraction, text=f"Matched {state.rows:,} rows")
+            stats.caption(f"{state.chunks} chunks · {state.matched:,} of {state.rows:,} rows in a zone · "
+                          f"{state.rows_per_second:,.0f} rows/s")
+            with links.container():
+                _show_match_downloads(state, done=False)
+        
+        previous = st.session_state.pop('matched_file', None)
+        if previous:
+            previous[1].remove()
+        cz_match.remove_stale_outputs()
+        output = cz_match.MatchOutput(cz_match.output_name(upload.name))
+        try:
+            state = cz_match.match_csv(upload, matcher, output.path, chunksize=chunksize, progress=report,
+                                       preview=lambda chunk: preview.dataframe(chunk.head(100), hide_index=True),
+                                       part_bytes=cz_match.PART_BYTES)
+        except (KeyError, ValueError) as e:
+            output.remove()
+            progress.empty()
+            links.empty()
+            st.error(f"Could not match the file: {e}")
+            return
+        progress.progress(1.0, text="Done")
+        links.empty()
+        st.session_state['matched_file'] = (upload.file_id, output, state)
+    
+    matched = st.session_state.get('matched_file')
+    if matched and matched[1].exists:
+        _, output, state = matched
+        st.success(f"{state.matched:,} of {state.rows:,} rows matched to a zone in {state.elapsed:,.1f} s")
+        _show_match_downloads(state)
+
+def _show_match_downloads(state, done=True):
+    """Links to the matched file, served from disk rather than sent through the session"""
+    import cz_match
+    base_url_path = st.get_option("server.baseUrlPath") or ""
+    for number, path in enumerate(state.parts, 1):
+        label = "Download matched CSV" if len(state.parts) == 1 else f"Download part {number} of {len(state.parts)}"
+        if not done and number == len(state.parts):
+            label += " (rows matched so far)"
+        st.link_button(label, cz_match.download_url(path, base_url_path))
+    if done and len(state.parts) > 1:
+        st.caption("The result is split into parts small enough for Streamlit to serve; each has the header row.")
 
 def show_about():
     """Show about page"""
@@ -662,7 +962,10 @@ def show_about():
     1. **Overview**: See summary statistics across all European countries
     2. **Geographic Maps**: Explore zones on real geographic maps
     3. **Country Analysis**: Interactive analysis with maps and charts
-    4. **Zone Details**: Get detailed information about individual zones
+    4. **Compare Countries**: Several countries on one map and in shared charts, on one color scale
+    5. **Zone Details**: Get detailed information about individual zones
+    6. **Leaderboard**: Rank zones across countries by population, area, roads or density
+    7. **Match Locations**: Upload a CSV of coordinates or zipcodes and download it with zone IDs
     
     ### Citation
     
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the Streamlit app.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, prints
+the slowest imports and fails if a heavy plotting/GIS library is imported
+eagerly or the total import time exceeds the budget. With --render it also
+times a fresh interpreter rendering the Overview page.
+
+Usage: python bench_import_time.py [--budget-ms 2500] [--top 15] [--render]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules only the map and chart pages need
+LAZY_MODULES = [
+    'geopandas',
+    'shapely',
+    'folium',
+    'streamlit_folium',
+    'branca',
+    'plotly.express',
+    'plotly.subplots',
+]
+
+RENDER_OVERVIEW = """
+import time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=300).run()
+assert not at.exception, at.exception
+print(time.perf_counter() - started)
+"""
+
+
+def profile_imports(module="app"):
+    """Return {module: (self_us, cumulative_us)} for a fresh `import module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def time_overview_render():
+    """Seconds for a fresh interpreter to render the Overview page"""
+    result = subprocess.run([sys.executable, "-c", RENDER_OVERVIEW],
+                            cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Overview render failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=2500)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--render", action="store_true")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    timings = profile_imports()
+    wall = time.perf_counter() - started
+    total_ms = timings["app"][1] / 1000
+
+    print(f"import app: {total_ms:,.0f} ms cumulative ({wall:,.2f} s wall incl. interpreter start)")
+    print(f"\nTop {args.top} imports by cumulative time:")
+    slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[:args.top]:
+        print(f"  {cumulative_us / 1000:9,.1f} ms  {self_us / 1000:8,.1f} ms self  {name}")
+
+    failures = []
+    eager = [name for name in LAZY_MODULES if name in timings]
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:,.0f} ms exceeds budget {args.budget_ms:,.0f} ms")
+
+    if args.render:
+        print(f"\nOverview render in a fresh interpreter: {time_overview_render():,.2f} s")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        sys.exit(1)
+    print("\n✅ No heavy imports at module load")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Streaming aggregation of point data per commuting zone.
+
+ZoneAggregator takes chunks of a point table (longitude/latitude plus value
+columns), assigns each point a zone through a cz_spatial index and folds the
+chunk into running counts, sums and quantile sketches grouped by
+`fbcz_id_num` and any extra columns (e.g. a date). Memory is bounded by the
+number of groups, not the number of points, so files far larger than RAM can
+be streamed with aggregate_points.
+
+The quantile sketch is a log-bucket histogram in the style of DDSketch:
+positive values are counted in buckets whose bounds grow by a factor of
+gamma = (1 + alpha) / (1 - alpha), so every reported quantile is within a
+relative error of alpha. Sketches from different chunks merge by adding
+bucket counts. Values <= 0 share a single zero bucket.
+"""
+
+import numpy as np
+import pandas as pd
+
+import cz_spatial
+
+ZONE_COLUMN = 'fbcz_id_num'
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+
+class ZoneAggregator:
+    """Running per-zone counts, sums and quantile sketches"""
+
+    def __init__(self, index, lon_col='longitude', lat_col='latitude', value_cols=(),
+                 group_cols=(), quantiles=(0.5, 0.9), relative_accuracy=0.01,
+                 snap_tolerance=None):
+        self.index = index
+        self.lon_col = lon_col
+        self.lat_col = lat_col
+        self.value_cols = list(value_cols)
+        self.group_cols = list(group_cols)
+        self.keys = [ZONE_COLUMN] + self.group_cols
+        self.quantiles = list(quantiles)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.snap_tolerance = snap_tolerance
+        self.rows = 0
+        self.unmatched = 0
+        self._totals = None
+        self._buckets = {column: None for column in self.value_cols}
+
+    def _bucket(self, values):
+        values = np.asarray(values, dtype=float)
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+        positive = values > 0
+        buckets[positive] = np.ceil(np.log(values[positive]) / np.log(self.gamma))
+        return buckets
+
+    def _bucket_value(self, buckets):
+        values = 2 * self.gamma ** buckets.astype(float) / (self.gamma + 1)
+        return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+    @staticmethod
+    def _merge(running, update):
+        if running is None:
+            return update
+        return running.add(update, fill_value=0)
+
+    def add(self, chunk):
+        """Assign zones to a chunk of points and fold it into the running totals"""
+        self.rows += len(chunk)
+        zones = self.index.assign(chunk[self.lon_col].to_numpy(), chunk[self.lat_col].to_numpy(),
+                                  snap_tolerance=self.snap_tolerance)
+        matched = zones != cz_spatial.EMPTY
+        self.unmatched += int((~matched).sum())
+
+        frame = chunk.loc[matched, self.group_cols + self.value_cols].copy()
+        frame[ZONE_COLUMN] = zones[matched]
+        if frame.empty:
+            return
+
+        grouped = frame.groupby(self.keys, observed=True, sort=False)
+        totals = grouped.size().to_frame('count')
+        if self.value_cols:
+            totals = totals.join(grouped[self.value_cols].sum().add_suffix('_sum'))
+        self._totals = self._merge(self._totals, totals)
+
+        for column in self.value_cols:
+            frame['_bucket'] = self._bucket(frame[column].to_numpy())
+            counts = frame.groupby(self.keys + ['_bucket'], observed=True, sort=False).size()
+            self._buckets[column] = self._merge(self._buckets[column], counts)
+
+    def _quantiles(self, counts):
+        """Quantile estimates per group from a Series of bucket counts"""
+        counts = counts.sort_index()
+        keys = counts.index.droplevel('_bucket')
+        buckets = counts.index.get_level_values('_bucket').to_numpy()
+        cumulative = counts.groupby(level=self.keys, observed=True).cumsum()
+        totals = counts.groupby(level=self.keys, observed=True).transform('sum')
+        rank = (cumulative / totals).to_numpy()
+
+        result = {}
+        for q in self.quantiles:
+            # First bucket whose cumulative share reaches q
+            reached = pd.Series(np.where(rank >= q - 1e-12, buckets, np.iinfo(np.int32).max), index=keys)
+            first = reached.groupby(level=self.keys, observed=True).min()
+            result[f'p{round(q * 100):g}'] = pd.Series(self._bucket_value(first.to_numpy()), index=first.index)
+        return pd.DataFrame(result)
+
+    def result(self):
+        """Aggregates indexed by fbcz_id_num (and the group columns)"""
+        if self._totals is None:
+            columns = ['count'] + [f'{column}_sum' for column in self.value_cols]
+            return pd.DataFrame(columns=columns)
+
+        result = self._totals.copy()
+        result['count'] = result['count'].astype('int64')
+        for column in self.value_cols:
+            quantiles = self._quantiles(self._buckets[column])
+            result = result.join(quantiles.add_prefix(f'{column}_'))
+        return result.sort_index()
+
+
+def aggregate_points(source, index, chunksize=500_000, progress=None, **options):
+    """Stream a point file (or an iterable of DataFrame chunks) into per-zone aggregates
+
+    `source` is a CSV path/buffer read in `chunksize` rows or an iterable of
+    DataFrames; `options` are passed to ZoneAggregator. `progress`, if given,
+    is called with the aggregator after every chunk.
+    """
+    aggregator = ZoneAggregator(index, **options)
+    chunks = pd.read_csv(source, chunksize=chunksize) if isinstance(source, str) or hasattr(source, 'read') else source
+    for chunk in chunks:
+        aggregator.add(chunk)
+        if progress is not None:
+            progress(aggregator)
+    return aggregator.result()
+
+
+def join_zone_attributes(result, zones):
+    """Join aggregates to cz_data attributes and add per-capita rates
+
+    Every `count` and `*_sum` column gets a `*_per_capita` companion divided
+    by the zone's `win_population`.
+    """
+    attributes = zones[['fbcz_id_num', 'fbcz_id', 'country', 'win_population', 'area']]
+    joined = result.reset_index().merge(attributes, on='fbcz_id_num', how='left')
+    population = joined['win_population'].astype(float).where(lambda p: p > 0)
+    for column in ['count'] + [c for c in result.columns if c.endswith('_sum')]:
+        joined[f'{column}_per_capita'] = joined[column] / population
+    return joined
+
+
+def to_color_values(joined, column):
+    """A Series indexed by fbcz_id, ready for create_geographic_map's `values`"""
+    values = joined.groupby('fbcz_id', observed=True)[column].sum()
+    values.name = column
+    return values
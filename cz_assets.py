@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Static, content-hashed GeoJSON assets of every country's zones.
+
+Embedding a country's boundaries in the map HTML sends the same geometry
+over the Streamlit websocket to every session, where no browser or proxy can
+cache it. Instead, every country is published once per dataset as GeoJSON
+files, one per simplification level, named after a hash of their content
+and stored next to a gzip-compressed copy:
+
+    static/geojson/<version>/manifest.json
+    static/geojson/<version>/<country>.<level>.<hash>.geojson[.gz]
+
+Features carry the zone id, population, area, roads and a precomputed fill
+color per metric, so one file serves every map type. Colors, legend, popups
+and tooltips are those of the inline map (cz_maps.country_map):
+each country on its own scale, from its smallest to its largest value.
+asset_map returns a folium map whose layer fetches the file for the current
+zoom level by URL, switching level as the user zooms.
+
+A file's name changes whenever its content does, so it can be cached
+forever. `python cz_assets.py serve` runs a small asset server that sends
+the files with a strong ETag, `Cache-Control: public, max-age=31536000,
+immutable`, 304 responses to If-None-Match, and the pre-compressed copy to
+clients that accept gzip; point CZ_ASSET_URL at it (or at a reverse proxy
+in front of it). Without CZ_ASSET_URL the app links to the same files
+through Streamlit's static serving, which does not set these headers.
+
+Usage: python cz_assets.py build [--sample]
+       python cz_assets.py serve [--port 8502] [--host 0.0.0.0]
+"""
+
+import argparse
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+
+import cz_viewport
+import export_reports
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(HERE, "static", "geojson")
+STATIC_URL = "app/static/geojson"
+MANIFEST_FILE = "manifest.json"
+# Bump when the file layout or colors change so assets are republished
+ASSETS_VERSION = 2
+KEEP_VERSIONS = 3
+CACHE_FOREVER = "public, max-age=31536000, immutable"
+
+# (simplification level or None for full detail, first zoom it is used at),
+# coarsest first; levels are cz_viewport zoom levels
+LEVELS = ((5, 0), (8, 7), (None, 10))
+# Map type -> (zone table column, branca colormap colors, legend caption),
+# shared with the inline country map
+MAP_STYLES = {
+    'population': ('win_population', ('lightblue', 'darkblue'), 'Population'),
+    'area': ('area', ('lightgreen', 'darkgreen'), 'Area (km²)'),
+}
+METRICS = tuple(MAP_STYLES)
+ASSET_NAME = re.compile(r"\.(?P<hash>[0-9a-f]{16})\.geojson$")
+
+
+def asset_version(dataset):
+    """Short hash of the data the assets are built from"""
+    import cz_shared
+
+    columns = ['fbcz_id', 'country', 'win_population', 'area', 'win_roads_km', cz_shared.GEOMETRY_COLUMN]
+    return cz_shared.column_digest(dataset, columns, salt=f"assets-{ASSETS_VERSION}-{LEVELS}-{MAP_STYLES}")
+
+
+def feature_collection(zones, geometries, colors):
+    """GeoJSON bytes of zones, with one `color_<metric>` property per metric in `colors`"""
+    import shapely
+
+    present = ~shapely.is_missing(geometries)
+    shapes = shapely.to_geojson(geometries[present])
+    rows = zones.loc[present, ['fbcz_id', 'win_population', 'area', 'win_roads_km']]
+    metric_colors = {metric: np.asarray(values)[present] for metric, values in colors.items()}
+    features = []
+    for i, ((zone, population, area, roads), shape) in enumerate(zip(rows.itertuples(index=False), shapes)):
+        properties = {
+            'fbcz_id': zone,
+            'population': None if population != population else round(float(population)),
+            'area': None if area != area else round(float(area), 1),
+            'roads': None if roads != roads else round(float(roads), 1),
+        }
+        properties.update({f'color_{metric}': values[i] for metric, values in metric_colors.items()})
+        features.append(f'{{"type":"Feature","id":{json.dumps(zone)},"geometry":{shape},'
+                        f'"properties":{json.dumps(properties)}}}')
+    return ('{"type":"FeatureCollection","features":[' + ','.join(features) + ']}').encode()
+
+
+def write_asset(directory, stem, content):
+    """Write `content` as <stem>.<hash>.geojson plus a .gz copy; returns the file name"""
+    name = f"{stem}.{hashlib.sha256(content).hexdigest()[:16]}.geojson"
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(content)
+    # mtime=0 keeps the compressed bytes a function of the content alone
+    with open(os.path.join(directory, name + ".gz"), "wb") as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    return name
+
+
+def colormap(metric, vmin, vmax):
+    """The branca colormap of a map type over (vmin, vmax)"""
+    import branca.colormap as cm
+
+    _, colors, caption = MAP_STYLES[metric]
+    return cm.LinearColormap(colors=list(colors), vmin=vmin, vmax=vmax, caption=caption)
+
+
+def country_colors(metric, values):
+    """(fill colors, [vmin, vmax]) of one country's values on its own scale
+
+    Zones without a value get the color of the bottom of the scale.
+    """
+    values = np.asarray(values, dtype=float)
+    known = values[~np.isnan(values)]
+    scale = [float(known.min()), float(known.max())] if len(known) else [0.0, 0.0]
+    color_map = colormap(metric, *scale)
+    colors = np.array([color_map(scale[0] if value != value else value) for value in values.tolist()],
+                      dtype=object)
+    return colors, scale
+
+
+def build_assets(data, geometries, directory):
+    """Write every country's assets to `directory` and return the manifest
+
+    `geometries` is aligned with `data`. Each country's entry holds its files
+    per level, its bounds and the (vmin, vmax) of its colors per metric.
+    """
+    import shapely
+
+    simplified = {level: geometries if level is None else cz_viewport.simplify_geometries(geometries, level)
+                  for level, _ in LEVELS}
+
+    countries = {}
+    zone_countries = data['country'].astype(str).to_numpy()
+    for country in sorted(set(zone_countries)):
+        positions = np.flatnonzero(zone_countries == country)
+        present = ~shapely.is_missing(geometries[positions])
+        slug = export_reports.country_slug(country)
+        zones = data.iloc[positions]
+        # Scaled over the zones that are drawn, as on the inline map
+        colors, scales = {}, {}
+        for metric, (column, _, _) in MAP_STYLES.items():
+            colors[metric] = np.empty(len(positions), dtype=object)
+            colors[metric][present], scales[metric] = country_colors(
+                metric, zones[column].to_numpy(dtype=float)[present])
+        levels = []
+        for level, min_zoom in LEVELS:
+            content = feature_collection(zones, simplified[level][positions], colors)
+            name = write_asset(directory, f"{slug}.{level or 'full'}", content)
+            levels.append({"level": level, "min_zoom": min_zoom, "file": name, "bytes": len(content),
+                           "gzip_bytes": os.path.getsize(os.path.join(directory, name + ".gz"))})
+        drawn = geometries[positions][present]
+        bounds = [float(v) for v in shapely.total_bounds(drawn)] if len(drawn) else None
+        countries[country] = {"levels": levels, "bounds": bounds, "scales": scales}
+    return {"countries": countries}
+
+
+def load_geojson_assets(dataset, root=ASSETS_DIR):
+    """Manifest of the dataset's assets, publishing them first if needed"""
+    version = asset_version(dataset)
+    manifest_path = os.path.join(root, version, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, ".assets.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(manifest_path):
+                    _publish_assets(dataset, root, version)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _publish_assets(dataset, root, version):
+    started = time.perf_counter()
+    geometries = dataset.geometries(np.arange(len(dataset.data)))
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=root)
+    try:
+        manifest = build_assets(dataset.data, geometries, staging)
+        manifest.update(version=version, seconds=round(time.perf_counter() - started, 2))
+        with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(staging, 0o755)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    # Keep a few recent versions for pages still showing an older dataset
+    versions = [os.path.join(root, name) for name in os.listdir(root) if not name.startswith(".")]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def base_url(base_url_path=""):
+    """Where browsers fetch the assets: CZ_ASSET_URL, else Streamlit's static route"""
+    configured = os.environ.get("CZ_ASSET_URL", "").rstrip("/")
+    if configured:
+        return configured
+    prefix = f"/{base_url_path.strip('/')}" if base_url_path.strip("/") else ""
+    return f"{prefix}/{STATIC_URL}"
+
+
+def asset_urls(manifest, country, url):
+    """[{min_zoom, url}] of a country's levels, coarsest first"""
+    return [{"min_zoom": level["min_zoom"], "url": f"{url}/{manifest['version']}/{level['file']}"}
+            for level in manifest["countries"][country]["levels"]]
+
+
+_LAYER_SCRIPT = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var levels = {{ this.levels|tojson }};
+    var colorKey = {{ this.color_key|tojson }};
+    // Formatted like Python's f"{value:,.Nf}" on the inline map
+    var number = function(value, digits) {
+        return value === null ? 'nan' : Number(value).toLocaleString('en-US',
+            {minimumFractionDigits: digits, maximumFractionDigits: digits});
+    };
+    var layer = L.geoJSON(null, {
+        style: function(feature) {
+            return {fillColor: feature.properties[colorKey], color: 'black', weight: 1, fillOpacity: 0.7};
+        },
+        onEachFeature: function(feature, zone) {
+            var p = feature.properties;
+            zone.bindPopup('<b>Zone: ' + p.fbcz_id + '</b><br>Population: ' + number(p.population, 0)
+                + '<br>Area: ' + number(p.area, 1) + ' km²<br>Roads: ' + number(p.roads, 1) + ' km',
+                {maxWidth: 300});
+            zone.bindTooltip('Zone: ' + p.fbcz_id, {sticky: true});
+        }
+    }).addTo(map);
+    var current = null;
+    function update() {
+        var zoom = map.getZoom() || 0, url = levels[0].url;
+        levels.forEach(function(level) { if (zoom >= level.min_zoom) { url = level.url; } });
+        if (url === current) { return; }
+        current = url;
+        fetch(url).then(function(response) { return response.json(); }).then(function(data) {
+            if (url !== current) { return; }
+            layer.clearLayers();
+            layer.addData(data);
+        });
+    }
+    map.on('zoomend', update);
+    update();
+})();
+{% endmacro %}
+"""
+
+
+def asset_map(manifest, country, metric, url):
+    """A folium map whose zone layer is fetched from the country's assets by URL
+
+    It looks like the inline map: the country's own color scale and legend,
+    a popup with the zone's figures and its id as the tooltip.
+    """
+    import folium
+    from branca.element import MacroElement
+    from jinja2 import Template
+
+    entry = manifest["countries"][country]
+    m = folium.Map(tiles='OpenStreetMap')
+    if entry["bounds"]:
+        west, south, east, north = entry["bounds"]
+        m.fit_bounds([[south, west], [north, east]])
+
+    layer = MacroElement()
+    layer._name = "GeoJsonAsset"
+    layer._template = Template(_LAYER_SCRIPT)
+    layer.levels = asset_urls(manifest, country, url)
+    layer.color_key = f"color_{metric}"
+    layer.add_to(m)
+    colormap(metric, *entry["scales"][metric]).add_to(m)
+    return m
+
+
+class AssetHandler(BaseHTTPRequestHandler):
+    """Serve published assets with ETags, long-lived caching and pre-compressed bodies"""
+
+    root = ASSETS_DIR
+    prefix = ""
+    quiet = False
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_OPTIONS(self):
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+        self.end_headers()
+
+    def _resolve(self):
+        path = unquote(urlsplit(self.path).path)
+        if self.prefix:
+            if not path.startswith(self.prefix + "/"):
+                return None
+            path = path[len(self.prefix):]
+        root = os.path.realpath(self.root)
+        full = os.path.realpath(os.path.join(root, path.lstrip("/")))
+        if not full.startswith(root + os.sep) or not os.path.isfile(full):
+            return None
+        return full
+
+    def _serve(self, body):
+        path = self._resolve()
+        if path is None or path.endswith(".gz"):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        match = ASSET_NAME.search(path)
+        gzipped = os.path.exists(path + ".gz") and "gzip" in self.headers.get("Accept-Encoding", "")
+        if match:
+            # The name is the content hash: a strong validator for each encoding
+            etag = f'"{match["hash"]}{"-gzip" if gzipped else ""}"'
+            cache_control = CACHE_FOREVER
+        else:
+            stat = os.stat(path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-gzip" if gzipped else ""}"'
+            cache_control = "no-cache"
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._common_headers(etag, cache_control)
+            self.end_headers()
+            return
+
+        with open(path + ".gz" if gzipped else path, "rb") as f:
+            content = f.read()
+        self.send_response(HTTPStatus.OK)
+        self._common_headers(etag, cache_control)
+        self.send_header("Content-Type", "application/geo+json" if match else "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def _common_headers(self, etag, cache_control):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Vary", "Accept-Encoding")
+        # Maps run in Streamlit's component iframes, on another origin
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8502, root=ASSETS_DIR, prefix="", quiet=False):
+    """A threaded HTTP server for the assets under `root` (not yet serving)"""
+    handler = type("Handler", (AssetHandler,), {"root": root, "prefix": prefix.rstrip("/"), "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="publish the assets of the current dataset")
+    build.add_argument("--sample", action="store_true", help="use the built-in sample data (no R needed)")
+    serve = commands.add_parser("serve", help="serve the published assets")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8502)
+    serve.add_argument("--prefix", default="", help="URL path the assets are served under, e.g. /assets")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = make_server(args.host, args.port, prefix=args.prefix)
+        print(f"Serving {ASSETS_DIR} on http://{args.host}:{args.port}{args.prefix}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    dataset = export_reports.load_dataset(sample=args.sample)
+    manifest = load_geojson_assets(dataset)
+    files = [level for country in manifest["countries"].values() for level in country["levels"]]
+    print(f"version {manifest['version']}: {len(manifest['countries'])} countries, {len(files)} files, "
+          f"{sum(f['bytes'] for f in files) / 2**20:,.1f} MB "
+          f"({sum(f['gzip_bytes'] for f in files) / 2**20:,.1f} MB gzipped) in {manifest.get('seconds', 0)}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
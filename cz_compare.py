@@ -0,0 +1,130 @@
+"""
+Multi-country comparison maps built from per-country layers.
+
+A layer is one country's zones as a GeoJSON FeatureCollection whose features
+already carry their fill color, so the app can cache it per (country, metric)
+and compose any selection of countries into one map without recomputing the
+countries it has seen before. Colors come from a scale fixed by the whole
+dataset (color_scale reads it off the precomputed cz_rank order), not by the
+countries on screen, so a zone keeps its color whichever countries it is
+compared with and adding a country only costs that country's layer.
+"""
+
+import json
+
+import numpy as np
+
+import cz_raster
+
+# Metric (a cz_rank.METRICS name) -> cz_raster color ramp
+METRIC_RAMPS = {
+    'population': 'population',
+    'area': 'area',
+    'density': 'custom',
+}
+
+
+def color_scale(rankings, metric, upper=0.99):
+    """(vmin, vmax) of a metric over all zones
+
+    The top of the scale is the `upper` quantile, as for the Overview tiles,
+    so a few outliers do not wash out the ramp.
+    """
+    if rankings.ranked_count(metric) == 0:
+        return 0.0, 1.0
+    return rankings.quantile(metric, 0.0), rankings.quantile(metric, upper)
+
+
+def hex_colors(rgba):
+    """'#rrggbb' strings of an (n, 4) uint8 color array"""
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b, _ in rgba.tolist()]
+
+
+def country_layer(zones, geometries, values, scale, ramp='population'):
+    """GeoJSON FeatureCollection of one country's zones, colored on `scale`
+
+    `zones` is the country's rows of the zone table and `geometries` and
+    `values` are aligned with it. Features carry the zone id (also as the
+    feature id, so folium does not add one to the cached layer), country,
+    population, area, metric value and fill color, and the collection has a
+    GeoJSON `bbox`. Zones without a boundary are left out.
+    """
+    import shapely
+
+    geometries = np.asarray(geometries, dtype=object)
+    values = np.asarray(values, dtype=float)
+    present = ~shapely.is_missing(geometries)
+    colors = hex_colors(cz_raster.linear_colors(values[present], ramp, *scale))
+
+    # One C-level GeoJSON encoding and one json.loads for the whole layer
+    shapes = shapely.to_geojson(geometries[present])
+    rows = zones.loc[present, ['fbcz_id', 'country', 'win_population', 'area']]
+    features = []
+    for (zone, country, population, area), value, color, shape in zip(
+            rows.itertuples(index=False), values[present].tolist(), colors, shapes):
+        properties = json.dumps({
+            'fbcz_id': zone, 'country': str(country),
+            'population': None if population != population else float(population),
+            'area': None if area != area else float(area),
+            'value': None if value != value else value,
+            'color': color,
+        })
+        features.append(f'{{"type":"Feature","id":{json.dumps(zone)},"geometry":{shape},"properties":{properties}}}')
+    layer = json.loads('{"type":"FeatureCollection","features":[' + ','.join(features) + ']}')
+    if present.any():
+        layer['bbox'] = [float(v) for v in shapely.total_bounds(geometries[present])]
+    return layer
+
+
+def layer_bounds(layers):
+    """[[south, west], [north, east]] around the bounding boxes of all layers"""
+    boxes = np.array([layer['bbox'] for layer in layers if 'bbox' in layer])
+    if len(boxes) == 0:
+        return None
+    west, south = boxes[:, :2].min(axis=0)
+    east, north = boxes[:, 2:].max(axis=0)
+    return [[float(south), float(west)], [float(north), float(east)]]
+
+
+def zone_geojson(layer, caption, name=None):
+    """A folium GeoJson drawing a layer in its precomputed colors"""
+    import folium
+
+    return folium.GeoJson(
+        layer,
+        name=name,
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['color'],
+            'color': 'black',
+            'weight': 1,
+            'fillOpacity': 0.7,
+        },
+        tooltip=folium.GeoJsonTooltip(fields=['fbcz_id', 'country', 'value'],
+                                      aliases=['Zone', 'Country', caption], localize=True),
+    )
+
+
+def add_legend(m, scale, caption, ramp='population'):
+    """Add the color ramp of `scale` to a folium map"""
+    import branca.colormap as cm
+
+    start, end = (f"#{r:02x}{g:02x}{b:02x}" for r, g, b in cz_raster.COLOR_RAMPS[ramp])
+    cm.LinearColormap(colors=[start, end], vmin=scale[0], vmax=scale[1], caption=caption).add_to(m)
+
+
+def comparison_map(layers, scale, caption, ramp='population', bounds=None):
+    """A folium map with one toggleable layer per country and a shared legend
+
+    `layers` maps country names to country_layer results.
+    """
+    import folium
+
+    m = folium.Map(tiles='OpenStreetMap')
+    for country, layer in layers.items():
+        zone_geojson(layer, caption, name=country).add_to(m)
+    folium.LayerControl(collapsed=True).add_to(m)
+    add_legend(m, scale, caption, ramp)
+    bounds = bounds or layer_bounds(layers.values())
+    if bounds:
+        m.fit_bounds(bounds)
+    return m
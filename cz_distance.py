@@ -0,0 +1,144 @@
+"""
+Zone-to-zone great-circle distance matrices for gravity models.
+
+Distances are haversine distances in kilometres between zone centroids,
+computed in row blocks with NumPy so only one block of float64 temporaries
+exists at a time. The result is float32 and can be written straight into a
+memory-mapped .npy file, or kept sparse with only the pairs closer than a
+cutoff, which makes an all-Europe matrix practical on a laptop.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import shapely
+
+import cz_spatial
+
+EARTH_RADIUS_KM = 6371.0088
+CENTROIDS_FILE = "zone_centroids.npz"
+
+
+def zone_centroids(geometries):
+    """(lon, lat) of each zone's area centroid, computed in the global equal-area projection"""
+    from pyproj import Transformer
+
+    projected = cz_spatial.project_geometries(geometries)
+    centroids = shapely.centroid(projected)
+    to_lonlat = Transformer.from_crs(cz_spatial.EQUAL_AREA_CRS, "EPSG:4326", always_xy=True)
+    return to_lonlat.transform(shapely.get_x(centroids), shapely.get_y(centroids))
+
+
+def load_zone_centroids(dataset):
+    """Centroids of every zone of a shared dataset, stored with it once computed"""
+    path = os.path.join(dataset.path, CENTROIDS_FILE) if dataset.path else None
+    if path and os.path.exists(path):
+        with np.load(path) as arrays:
+            return pd.DataFrame({name: arrays[name] for name in arrays.files})
+
+    lon, lat = zone_centroids(dataset.geometries(np.arange(len(dataset.data))))
+    centroids = pd.DataFrame({'fbcz_id_num': dataset.data['fbcz_id_num'].to_numpy(),
+                              'lon': lon, 'lat': lat})
+    if path:
+        staging = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(staging, **{name: centroids[name].to_numpy() for name in centroids})
+        os.replace(staging, path)
+    return centroids
+
+
+def _haversine_block(lat1, lon1, cos1, lat2, lon2, cos2):
+    dlat = lat2[None, :] - lat1[:, None]
+    dlon = lon2[None, :] - lon1[:, None]
+    a = np.sin(dlat / 2) ** 2 + cos1[:, None] * cos2[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(lon, lat, block_size=2048, path=None, max_distance=None):
+    """Pairwise great-circle distances (km) between points, built in row blocks
+
+    Returns a float32 array, memory-mapped to `path` (.npy) when given. With
+    `max_distance` (km) it returns a scipy CSR matrix holding only the pairs
+    within the cutoff; the zero self-distances are left out.
+    """
+    lon = np.radians(np.asarray(lon, dtype=float))
+    lat = np.radians(np.asarray(lat, dtype=float))
+    cos_lat = np.cos(lat)
+    n = len(lon)
+
+    if max_distance is None:
+        if path is not None:
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, n))
+        else:
+            out = np.empty((n, n), dtype=np.float32)
+    else:
+        rows, cols, values = [], [], []
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = _haversine_block(lat[start:stop], lon[start:stop], cos_lat[start:stop], lat, lon, cos_lat)
+        if max_distance is None:
+            out[start:stop] = block
+            continue
+        block_rows, block_cols = np.nonzero(block <= max_distance)
+        keep = block_rows + start != block_cols
+        rows.append(block_rows[keep] + start)
+        cols.append(block_cols[keep])
+        values.append(block[block_rows[keep], block_cols[keep]].astype(np.float32))
+
+    if max_distance is None:
+        if path is not None:
+            out.flush()
+        return out
+    return sp.csr_matrix(
+        (np.concatenate(values or [np.empty(0, np.float32)]),
+         (np.concatenate(rows or [np.empty(0, int)]), np.concatenate(cols or [np.empty(0, int)]))),
+        shape=(n, n),
+    )
+
+
+class ZoneDistances:
+    """Distance matrix between zones, addressed by `fbcz_id_num`"""
+
+    def __init__(self, zone_ids, matrix):
+        self.zone_ids = np.asarray(zone_ids)
+        self.matrix = matrix
+        self._positions = pd.Series(np.arange(len(self.zone_ids)), index=self.zone_ids)
+
+    @classmethod
+    def from_centroids(cls, centroids, **options):
+        """Build from a frame with fbcz_id_num/lon/lat (see load_zone_centroids)"""
+        matrix = haversine_matrix(centroids['lon'].to_numpy(), centroids['lat'].to_numpy(), **options)
+        return cls(centroids['fbcz_id_num'].to_numpy(), matrix)
+
+    @property
+    def sparse(self):
+        return sp.issparse(self.matrix)
+
+    def distance(self, zone_a, zone_b):
+        """Distance in km; inf for pairs beyond a sparse matrix's cutoff"""
+        i, j = self._positions[zone_a], self._positions[zone_b]
+        if i == j:
+            return 0.0
+        if self.sparse:
+            row = self.matrix.getrow(i)
+            hit = np.flatnonzero(row.indices == j)
+            return float(row.data[hit[0]]) if len(hit) else np.inf
+        return float(self.matrix[i, j])
+
+    def within(self, zone_id, max_distance):
+        """Zones within `max_distance` km of `zone_id`, nearest first"""
+        i = self._positions[zone_id]
+        if self.sparse:
+            row = self.matrix.getrow(i)
+            positions, distances = row.indices, row.data
+        else:
+            distances = np.asarray(self.matrix[i])
+            positions = np.flatnonzero(distances <= max_distance)
+            positions = positions[positions != i]
+            distances = distances[positions]
+        keep = distances <= max_distance
+        result = pd.Series(distances[keep], index=pd.Index(self.zone_ids[positions[keep]], name='fbcz_id_num'),
+                           name='distance_km')
+        return result.sort_values()
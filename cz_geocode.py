@@ -0,0 +1,227 @@
+"""
+Concurrent, rate-limited geocoding of location names for commuting_zones.
+
+The R package's get_location_lat_long() looks locations up one request at a
+time, so geocoding tens of thousands of rows is bound by round-trip latency.
+AsyncGeocoder keeps up to `concurrency` requests in flight on asyncio while a
+token bucket holds the request rate to the provider's quota, retries
+transient failures (HTTP 429/5xx, network errors, OVER_QUERY_LIMIT) with
+exponential backoff, and appends every final answer to an optional JSON-lines
+checkpoint so an interrupted run resumes where it stopped.
+
+Requests go to a Google Geocoding API compatible endpoint; point `url` at a
+local server to test against a fake geocoder.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import cz_spatial
+
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+RETRY_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+FINAL_STATUSES = {"OK", "ZERO_RESULTS"}
+
+
+class GeocodeError(RuntimeError):
+    """The geocoder rejected the requests (bad key, quota disabled, ...)"""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, in bursts of up to `capacity`
+
+    `clock` and `sleep` default to time.monotonic and asyncio.sleep.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self.sleep((1 - self._tokens) / self.rate)
+
+
+def load_checkpoint(path):
+    """{query: (latitude, longitude, status)} from a JSON-lines checkpoint"""
+    results = {}
+    if path is None or not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partly written last line from an interrupted run
+                continue
+            results[record["query"]] = (record["latitude"], record["longitude"], record["status"])
+    return results
+
+
+def _open_checkpoint(path):
+    """Open a checkpoint for appending, ending any partly written last line"""
+    f = open(path, "a+")
+    if f.tell() > 0:
+        f.seek(f.tell() - 1)
+        if f.read(1) != "\n":
+            f.write("\n")
+    return f
+
+
+class AsyncGeocoder:
+    """Geocode many location queries concurrently within a request-rate quota"""
+
+    def __init__(self, gmaps_key="", url=GOOGLE_GEOCODE_URL, concurrency=10, rate=40.0,
+                 burst=1, retries=5, backoff=0.5, timeout=10.0, checkpoint=None):
+        self.gmaps_key = gmaps_key
+        self.url = url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.requests = 0
+        self.retried = 0
+
+    def _fetch(self, query):
+        """One blocking HTTP request; returns (status, latitude, longitude)"""
+        params = {"address": query}
+        if self.gmaps_key:
+            params["key"] = self.gmaps_key
+        url = f"{self.url}?{urllib.parse.urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                return "UNKNOWN_ERROR", None, None
+            raise GeocodeError(f"geocoder returned HTTP {e.code} for {query!r}") from e
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            return "UNKNOWN_ERROR", None, None
+
+        status = body.get("status", "UNKNOWN_ERROR")
+        if status == "OK" and body.get("results"):
+            location = body["results"][0]["geometry"]["location"]
+            return status, location["lat"], location["lng"]
+        if status in FINAL_STATUSES or status in RETRY_STATUSES:
+            return status, None, None
+        raise GeocodeError(f"geocoder answered {status}: {body.get('error_message', '')}".strip())
+
+    async def _geocode(self, query, bucket, semaphore, executor):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            async with semaphore:
+                # Take the token right before the request: tokens taken while
+                # waiting for a slot would be spent together in a burst
+                await bucket.acquire()
+                self.requests += 1
+                status, lat, lng = await loop.run_in_executor(executor, self._fetch, query)
+            if status not in RETRY_STATUSES:
+                return query, lat, lng, status
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+        return query, None, None, status
+
+    async def geocode_all(self, queries, progress=None):
+        """{query: (latitude, longitude, status)} for every distinct query
+
+        Answers already in the checkpoint are reused; `progress`, if given,
+        is called with (done, total) as answers arrive.
+        """
+        queries = list(dict.fromkeys(queries))
+        results = load_checkpoint(self.checkpoint)
+        pending = [query for query in queries if query not in results]
+        done = len(queries) - len(pending)
+
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        checkpoint = _open_checkpoint(self.checkpoint) if self.checkpoint else None
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        tasks = [asyncio.ensure_future(self._geocode(query, bucket, semaphore, executor))
+                 for query in pending]
+        try:
+            for task in asyncio.as_completed(tasks):
+                query, lat, lng, status = await task
+                results[query] = (lat, lng, status)
+                if checkpoint is not None and status in FINAL_STATUSES:
+                    checkpoint.write(json.dumps({"query": query, "latitude": lat, "longitude": lng,
+                                                 "status": status}) + "\n")
+                    checkpoint.flush()
+                done += 1
+                if progress is not None:
+                    progress(done, len(queries))
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            if checkpoint is not None:
+                checkpoint.close()
+        return {query: results[query] for query in queries}
+
+
+def location_queries(data, location_col_name="location", country_col_name="country"):
+    """The address string sent to the geocoder for each row"""
+    locations = data[location_col_name].astype(str).str.strip()
+    if country_col_name is None:
+        return locations
+    return locations + ", " + data[country_col_name].astype(str).str.strip()
+
+
+def get_location_lat_long(data, location_col_name="location", country_col_name="country",
+                          gmaps_key="", progress=None, **options):
+    """Add `latitude`, `longitude` and `geocode_status` columns to `data`
+
+    Each distinct location/country pair is geocoded once. `options` are
+    passed to AsyncGeocoder (concurrency, rate, retries, checkpoint, url...).
+    Rows whose lookup failed or found nothing get NaN coordinates.
+    """
+    queries = location_queries(data, location_col_name, country_col_name)
+    geocoder = AsyncGeocoder(gmaps_key=gmaps_key, **options)
+    answers = asyncio.run(geocoder.geocode_all(queries, progress=progress))
+
+    result = data.copy()
+    matched = queries.map(answers)
+    result['latitude'] = np.array([np.nan if a[0] is None else a[0] for a in matched], dtype=float)
+    result['longitude'] = np.array([np.nan if a[1] is None else a[1] for a in matched], dtype=float)
+    result['geocode_status'] = [a[2] for a in matched]
+    return result
+
+
+def commuting_zones(data, location_col_name, country_col_name, gmaps_key="", *, index, **options):
+    """Geocode locations and match them to their commuting zone
+
+    `index` is a cz_spatial ZoneIndex or ZoneGrid (e.g. load_zone_grid of the
+    shared dataset). Adds the geocoded columns plus `fbcz_id_num`, which is
+    cz_spatial.EMPTY for rows that could not be placed in a zone.
+    """
+    located = get_location_lat_long(data, location_col_name, country_col_name, gmaps_key, **options)
+    zones = np.full(len(located), cz_spatial.EMPTY, dtype=np.int64)
+    found = located['latitude'].notna().to_numpy()
+    zones[found] = index.assign(located.loc[found, 'longitude'].to_numpy(),
+                                located.loc[found, 'latitude'].to_numpy())
+    located['fbcz_id_num'] = zones
+    return located
@@ -0,0 +1,119 @@
+"""
+Validation and repair of zone boundaries at dataset build time.
+
+The WKT exported from R can contain rings that are not closed, polygons that
+are invalid (self-intersections, ring crossings) and rings wound either way.
+repair_geometries fixes all of them in one vectorized pass when the compact
+table is built, so the map, tile and spatial-index code can assume valid,
+counter-clockwise (GeoJSON order) polygons without checking per call:
+
+    closed rings     rings whose last point differs from the first
+    made valid       invalid polygons, rebuilt with GEOS make_valid
+                     ("structure" method, keeping polygonal parts only)
+    reoriented       exteriors made counter-clockwise, holes clockwise
+    missing          empty or unparseable boundaries, and invalid ones that
+                     collapse to nothing when made valid (left null)
+
+Each zone gets a `geometry_repair` status ("ok" or the repairs applied,
+joined with "; "). repair_report lists the repaired zones.
+
+Usage: python cz_geometry.py [commuting_zones_data.json]
+"""
+
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+STATUS_COLUMN = 'geometry_repair'
+OK = 'ok'
+
+
+def _reason(text):
+    # "Self-intersection[1.2 3.4]" -> "Self-intersection"
+    return text.split('[', 1)[0]
+
+
+def repair_geometries(wkt):
+    """Parse and repair WKT boundaries
+
+    Returns (geometries, status): a shapely geometry array (None where the
+    boundary is missing) and the repairs applied to each zone.
+    """
+    import shapely
+
+    wkt = np.asarray(wkt, dtype=object)
+    # NaN (e.g. from a pandas column) is a missing boundary, like None
+    wkt = np.where(pd.isna(wkt), None, wkt)
+    repairs = {}
+
+    def flag(mask, labels):
+        for i, label in zip(np.flatnonzero(mask), labels):
+            repairs.setdefault(i, []).append(label)
+
+    # Unclosed rings make the strict parser give up; "fix" closes them
+    geometries = shapely.from_wkt(wkt, on_invalid='ignore')
+    unparsed = shapely.is_missing(geometries) & pd.notna(wkt)
+    if unparsed.any():
+        geometries[unparsed] = shapely.from_wkt(wkt[unparsed], on_invalid='fix')
+        closed = unparsed & ~shapely.is_missing(geometries)
+        flag(closed, ['closed rings'] * int(closed.sum()))
+
+    missing = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+    geometries[missing] = None
+    flag(missing, ['missing'] * int(missing.sum()))
+
+    invalid = ~missing & ~shapely.is_valid(geometries)
+    if invalid.any():
+        reasons = shapely.is_valid_reason(geometries[invalid])
+        flag(invalid, [f"made valid ({_reason(reason)})" for reason in reasons])
+        geometries[invalid] = shapely.make_valid(geometries[invalid], method='structure', keep_collapsed=False)
+        # Degenerate rings (all points on a line) have no polygonal part left
+        collapsed = invalid & (shapely.is_missing(geometries) | shapely.is_empty(geometries))
+        geometries[collapsed] = None
+        flag(collapsed, ['missing'] * int(collapsed.sum()))
+        missing |= collapsed
+
+    oriented = shapely.orient_polygons(geometries, exterior_cw=False)
+    reoriented = ~missing & ~invalid & ~shapely.equals_identical(geometries, oriented)
+    flag(reoriented, ['reoriented'] * int(reoriented.sum()))
+
+    status = np.full(len(wkt), OK, dtype=object)
+    for i, applied in repairs.items():
+        status[i] = '; '.join(applied)
+    return oriented, status
+
+
+def repair_report(data):
+    """The zones whose boundary was repaired, with the repairs applied"""
+    if STATUS_COLUMN not in data:
+        return pd.DataFrame(columns=['fbcz_id', 'country', STATUS_COLUMN])
+    repaired = data[data[STATUS_COLUMN].astype(str) != OK]
+    return repaired[['fbcz_id', 'country', STATUS_COLUMN]].reset_index(drop=True)
+
+
+def main():
+    if len(sys.argv) > 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    if len(sys.argv) == 2:
+        import cz_schema
+
+        with open(sys.argv[1], "r") as f:
+            data = cz_schema.compact_zone_table(pd.DataFrame(json.load(f)))
+    else:
+        import export_reports
+
+        data = export_reports.load_dataset().data
+
+    report = repair_report(data)
+    print(report.to_string(index=False) if len(report) else "No repaired zones")
+    print(f"\n{len(report):,} of {len(data):,} zones repaired")
+    if len(report):
+        print(report[STATUS_COLUMN].astype(str).value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
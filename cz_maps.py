@@ -0,0 +1,121 @@
+"""
+Country maps and charts, built without Streamlit.
+
+country_map draws a country's zones as a folium map, colored with the
+styles the asset-backed map uses (cz_assets.MAP_STYLES); population_area_comparison
+is the per-zone population and area chart. The app wraps both to report
+failures on the page; export_reports calls them directly in its worker
+processes, where errors propagate as they are. folium, geopandas, branca
+and plotly are imported when a map or chart is built.
+"""
+
+import cz_assets
+
+
+def country_map(data, country, map_type="population", values=None, geometries=None):
+    """A folium map of `country`'s zones, or None if it has none
+
+    `geometries` (shapely geometries aligned with `data`) are the zone
+    boundaries. `values` (a Series indexed by fbcz_id, e.g. from
+    cz_aggregate.to_color_values) colors the zones instead of `map_type`.
+    """
+    if data is None or country is None:
+        return None
+
+    country_data = data[data['country'] == country].copy()
+    if len(country_data) == 0:
+        return None
+
+    import branca.colormap as cm
+    import folium
+    import geopandas as gpd
+    from pyproj import Transformer
+
+    country_data['geometry'] = geometries[country_data.index]
+    # Boundaries were validated and repaired when the dataset was built
+    # (cz_geometry); only zones without one are left out
+    gdf = gpd.GeoDataFrame(country_data, crs="EPSG:4326")
+    gdf = gdf[gdf.geometry.notna()]
+
+    try:
+        # Center on the mean centroid in a projected CRS, then back to lat/lon
+        projected = gdf.to_crs('EPSG:3857').geometry.centroid
+        transformer = Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
+        center_lon, center_lat = transformer.transform(projected.x.mean(), projected.y.mean())
+    except Exception:
+        # Fallback to simple mean if projection fails
+        center_lat = gdf.geometry.centroid.y.mean()
+        center_lon = gdf.geometry.centroid.x.mean()
+
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=6, tiles='OpenStreetMap')
+
+    if values is not None:
+        color_column = 'custom_value'
+        gdf[color_column] = gdf['fbcz_id'].map(values).astype(float).fillna(0)
+        color_map = cm.LinearColormap(
+            colors=['lightyellow', 'darkred'],
+            vmin=gdf[color_column].min(),
+            vmax=gdf[color_column].max(),
+            caption=values.name or 'Value'
+        )
+    else:
+        style = 'population' if map_type == "population" else 'area'
+        color_column = cz_assets.MAP_STYLES[style][0]
+        color_map = cz_assets.colormap(style, gdf[color_column].min(), gdf[color_column].max())
+
+    for _, row in gdf.iterrows():
+        color = color_map(row[color_column])
+        popup_content = f"""
+        <b>Zone: {row['fbcz_id']}</b><br>
+        Population: {row['win_population']:,.0f}<br>
+        Area: {row['area']:,.1f} km²<br>
+        Roads: {row['win_roads_km']:,.1f} km
+        """
+        if values is not None:
+            popup_content += f"<br>{color_map.caption}: {row[color_column]:,.4g}"
+
+        folium.GeoJson(
+            row.geometry,
+            style_function=lambda x, color=color: {
+                'fillColor': color,
+                'color': 'black',
+                'weight': 1,
+                'fillOpacity': 0.7
+            },
+            popup=folium.Popup(popup_content, max_width=300),
+            tooltip=f"Zone: {row['fbcz_id']}"
+        ).add_to(m)
+
+    color_map.add_to(m)
+    return m
+
+
+def population_area_comparison(data, country):
+    """Bar charts of population and area by zone, or None if `country` has no zones"""
+    if data is None or country is None:
+        return None
+
+    country_data = data[data['country'] == country]
+    if len(country_data) == 0:
+        return None
+
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=1, cols=2,
+        subplot_titles=('Population by Zone', 'Area by Zone'),
+        specs=[[{"type": "bar"}, {"type": "bar"}]]
+    )
+    fig.add_trace(go.Bar(x=country_data['fbcz_id'], y=country_data['win_population'],
+                         name='Population', marker_color='lightblue'), row=1, col=1)
+    fig.add_trace(go.Bar(x=country_data['fbcz_id'], y=country_data['area'],
+                         name='Area (km²)', marker_color='lightgreen'), row=1, col=2)
+    fig.update_layout(
+        height=500,
+        title_text=f"Zone Comparison - {country}",
+        title_x=0.5,
+        showlegend=False
+    )
+    fig.update_xaxes(tickangle=45)
+    return fig
@@ -0,0 +1,345 @@
+"""
+Chunked matching of uploaded location files to commuting zones.
+
+match_csv reads a CSV in chunks, passes each chunk through a matcher that
+adds `fbcz_id_num` and `fbcz_id`, and appends the enriched rows to an output
+CSV (gzip-compressed when the name ends in .gz) as they are produced, so
+matching itself holds one chunk at a time. Each chunk is written as its own
+gzip member, so the file is a complete gzip CSV of the rows matched so far
+at every point and can be downloaded while matching goes on; with
+`part_bytes` the output rolls over into numbered parts of at most that size.
+
+    PointMatcher    latitude/longitude columns through a cz_spatial index
+    ZipMatcher      zipcodes through the package's zip_to_cz table, joined
+                    on the ISO3 country code as well when the file has one
+
+The app writes each result to a MatchOutput, a directory with an
+unguessable name under static/matched/ that Streamlit serves as a file
+download (no copy of the file goes through the session's websocket); it is
+deleted when the result is replaced or its session ends, and
+remove_stale_outputs sweeps up those of processes that were killed before
+they could delete theirs. Streamlit keeps an uploaded file in memory, so
+files larger than memory are matched from disk on the command line instead.
+
+Usage: python cz_match.py points.csv matched.csv.gz --lat latitude --lon longitude [--sample]
+       python cz_match.py sites.csv matched.csv.gz --zip zipcode [--country country_iso3]
+"""
+
+import argparse
+import glob
+import gzip
+import os
+import re
+import secrets
+import shutil
+import sys
+import time
+import weakref
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import cz_spatial
+
+MATCH_COLUMNS = ['fbcz_id_num', 'fbcz_id']
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(HERE, "static", "matched")
+STATIC_URL = "app/static/matched"
+OUTPUT_PREFIX = "cz_matched_"
+# Older matched outputs belong to no live session
+OUTPUT_MAX_AGE = 24 * 3600
+# Streamlit's static route refuses files over 200 MB
+PART_BYTES = 190 * 2**20
+
+
+@dataclass
+class MatchProgress:
+    """Running totals reported after every chunk"""
+    rows: int = 0
+    matched: int = 0
+    chunks: int = 0
+    bytes_read: int = 0
+    total_bytes: int = 0
+    elapsed: float = 0.0
+    # Paths of the output parts written so far, the last one still growing
+    parts: list = field(default_factory=list)
+
+    @property
+    def fraction(self):
+        return min(self.bytes_read / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class PointMatcher:
+    """Assign rows to zones by their coordinates"""
+
+    def __init__(self, index, zone_labels, lon_col='longitude', lat_col='latitude', snap_tolerance=None):
+        self.index = index
+        # fbcz_id_num -> fbcz_id
+        self.zone_labels = zone_labels
+        self.lon_col = lon_col
+        self.lat_col = lat_col
+        self.snap_tolerance = snap_tolerance
+
+    @property
+    def required_columns(self):
+        return [self.lon_col, self.lat_col]
+
+    def match(self, chunk):
+        lon = pd.to_numeric(chunk[self.lon_col], errors='coerce').to_numpy(dtype=float)
+        lat = pd.to_numeric(chunk[self.lat_col], errors='coerce').to_numpy(dtype=float)
+        zones = np.full(len(chunk), cz_spatial.EMPTY, dtype=np.int64)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        zones[valid] = self.index.assign(lon[valid], lat[valid], snap_tolerance=self.snap_tolerance)
+
+        ids = pd.array(zones, dtype='Int64')
+        ids[zones == cz_spatial.EMPTY] = pd.NA
+        result = chunk.copy()
+        result['fbcz_id_num'] = ids
+        result['fbcz_id'] = self.zone_labels.reindex(zones).to_numpy()
+        return result
+
+
+def normalize_zipcodes(values):
+    """Zipcodes as comparable strings
+
+    zip_to_cz stores zipcodes as numbers, so leading zeros and a trailing
+    '.0' from numeric parsing are dropped on both sides.
+    """
+    text = values.astype('string').str.strip().str.replace(r'\.0$', '', regex=True)
+    return text.str.lstrip('0').str.upper()
+
+
+class ZipMatcher:
+    """Assign rows to zones through the zip_to_cz lookup table
+
+    Without `country_col`, zipcodes that exist in several countries are left
+    unmatched rather than guessed.
+    """
+
+    def __init__(self, zip_table, zip_col='zipcode', country_col=None):
+        self.zip_col = zip_col
+        self.country_col = country_col
+        keys = ['zipcode'] + (['country_iso3'] if country_col else [])
+        lookup = zip_table[keys + MATCH_COLUMNS].copy()
+        lookup['zipcode'] = normalize_zipcodes(lookup['zipcode'])
+        if country_col:
+            lookup['country_iso3'] = lookup['country_iso3'].astype('string').str.upper()
+        lookup = lookup.drop_duplicates(keys + MATCH_COLUMNS)
+        self.lookup = lookup.drop_duplicates(keys, keep=False).set_index(keys)
+
+    @property
+    def required_columns(self):
+        return [self.zip_col] + ([self.country_col] if self.country_col else [])
+
+    def match(self, chunk):
+        keys = [normalize_zipcodes(chunk[self.zip_col])]
+        if self.country_col:
+            keys.append(chunk[self.country_col].astype('string').str.strip().str.upper())
+        found = self.lookup.reindex(pd.MultiIndex.from_arrays(keys) if len(keys) > 1 else keys[0])
+
+        result = chunk.copy()
+        result['fbcz_id_num'] = pd.array(found['fbcz_id_num'].to_numpy(), dtype='Int64')
+        result['fbcz_id'] = found['fbcz_id'].to_numpy()
+        return result
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if hasattr(source, 'size'):
+        return source.size
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def part_path(path, number):
+    """The path of output part `number`: the path itself for the first, then name-2.csv.gz, ..."""
+    if number == 1:
+        return path
+    path = str(path)
+    stem, ext = path[:-7], path[-7:]
+    if not path.endswith('.csv.gz'):
+        stem, ext = os.path.splitext(path)
+    return f"{stem}-{number}{ext}"
+
+
+class _PartWriter:
+    """Appends chunks to `path`, rolling over to a new part before one would pass `part_bytes`"""
+
+    def __init__(self, path, part_bytes=None):
+        self.path = path
+        self.part_bytes = part_bytes
+        self.compress = str(path).endswith('.gz')
+        self.header = b''
+        self.parts = []
+        self.size = 0
+        self.file = None
+
+    def _encode(self, text):
+        data = text.encode()
+        # Fast compression: the bottleneck should stay the matching
+        return gzip.compress(data, compresslevel=3) if self.compress else data
+
+    def write(self, text, header=None):
+        """Append `text`; `header` starts every part, so each is a CSV of its own"""
+        if header is not None:
+            self.header = self._encode(header)
+        data = self._encode(text)
+        if self.file is None or (self.part_bytes and self.size > len(self.header)
+                                 and self.size + len(data) > self.part_bytes):
+            self.close()
+            self.parts.append(part_path(self.path, len(self.parts) + 1))
+            self.file = open(self.parts[-1], 'wb')
+            self.file.write(self.header)
+            self.size = len(self.header)
+        self.file.write(data)
+        # A complete gzip member per chunk: the part is readable as it grows
+        self.file.flush()
+        self.size += len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def match_csv(source, matcher, output, chunksize=100_000, progress=None, preview=None, part_bytes=None):
+    """Stream a CSV through `matcher`, writing the enriched rows to `output`
+
+    `output` is a path (compressed when it ends in .gz, split into parts of
+    at most `part_bytes` if given) or a text file object. `progress`, if
+    given, is called with a MatchProgress after every chunk; `preview`, if
+    given, with the first enriched chunk. Returns the final MatchProgress.
+    """
+    state = MatchProgress(total_bytes=_source_size(source))
+    started = time.perf_counter()
+    reader = pd.read_csv(source, chunksize=chunksize, dtype_backend='pyarrow')
+    writer = _PartWriter(output, part_bytes) if isinstance(output, (str, os.PathLike)) else None
+    try:
+        for chunk in reader:
+            missing = [column for column in matcher.required_columns if column not in chunk]
+            if missing:
+                raise KeyError(f"missing column(s): {', '.join(missing)}")
+            enriched = matcher.match(chunk)
+            if writer is None:
+                enriched.to_csv(output, index=False, header=state.chunks == 0)
+            else:
+                header = enriched.head(0).to_csv(index=False, lineterminator='\n') if state.chunks == 0 else None
+                writer.write(enriched.to_csv(index=False, header=False, lineterminator='\n'), header=header)
+                state.parts = list(writer.parts)
+
+            if state.chunks == 0 and preview is not None:
+                preview(enriched)
+            state.chunks += 1
+            state.rows += len(chunk)
+            state.matched += int(enriched['fbcz_id_num'].notna().sum())
+            state.bytes_read = source.tell() if hasattr(source, 'tell') else state.total_bytes
+            state.elapsed = time.perf_counter() - started
+            if progress is not None:
+                progress(state)
+    finally:
+        reader.close()
+        if writer is not None:
+            writer.close()
+    state.bytes_read = state.total_bytes
+    return state
+
+
+def output_name(upload_name):
+    """The download name of an upload's result: <stem>_zones.csv.gz, safe in a URL"""
+    stem = re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.splitext(os.path.basename(upload_name))[0]).strip('._')
+    return f"{stem or 'matched'}_zones.csv.gz"
+
+
+class MatchOutput:
+    """A matched CSV in its own directory under `directory`, deleted by remove() or with this object
+
+    The directory name carries a random token: served from static/, the
+    file is reachable only through the link given to the session that made
+    it. Kept in a session's state, it goes when the session state is garbage
+    collected after the session ends, or when the process exits.
+    """
+
+    def __init__(self, name="matched.csv.gz", directory=None):
+        directory = directory or OUTPUT_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.directory = os.path.join(directory, OUTPUT_PREFIX + secrets.token_urlsafe(16))
+        os.mkdir(self.directory)
+        self.path = os.path.join(self.directory, name)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+
+    @property
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def remove(self):
+        self._finalizer()
+
+
+def download_url(path, base_url_path="", directory=None):
+    """Where browsers download an output file from Streamlit's static route"""
+    relative = os.path.relpath(path, directory or OUTPUT_DIR).replace(os.sep, "/")
+    prefix = f"/{base_url_path.strip('/')}" if base_url_path.strip("/") else ""
+    return f"{prefix}/{STATIC_URL}/{relative}"
+
+
+def remove_stale_outputs(directory=None, max_age=OUTPUT_MAX_AGE):
+    """Delete matched outputs older than `max_age` seconds; returns how many"""
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in glob.glob(os.path.join(directory or OUTPUT_DIR, OUTPUT_PREFIX + "*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="CSV of locations")
+    parser.add_argument("output", help="enriched CSV (gzip-compressed when it ends in .gz)")
+    keys = parser.add_mutually_exclusive_group(required=True)
+    keys.add_argument("--lat", help="latitude column (with --lon)")
+    keys.add_argument("--zip", help="zipcode column")
+    parser.add_argument("--lon", help="longitude column")
+    parser.add_argument("--country", help="ISO3 country column to join zipcodes on")
+    parser.add_argument("--snap-km", type=float, default=0.0, help="snap points within this distance of a zone")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--sample", action="store_true", help="use the built-in sample data (no R needed)")
+    args = parser.parse_args(argv)
+    if args.lat and not args.lon:
+        parser.error("--lat needs --lon")
+
+    if args.lat:
+        import export_reports
+
+        dataset = export_reports.load_dataset(sample=args.sample)
+        labels = dataset.data.set_index('fbcz_id_num')['fbcz_id'].astype(str)
+        matcher = PointMatcher(cz_spatial.load_zone_grid(dataset), labels, lon_col=args.lon, lat_col=args.lat,
+                               snap_tolerance=args.snap_km * 1000 or None)
+    else:
+        import cz_rworker
+
+        matcher = ZipMatcher(cz_rworker.get_worker().zip_to_cz(), zip_col=args.zip, country_col=args.country)
+
+    def report(state):
+        print(f"\r{state.rows:,} rows ({state.fraction:.0%})", end="", file=sys.stderr, flush=True)
+
+    state = match_csv(args.source, matcher, args.output, chunksize=args.chunksize, progress=report)
+    print(file=sys.stderr)
+    print(f"{state.matched:,} of {state.rows:,} rows matched to a zone in {state.elapsed:,.1f} s, "
+          f"written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
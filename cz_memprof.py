@@ -0,0 +1,187 @@
+"""
+Opt-in memory instrumentation for the Streamlit app.
+
+Set CZ_MEMPROFILE=1 to enable it. tracemalloc then starts when this module
+is imported, and every `track(label)` block (or `@profiled(label)` function)
+records the change in resident set size, the change in memory traced by
+tracemalloc, the peak inside the block and the source lines that allocated
+the most net memory, comparing snapshots taken before and after. Records are
+kept in a bounded, process-wide ring buffer that the app shows in the
+sidebar and soak_memory.py reads to detect leaks.
+
+RSS, tracemalloc's counters and its single peak are process-wide: a block's
+deltas and peak include whatever other threads (the warm-up thread, other
+sessions) allocate while it is open. Blocks in different threads may
+overlap; whenever one starts or ends, the peak since the last reset is
+credited to every open block before it is reset, so no block loses a peak
+it saw.
+
+When disabled, track() and profiled() cost one attribute check.
+"""
+
+import collections
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("CZ_MEMPROFILE", "") not in ("", "0")
+# Only the allocating line is reported, so one frame per trace is enough
+TRACE_FRAMES = 1
+MAX_RECORDS = 500
+TOP_SITES = 10
+
+_records = collections.deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+_local = threading.local()
+# Peak traced memory seen by each open block, in any thread
+_open_peaks = {}
+_peak_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start():
+    """Start tracing allocations (done at import when CZ_MEMPROFILE is set)"""
+    global ENABLED
+    ENABLED = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+
+def _own(stat):
+    # Allocations of tracemalloc and of this module (the snapshots themselves)
+    return stat.traceback[0].filename in (tracemalloc.__file__, __file__)
+
+
+def top_sites(before, after, limit=TOP_SITES):
+    """[(site, net bytes, net blocks)] of the lines allocating most between two snapshots"""
+    # Filtering the grouped statistics rather than the snapshots: filter_traces
+    # matches every trace in Python, which takes minutes on a full heap
+    stats = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0 and not _own(stat)]
+    stats = sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:limit]
+    return [(f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff, stat.count_diff)
+            for stat in stats]
+
+
+def _credit_peak():
+    """Credit the peak since the last reset to every open block, then reset it"""
+    _, peak = tracemalloc.get_traced_memory()
+    for key, seen in _open_peaks.items():
+        _open_peaks[key] = max(seen, peak)
+    tracemalloc.reset_peak()
+
+
+@contextmanager
+def track(label):
+    """Record RSS/traced-memory deltas and top allocation sites of a block"""
+    if not ENABLED:
+        yield
+        return
+
+    # Nested blocks are recorded too, with their depth: an outer block's
+    # deltas include those of the blocks inside it
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    key = object()
+    with _peak_lock:
+        _credit_peak()
+        before = tracemalloc.take_snapshot()
+        # Not the snapshot's own peak
+        tracemalloc.reset_peak()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        _open_peaks[key] = traced_before
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        rss_after = rss_bytes()
+        with _peak_lock:
+            _credit_peak()
+            peak = _open_peaks.pop(key)
+            traced_after, _ = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        _local.depth = depth
+        with _lock:
+            _records.append({
+                "label": label,
+                "depth": depth,
+                "time": time.time(),
+                "seconds": seconds,
+                "rss_before": rss_before,
+                "rss_after": rss_after,
+                "rss_delta": rss_after - rss_before,
+                "traced_delta": traced_after - traced_before,
+                "traced_peak": peak - traced_before,
+                "top_sites": top_sites(before, after),
+            })
+
+
+def profiled(label=None):
+    """Decorator form of track(); the label defaults to the function name"""
+    def decorate(func):
+        name = label or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with track(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def records():
+    """A copy of the recorded blocks, oldest first"""
+    with _lock:
+        return list(_records)
+
+
+def clear():
+    with _lock:
+        _records.clear()
+
+
+def summary(records_=None):
+    """Per-label count and total/mean RSS and traced deltas, largest first"""
+    import pandas as pd
+
+    frame = pd.DataFrame(records_ if records_ is not None else records())
+    if frame.empty:
+        return frame
+    return frame.groupby("label").agg(
+        calls=("label", "size"),
+        rss_delta_mb=("rss_delta", lambda v: v.sum() / 2**20),
+        traced_delta_mb=("traced_delta", lambda v: v.sum() / 2**20),
+        mean_peak_mb=("traced_peak", lambda v: v.mean() / 2**20),
+        seconds=("seconds", "sum"),
+    ).sort_values("traced_delta_mb", ascending=False)
+
+
+def current_top_sites(limit=TOP_SITES):
+    """[(site, bytes, blocks)] of the lines holding the most live traced memory"""
+    if not tracemalloc.is_tracing():
+        return []
+    stats = [stat for stat in tracemalloc.take_snapshot().statistics("lineno") if not _own(stat)]
+    return [(f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size, stat.count)
+            for stat in stats[:limit]]
+
+
+if ENABLED:
+    start()
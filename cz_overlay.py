@@ -0,0 +1,183 @@
+"""
+Area-weighted interpolation between commuting zones and user polygons.
+
+build_overlay_weights intersects the zone polygons with a user polygon layer
+(administrative areas, sales territories, ...) and records the intersection
+area of every overlapping (zone, target) pair in a sparse matrix. Candidate
+pairs come from an STRtree over the targets, areas are measured in an
+equal-area projection, and the build is split by country over a process
+pool. The resulting OverlayWeights can be saved, reloaded and reapplied to
+any number of attribute columns with one sparse matrix product:
+
+    extensive values (counts, population) are split by the share of the
+    source polygon's area that falls in each destination polygon;
+    intensive values (rates, densities) are averaged, weighted by the
+    overlapping area.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import shapely
+
+import cz_spatial
+
+
+def _intersection_areas(zone_wkb, target_wkb, target_positions):
+    """(zone position, target position, area) for overlapping pairs of one group"""
+    zones = shapely.from_wkb(zone_wkb)
+    targets = shapely.from_wkb(target_wkb)
+    zone_idx, target_idx = shapely.STRtree(targets).query(zones, predicate="intersects")
+    areas = shapely.area(shapely.intersection(zones[zone_idx], targets[target_idx]))
+    keep = areas > 0
+    return zone_idx[keep], target_positions[target_idx[keep]], areas[keep]
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+def _ids_arrays(name, ids):
+    """{name: ids} for np.savez; object ids, which np.load cannot read without
+    pickle, are stored as JSON so ints stay ints and strings stay strings"""
+    if ids.dtype != object:
+        return {name: ids}
+    return {f"{name}_json": np.array(json.dumps(ids.tolist(), default=_json_value))}
+
+
+def _load_ids(arrays, name):
+    if f"{name}_json" in arrays.files:
+        return np.array(json.loads(str(arrays[f"{name}_json"])), dtype=object)
+    return arrays[name]
+
+
+class OverlayWeights:
+    """Sparse intersection-area matrix between zones (rows) and targets (columns)"""
+
+    def __init__(self, matrix, zone_ids, target_ids, zone_areas, target_areas):
+        self.matrix = sp.csr_matrix(matrix)
+        self.zone_ids = np.asarray(zone_ids)
+        self.target_ids = np.asarray(target_ids)
+        self.zone_areas = np.asarray(zone_areas, dtype=float)
+        self.target_areas = np.asarray(target_areas, dtype=float)
+
+    def _apply(self, matrix, source_areas, values, source_ids, destination_ids, extensive):
+        values = values.reindex(source_ids)
+        if extensive:
+            # Share of each source polygon's area that falls in each destination
+            weights = sp.diags(1 / np.where(source_areas > 0, source_areas, np.inf)) @ matrix
+            result = weights.T @ values.fillna(0).to_numpy(dtype=float)
+        else:
+            # Mean over the covered part of each destination, by overlap area
+            known = values.notna().to_numpy(dtype=float)
+            covered = matrix.T @ known
+            result = (matrix.T @ values.fillna(0).to_numpy(dtype=float)) / np.where(covered > 0, covered, np.nan)
+        return pd.DataFrame(result, index=pd.Index(destination_ids), columns=values.columns)
+
+    def zones_to_targets(self, values, extensive=True):
+        """Re-express zone attributes (DataFrame indexed by zone id) on the targets"""
+        return self._apply(self.matrix, self.zone_areas, values, self.zone_ids, self.target_ids, extensive)
+
+    def targets_to_zones(self, values, extensive=True):
+        """Re-express target attributes (DataFrame indexed by target id) on the zones"""
+        return self._apply(self.matrix.T.tocsr(), self.target_areas, values, self.target_ids,
+                           self.zone_ids, extensive)
+
+    def save(self, path, key=""):
+        """Write the matrix and ids to an .npz file (atomically)
+
+        `key` identifies the inputs the weights were built from (see
+        overlay_key); load returns it as the `key` attribute.
+        """
+        staging = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(staging, data=self.matrix.data, indices=self.matrix.indices,
+                 indptr=self.matrix.indptr, shape=np.array(self.matrix.shape),
+                 zone_areas=self.zone_areas, target_areas=self.target_areas, key=np.array(key),
+                 **_ids_arrays("zone_ids", self.zone_ids), **_ids_arrays("target_ids", self.target_ids))
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            matrix = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                   shape=tuple(arrays["shape"]))
+            weights = cls(matrix, _load_ids(arrays, "zone_ids"), _load_ids(arrays, "target_ids"),
+                          arrays["zone_areas"], arrays["target_areas"])
+            weights.key = str(arrays["key"]) if "key" in arrays.files else ""
+            return weights
+
+
+def build_overlay_weights(zone_geometries, zone_ids, target_geometries, target_ids,
+                          zone_groups=None, crs=cz_spatial.EQUAL_AREA_CRS, max_workers=None):
+    """Intersect zones with target polygons (both lon/lat) into OverlayWeights
+
+    `zone_groups` (e.g. the zones' country) splits the build into one task
+    per group on a process pool; targets are pre-filtered to each group's
+    extent so a task only sees nearby polygons.
+    """
+    zones = cz_spatial.project_geometries(zone_geometries, crs)
+    targets = cz_spatial.project_geometries(target_geometries, crs)
+    target_tree = shapely.STRtree(targets)
+    if zone_groups is None:
+        zone_groups = np.zeros(len(zones), dtype=int)
+    zone_groups = np.asarray(zone_groups)
+
+    tasks = []
+    for group in pd.unique(zone_groups):
+        positions = np.flatnonzero(zone_groups == group)
+        extent = shapely.box(*shapely.total_bounds(zones[positions]))
+        nearby = np.sort(target_tree.query(extent))
+        tasks.append((positions, (shapely.to_wkb(zones[positions]), shapely.to_wkb(targets[nearby]), nearby)))
+
+    if len(tasks) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_intersection_areas, *zip(*(args for _, args in tasks))))
+    else:
+        results = [_intersection_areas(*args) for _, args in tasks]
+
+    rows, cols, areas = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0)]
+    for (positions, _), (zone_idx, target_idx, pair_areas) in zip(tasks, results):
+        rows.append(positions[zone_idx])
+        cols.append(target_idx)
+        areas.append(pair_areas)
+
+    matrix = sp.coo_matrix((np.concatenate(areas), (np.concatenate(rows), np.concatenate(cols))),
+                           shape=(len(zones), len(targets)))
+    return OverlayWeights(matrix, zone_ids, target_ids, shapely.area(zones), shapely.area(targets))
+
+
+def overlay_key(zone_geometries, zone_ids, target_geometries, target_ids, zone_groups=None,
+                crs=cz_spatial.EQUAL_AREA_CRS, max_workers=None):
+    """Hash of the inputs of build_overlay_weights (all but max_workers)"""
+    digest = hashlib.sha256()
+    for geometries in (zone_geometries, target_geometries):
+        for wkb in shapely.to_wkb(np.asarray(geometries, dtype=object)):
+            digest.update(wkb or b"")
+            digest.update(b"\0")
+    for values in (zone_ids, target_ids, zone_groups):
+        values = None if values is None else np.asarray(values).tolist()
+        digest.update(json.dumps(values, default=_json_value).encode())
+    digest.update(str(crs).encode())
+    return digest.hexdigest()
+
+
+def load_overlay_weights(path, *args, **kwargs):
+    """Load cached weights from `path`, building and saving them if missing
+
+    The cache holds a hash of the geometries, ids and options, so weights
+    built from other inputs (a changed target layer) are rebuilt.
+    """
+    key = overlay_key(*args, **kwargs)
+    if os.path.exists(path):
+        weights = OverlayWeights.load(path)
+        if weights.key == key:
+            return weights
+    weights = build_overlay_weights(*args, **kwargs)
+    weights.save(path, key)
+    weights.key = key
+    return weights
@@ -0,0 +1,118 @@
+"""
+Precomputed rankings of zones by metric, across Europe and within countries.
+
+RankingIndex sorts the zones once per metric (highest first, missing values
+last) and keeps, for every metric:
+
+    order            zone positions in rank order across all countries
+    country_order    the same positions grouped by country, each country's
+                     block in rank order, with `country_offsets` marking
+                     where every block starts
+    rank / country_rank
+                     the inverse permutations: 1-based rank of every zone
+                     (0 when the metric is missing)
+
+Top-N queries slice `order` or one country's block and "rank of this zone"
+queries read one array element, so both are O(k) lookups per rerun.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Metric name -> (label, function of the zone table)
+METRICS = {
+    'population': ('Population', lambda data: data['win_population']),
+    'area': ('Area (km²)', lambda data: data['area']),
+    'roads': ('Roads (km)', lambda data: data['win_roads_km']),
+    'density': ('Density (people/km²)', lambda data: data['win_population'] / data['area']),
+    'roads_per_capita': ('Roads per 1,000 people (km)',
+                         lambda data: 1000 * data['win_roads_km'] / data['win_population']),
+}
+
+
+def _descending_order(values):
+    """Positions sorted by value, highest first, NaN last, ties by position"""
+    valid = np.isfinite(values)
+    ascending = np.argsort(np.where(valid, -values, np.inf), kind='stable')
+    return ascending, int(valid.sum())
+
+
+class RankingIndex:
+    """Global and per-country rank orders of the zones for every metric"""
+
+    def __init__(self, data, metrics=None):
+        self.data = data.reset_index(drop=True)
+        self.metrics = metrics or METRICS
+        self._zone_positions = pd.Index(self.data['fbcz_id'])
+        countries = self.data['country'].astype(str)
+        self.countries, country_codes = np.unique(countries.to_numpy(), return_inverse=True)
+        self._country_codes = country_codes
+        self.country_offsets = np.searchsorted(np.sort(country_codes), np.arange(len(self.countries) + 1))
+
+        n = len(self.data)
+        self.values, self.order, self.rank = {}, {}, {}
+        self.country_order, self.country_rank, self._country_valid = {}, {}, {}
+        for name, (_, metric) in self.metrics.items():
+            values = pd.to_numeric(metric(self.data), errors='coerce').to_numpy(dtype=float)
+            values[~np.isfinite(values)] = np.nan
+            order, valid = _descending_order(values)
+            rank = np.zeros(n, dtype=np.int32)
+            rank[order[:valid]] = np.arange(1, valid + 1)
+
+            # Stable sort by country keeps the global rank order inside each block
+            country_order = order[np.argsort(country_codes[order], kind='stable')]
+            block_start = self.country_offsets[country_codes[country_order]]
+            country_rank = np.zeros(n, dtype=np.int32)
+            country_rank[country_order] = np.arange(n) - block_start + 1
+            country_rank[np.isnan(values)] = 0
+
+            self.values[name] = values
+            self.order[name] = order[:valid]
+            self.rank[name] = rank
+            self.country_order[name] = country_order
+            self.country_rank[name] = country_rank
+            self._country_valid[name] = np.bincount(country_codes[order[:valid]], minlength=len(self.countries))
+
+    def _country_code(self, country):
+        code = np.searchsorted(self.countries, country)
+        if code == len(self.countries) or self.countries[code] != country:
+            raise KeyError(f"unknown country: {country!r}")
+        return code
+
+    def top_positions(self, metric, n=10, country=None, offset=0):
+        """Zone positions ranked `offset + 1` to `offset + n`"""
+        if country is None:
+            return self.order[metric][offset:offset + n]
+        code = self._country_code(country)
+        start = self.country_offsets[code]
+        stop = start + self._country_valid[metric][code]
+        return self.country_order[metric][min(start + offset, stop):min(start + offset + n, stop)]
+
+    def top(self, metric, n=10, country=None, offset=0):
+        """The top `n` zones by `metric` with their value and ranks"""
+        positions = self.top_positions(metric, n, country, offset)
+        result = self.data.iloc[positions][['fbcz_id', 'country']].copy()
+        result.insert(0, 'rank', self.rank[metric][positions])
+        result['country_rank'] = self.country_rank[metric][positions]
+        result[metric] = self.values[metric][positions]
+        return result.reset_index(drop=True)
+
+    def ranked_count(self, metric, country=None):
+        """Number of zones with a value for `metric` (in `country`)"""
+        if country is None:
+            return len(self.order[metric])
+        return int(self._country_valid[metric][self._country_code(country)])
+
+    def quantile(self, metric, q):
+        """Value of `metric` at quantile `q` (0 = lowest) over all zones, read off the order"""
+        order = self.order[metric]
+        if len(order) == 0:
+            raise ValueError(f"no zone has a value for {metric!r}")
+        # `order` is highest first: the k-th lowest value is k from the end
+        lowest = int(round(q * (len(order) - 1)))
+        return float(self.values[metric][order[len(order) - 1 - lowest]])
+
+    def zone_rank(self, zone_id, metric):
+        """(rank in Europe, rank in its country); 0 when the metric is missing"""
+        position = self._zone_positions.get_loc(zone_id)
+        return int(self.rank[metric][position]), int(self.country_rank[metric][position])
@@ -0,0 +1,181 @@
+"""
+Headless rendering of zone polygons to PNG with NumPy alone.
+
+Polygons are projected to Web Mercator, scaled to pixels and filled with an
+even-odd scanline rule that is vectorized over all edges at once: every edge
+yields its crossings with the pixel-row centres, crossings are sorted per
+(polygon, row) and consecutive pairs become filled spans. The result is a
+label image (0 = background, i + 1 = polygon i) that is colored through a
+palette, optionally with 1-pixel outlines. encode_png writes RGBA images
+with zlib, so no browser, GDAL or imaging library is needed. shapely is only
+imported by the functions that take geometries.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+# Fill ramps matching the folium maps of cz_maps.country_map
+COLOR_RAMPS = {
+    'population': ((173, 216, 230), (0, 0, 139)),
+    'area': ((144, 238, 144), (0, 100, 0)),
+    'custom': ((255, 255, 224), (139, 0, 0)),
+}
+MISSING_COLOR = (200, 200, 200, 255)
+OUTLINE_COLOR = (0, 0, 0, 255)
+
+
+def lonlat_to_mercator(lon, lat):
+    """Web Mercator coordinates in [0, 1] tile units (y grows southwards)"""
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi) / 2.0
+    return x, y
+
+
+def to_mercator(geometries):
+    """Project lon/lat geometries to Web Mercator tile units"""
+    import shapely
+
+    def project(coords):
+        x, y = lonlat_to_mercator(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
+    return shapely.transform(np.asarray(geometries, dtype=object), project)
+
+
+def _edges(geometries, bounds, width, height):
+    """Pixel-space edges (x0, y0, x1, y1) and the geometry index of each"""
+    import shapely
+
+    parts, part_index = shapely.get_parts(geometries, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    xmin, ymin, xmax, ymax = bounds
+    px = (coords[:, 0] - xmin) / (xmax - xmin) * width
+    py = (coords[:, 1] - ymin) / (ymax - ymin) * height
+
+    same_ring = ring_index[:-1] == ring_index[1:]
+    owner = part_index[ring_part[ring_index[:-1][same_ring]]]
+    return px[:-1][same_ring], py[:-1][same_ring], px[1:][same_ring], py[1:][same_ring], owner
+
+
+def rasterize(geometries, bounds, width, height):
+    """Label image of polygons (already in the units of `bounds`)
+
+    Pixel (row, col) gets i + 1 when its centre lies inside geometries[i];
+    later geometries win where polygons overlap.
+    """
+    labels = np.zeros((height, width), dtype=np.int32)
+    if len(geometries) == 0:
+        return labels
+    x0, y0, x1, y1, owner = _edges(np.asarray(geometries, dtype=object), bounds, width, height)
+
+    # Rows whose centre (row + 0.5) lies in [min(y0, y1), max(y0, y1))
+    low, high = np.minimum(y0, y1), np.maximum(y0, y1)
+    first = np.clip(np.ceil(low - 0.5), 0, height).astype(np.int64)
+    stop = np.clip(np.ceil(high - 0.5), 0, height).astype(np.int64)
+    counts = np.maximum(stop - first, 0)
+    if counts.sum() == 0:
+        return labels
+
+    edge = np.repeat(np.arange(len(counts)), counts)
+    row = first[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    yc = row + 0.5
+    x = x0[edge] + (yc - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+    geometry = owner[edge]
+
+    order = np.lexsort((x, row, geometry))
+    x, row, geometry = x[order], row[order], geometry[order]
+    # Closed rings cross every row an even number of times: pair them up
+    start_x, end_x = x[0::2], x[1::2]
+    span_row, span_geometry = row[0::2], geometry[0::2]
+
+    # Columns whose centre lies in [start_x, end_x)
+    col_first = np.clip(np.ceil(start_x - 0.5), 0, width).astype(np.int64)
+    col_stop = np.clip(np.ceil(end_x - 0.5), 0, width).astype(np.int64)
+    lengths = np.maximum(col_stop - col_first, 0)
+    span = np.repeat(np.arange(len(lengths)), lengths)
+    cols = col_first[span] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    labels[span_row[span], cols] = span_geometry[span] + 1
+    return labels
+
+
+def outline_mask(geometries, bounds, width, height):
+    """Boolean image of the pixels touched by the polygon boundaries"""
+    mask = np.zeros((height, width), dtype=bool)
+    if len(geometries) == 0:
+        return mask
+    x0, y0, x1, y1, _ = _edges(np.asarray(geometries, dtype=object), bounds, width, height)
+    steps = np.ceil(np.maximum(np.abs(x1 - x0), np.abs(y1 - y0))).astype(np.int64) + 1
+    edge = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.maximum(steps[edge] - 1, 1)
+    cols = np.floor(x0[edge] + t * (x1[edge] - x0[edge])).astype(np.int64)
+    rows = np.floor(y0[edge] + t * (y1[edge] - y0[edge])).astype(np.int64)
+    inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+    mask[rows[inside], cols[inside]] = True
+    return mask
+
+
+def linear_colors(values, ramp='population', vmin=None, vmax=None, alpha=255):
+    """(n, 4) uint8 RGBA colors interpolated along a ramp; NaN -> MISSING_COLOR"""
+    values = np.asarray(values, dtype=float)
+    start, end = (np.array(c, dtype=float) for c in COLOR_RAMPS.get(ramp, ramp))
+    finite = np.isfinite(values)
+    vmin = np.nanmin(values) if vmin is None and finite.any() else (vmin or 0.0)
+    vmax = np.nanmax(values) if vmax is None and finite.any() else (vmax or 1.0)
+    t = np.clip((values - vmin) / (vmax - vmin), 0, 1) if vmax > vmin else np.zeros_like(values)
+    colors = np.empty((len(values), 4), dtype=np.uint8)
+    colors[:, :3] = np.rint(start + np.nan_to_num(t)[:, None] * (end - start))
+    colors[:, 3] = alpha
+    colors[~finite] = MISSING_COLOR
+    return colors
+
+
+def colorize(labels, colors, outline=None, background=(0, 0, 0, 0)):
+    """RGBA image from a label image and one color per geometry"""
+    palette = np.vstack([np.array(background, dtype=np.uint8), np.asarray(colors, dtype=np.uint8)])
+    image = palette[labels]
+    if outline is not None:
+        image[outline] = OUTLINE_COLOR
+    return image
+
+
+def fit_bounds(bounds, width, padding=0.02):
+    """Padded bounds and an image height keeping the aspect ratio for `width`"""
+    xmin, ymin, xmax, ymax = bounds
+    pad = padding * max(xmax - xmin, ymax - ymin, 1e-9)
+    bounds = (xmin - pad, ymin - pad, xmax + pad, ymax + pad)
+    height = max(1, int(round(width * (bounds[3] - bounds[1]) / (bounds[2] - bounds[0]))))
+    return bounds, height
+
+
+def render_zones(geometries, values, width=1024, ramp='population', outline=True, background=(255, 255, 255, 255)):
+    """RGBA image of lon/lat zone polygons colored by `values`"""
+    import shapely
+
+    projected = to_mercator(geometries)
+    bounds, height = fit_bounds(shapely.total_bounds(projected), width)
+    labels = rasterize(projected, bounds, width, height)
+    mask = outline_mask(projected, bounds, width, height) if outline else None
+    return colorize(labels, linear_colors(values, ramp), mask, background)
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(image, level=6):
+    """PNG bytes of an (height, width, 4) uint8 RGBA image"""
+    height, width, _ = image.shape
+    # Filter type 0 (none) in front of every scanline
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", header)
+            + _chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) + _chunk(b"IEND", b""))
+
+
+def write_png(path, image, level=6):
+    with open(path, "wb") as f:
+        f.write(encode_png(image, level))
@@ -0,0 +1,254 @@
+"""
+Long-lived R worker for the CommutingZones package.
+
+Instead of writing an R script to the working directory and paying R start-up
+and package loading on every call, a single `Rscript` process per server
+process loads CommutingZones, dplyr, sf and arrow once and then serves
+requests over pipes:
+
+    request:  one JSON line {"op": ..., "args": {...}} on stdin
+    response: status byte (A = Arrow IPC stream, E = UTF-8 error message),
+              payload length as a little-endian float64, payload, on a
+              dedicated pipe whose fd is the script's argument
+
+Responses do not share stdout with R: R's own output is sunk to stderr and
+both end up in the worker log, so a package function that prints cannot
+corrupt the framing. Nothing is written to the working directory, so
+concurrent sessions and processes never collide on temp files. Requires the `arrow` R package.
+"""
+
+import atexit
+import collections
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+R_WORKER_SCRIPT = r'''
+# Frames go to their own pipe; anything R prints goes to the log
+output <- file(paste0("/dev/fd/", commandArgs(trailingOnly = TRUE)[1]), "wb")
+sink(stderr())
+
+suppressPackageStartupMessages({
+  library(CommutingZones)
+  library(dplyr)
+  library(jsonlite)
+  library(sf)
+  library(arrow)
+})
+
+data(cz_data)
+
+input <- file("stdin", "r")
+
+send <- function(status, payload) {
+  writeBin(charToRaw(status), output)
+  writeBin(as.double(length(payload)), output, size = 8, endian = "little")
+  writeBin(payload, output)
+  flush(output)
+}
+
+# Arrow cannot hold sf geometry, so it travels as WKT
+as_plain_frame <- function(x) {
+  # location_to_cluster_match returns a list holding the matched points
+  if (is.list(x) && !is.data.frame(x)) {
+    if (!is.null(x$matched_spdf)) {
+      x <- x$matched_spdf
+    } else {
+      frames <- Filter(function(item) is.data.frame(item) || inherits(item, "Spatial"), x)
+      if (length(frames) == 0) stop("result holds no data frame")
+      x <- frames[[1]]
+    }
+  }
+  if (inherits(x, "Spatial")) x <- sf::st_as_sf(x)
+  if (inherits(x, "sf")) {
+    wkt <- sf::st_as_text(sf::st_geometry(x))
+    x <- sf::st_drop_geometry(x)
+    x$geography_wkt <- wkt
+  }
+  as.data.frame(x)
+}
+
+zone_table <- function() {
+  cz_df <- as.data.frame(cz_data)
+  cz_df$geography_wkt <- as.character(cz_data$geography)
+  cz_df$geography <- NULL
+  cz_df
+}
+
+handlers <- list(
+  ping = function(args) data.frame(ok = TRUE),
+  zone_table = function(args) zone_table(),
+  summary = function(args) {
+    zone_table() %>%
+      group_by(country) %>%
+      summarise(
+        total_zones = n(),
+        total_population = sum(win_population, na.rm = TRUE),
+        total_area = sum(area, na.rm = TRUE),
+        avg_population = mean(win_population, na.rm = TRUE),
+        avg_area = mean(area, na.rm = TRUE)
+      )
+  },
+  zip_to_cz = function(args) {
+    data(zip_to_cz)
+    as.data.frame(zip_to_cz)
+  },
+  filter_cluster_file = function(args) {
+    as_plain_frame(filter_cluster_file(args$country_name))
+  },
+  location_to_cluster_match = function(args) {
+    location_df <- as.data.frame(args$location_data)
+    cluster_file <- filter_cluster_file(args$country_name)
+    as_plain_frame(location_to_cluster_match(location_df, cluster_file))
+  }
+)
+
+repeat {
+  line <- readLines(input, n = 1)
+  if (length(line) == 0) break
+  result <- tryCatch({
+    request <- fromJSON(line, simplifyDataFrame = TRUE)
+    handler <- handlers[[request$op]]
+    if (is.null(handler)) stop(paste("unknown op:", request$op))
+    list(status = "A", payload = arrow::write_to_raw(handler(request$args), format = "stream"))
+  }, error = function(e) {
+    list(status = "E", payload = charToRaw(enc2utf8(conditionMessage(e))))
+  })
+  send(result$status, result$payload)
+}
+'''
+
+
+class RWorkerError(RuntimeError):
+    """The R worker could not be started or a request failed in R"""
+
+
+class RWorker:
+    """A persistent Rscript process answering CommutingZones requests"""
+
+    def __init__(self, rscript="Rscript"):
+        self.rscript = rscript
+        self._process = None
+        self._frames = None
+        self._drain = None
+        self._script_path = None
+        self._stderr = collections.deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        if self._script_path is None:
+            fd, self._script_path = tempfile.mkstemp(prefix="cz_worker_", suffix=".R")
+            with os.fdopen(fd, "w") as f:
+                f.write(R_WORKER_SCRIPT)
+        frames_read, frames_write = os.pipe()
+        try:
+            self._process = subprocess.Popen(
+                [self.rscript, "--vanilla", self._script_path, str(frames_write)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                pass_fds=(frames_write,),
+            )
+        except BaseException:
+            os.close(frames_read)
+            raise
+        finally:
+            os.close(frames_write)
+        self._frames = os.fdopen(frames_read, "rb")
+        # Drain the log (stdout and stderr) so R never blocks on a full pipe
+        self._drain = threading.Thread(target=self._drain_stderr, args=(self._process.stdout,),
+                                       name="cz-rworker-stderr", daemon=True)
+        self._drain.start()
+
+    def _drain_stderr(self, stream):
+        for line in iter(stream.readline, b""):
+            self._stderr.append(line.decode("utf-8", "replace").rstrip())
+
+    def _read_exactly(self, size):
+        data = self._frames.read(size)
+        if len(data) != size:
+            self._exited()
+        return data
+
+    def _exited(self):
+        drain = self._drain
+        self.close()
+        # The log holds R's last words once the worker has gone
+        if drain is not None:
+            drain.join(timeout=5)
+        raise RWorkerError("R worker exited unexpectedly:\n" + "\n".join(self._stderr))
+
+    def call(self, op, **args):
+        """Run `op` in the worker and return its result as a pyarrow Table"""
+        request = (json.dumps({"op": op, "args": args}, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if not self.running:
+                self._start()
+            try:
+                self._process.stdin.write(request)
+                self._process.stdin.flush()
+            except BrokenPipeError:
+                self._exited()
+            status = self._read_exactly(1)
+            (length,) = struct.unpack("<d", self._read_exactly(8))
+            payload = self._read_exactly(int(length))
+
+        if status == b"E":
+            raise RWorkerError(payload.decode("utf-8", "replace"))
+        return ipc.open_stream(pa.BufferReader(payload)).read_all()
+
+    def ping(self):
+        return bool(self.call("ping").column("ok")[0].as_py())
+
+    def zone_tables(self):
+        """The full cz_data table (WKT geometry) and the per-country summary"""
+        return self.call("zone_table").to_pandas(), self.call("summary").to_pandas()
+
+    def zip_to_cz(self):
+        return self.call("zip_to_cz").to_pandas()
+
+    def filter_cluster_file(self, country_name=None):
+        return self.call("filter_cluster_file", country_name=country_name).to_pandas()
+
+    def location_to_cluster_match(self, location_data, country_name=None):
+        """Match a DataFrame of locations with lat/long columns to their clusters"""
+        records = location_data.to_dict(orient="records")
+        return self.call("location_to_cluster_match", location_data=records,
+                         country_name=country_name).to_pandas()
+
+    def close(self):
+        process, self._process = self._process, None
+        frames, self._frames = self._frames, None
+        if frames is not None:
+            frames.close()
+        if process is not None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+        if self._script_path is not None and os.path.exists(self._script_path):
+            os.remove(self._script_path)
+            self._script_path = None
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """The R worker shared by all sessions of this process"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RWorker()
+            atexit.register(_worker.close)
+        return _worker
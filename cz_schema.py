@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory schema for the commuting zones table.
+
+The JSON export from R gives object strings for every text column, float64
+or object for the numerics and the full WKT text of every boundary. The
+compact schema stores repeated labels as categoricals, numerics at 32 bits,
+the generation date as a datetime and the geometry as WKB bytes, validated
+and repaired once by cz_geometry (with a `geometry_repair` status column).
+
+Usage: python cz_schema.py commuting_zones_data.json
+"""
+
+import json
+import sys
+
+import pandas as pd
+import pyarrow as pa
+
+# Bump when the compact layout changes so shared copies are rebuilt
+SCHEMA_VERSION = 2
+
+CATEGORY_COLUMNS = ['country', 'region']
+INT32_COLUMNS = ['fbcz_id_num']
+FLOAT32_COLUMNS = ['win_population', 'win_roads_km', 'area']
+DATE_COLUMNS = ['cz_gen_ds']
+WKT_COLUMN = 'geography_wkt'
+WKB_COLUMN = 'geography_wkb'
+
+
+def compact_zone_table(data):
+    """Return a copy of the zone table using the compact schema"""
+    compact = data.copy()
+
+    for column in CATEGORY_COLUMNS:
+        if column in compact:
+            compact[column] = compact[column].astype('category')
+
+    for column in INT32_COLUMNS:
+        if column in compact:
+            compact[column] = pd.to_numeric(compact[column]).astype('int32')
+
+    for column in FLOAT32_COLUMNS:
+        if column in compact:
+            compact[column] = pd.to_numeric(compact[column], errors='coerce').astype('float32')
+
+    for column in DATE_COLUMNS:
+        if column in compact:
+            compact[column] = pd.to_datetime(compact[column]).astype('datetime64[s]')
+
+    if WKT_COLUMN in compact:
+        import shapely
+
+        import cz_geometry
+
+        geometries, status = cz_geometry.repair_geometries(compact[WKT_COLUMN].to_numpy(dtype=object))
+        # Arrow-backed binary avoids a Python bytes object per zone
+        wkb = pa.array(shapely.to_wkb(geometries), type=pa.binary())
+        compact[WKB_COLUMN] = pd.Series(pd.arrays.ArrowExtensionArray(wkb), index=compact.index)
+        compact[cz_geometry.STATUS_COLUMN] = pd.Categorical(status)
+        compact = compact.drop(columns=[WKT_COLUMN])
+
+    return compact
+
+
+def memory_report(before, after=None):
+    """Per-column memory footprint in bytes, optionally compared to a second frame"""
+    report = pd.DataFrame({
+        'dtype': before.dtypes.astype(str),
+        'bytes': before.memory_usage(deep=True, index=False),
+    })
+    if after is None:
+        report.loc['TOTAL'] = ['', report['bytes'].sum()]
+        return report
+
+    after_usage = after.memory_usage(deep=True, index=False)
+    # The geometry column changes name when WKT becomes WKB
+    if WKT_COLUMN in report.index and WKB_COLUMN in after_usage.index:
+        after_usage = after_usage.rename({WKB_COLUMN: WKT_COLUMN})
+    report['compact_dtype'] = after.dtypes.rename({WKB_COLUMN: WKT_COLUMN}).astype(str)
+    report['compact_bytes'] = after_usage
+    report.loc['TOTAL'] = ['', report['bytes'].sum(), '', report['compact_bytes'].sum()]
+    report['reduction'] = report['bytes'] / report['compact_bytes']
+    return report
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as f:
+        data = pd.DataFrame(json.load(f))
+
+    report = memory_report(data, compact_zone_table(data))
+    print(report.to_string())
+    print(f"\nFootprint reduced {report.loc['TOTAL', 'reduction']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Host-wide shared copy of the commuting zones dataset.
+
+The first server process on a host runs the export once and publishes the
+zone and summary tables as uncompressed Arrow IPC files under /dev/shm.
+Every other process memory-maps those files read-only, so the attribute
+columns and geometry buffers live once in the page cache instead of being
+exported, parsed and held by each worker.
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+DATA_FILE = "data.arrow"
+SUMMARY_FILE = "summary.arrow"
+GEOMETRY_COLUMN = "geography_wkb"
+
+
+def default_root():
+    """Directory holding shared datasets (override with CZ_SHARED_DIR)"""
+    root = os.environ.get("CZ_SHARED_DIR")
+    if root:
+        return root
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/commuting_zones"
+    return os.path.join(tempfile.gettempdir(), "commuting_zones")
+
+
+class SharedDataset:
+    """Zone and summary tables backed by (possibly memory-mapped) Arrow data"""
+
+    def __init__(self, table, summary_table, path=None):
+        self.table = table
+        self.summary_table = summary_table
+        self.path = path
+        # Geometry stays in the Arrow buffer and is only parsed on request;
+        # split_blocks keeps each numeric column a view on the Arrow buffer
+        # instead of consolidating them into freshly allocated 2D blocks
+        attributes = table
+        if GEOMETRY_COLUMN in table.column_names:
+            attributes = table.drop_columns([GEOMETRY_COLUMN])
+        self.data = attributes.to_pandas(split_blocks=True)
+        self.summary = summary_table.to_pandas(split_blocks=True)
+
+    @classmethod
+    def from_frames(cls, data, summary):
+        """Wrap in-process DataFrames without publishing them"""
+        return cls(pa.Table.from_pandas(data, preserve_index=False),
+                   pa.Table.from_pandas(summary, preserve_index=False))
+
+    @property
+    def shared(self):
+        return self.path is not None
+
+    def geometries(self, positions):
+        """Parse the WKB geometry of the given row positions"""
+        import shapely
+
+        wkb = self.table.column(GEOMETRY_COLUMN).take(pa.array(positions, type=pa.int64()))
+        return shapely.from_wkb(wkb.to_numpy(zero_copy_only=False))
+
+
+def column_digest(dataset, columns, salt=""):
+    """Short hash of the Arrow buffers of some columns of a dataset
+
+    Used to version files derived from those columns (tiles, assets), so
+    they are only rebuilt when the data they depend on changes.
+    """
+    digest = hashlib.sha256(salt.encode())
+    for name in columns:
+        for chunk in dataset.table.column(name).chunks:
+            for buffer in chunk.buffers():
+                if buffer is not None:
+                    digest.update(buffer)
+    return digest.hexdigest()[:16]
+
+
+def _write_table(table, path):
+    with pa.OSFile(path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    # Reading from a memory map returns buffers that point into the mapping
+    return ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def publish_dataset(data, summary, directory):
+    """Atomically write the zone and summary tables to `directory`"""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=parent)
+    try:
+        _write_table(pa.Table.from_pandas(data, preserve_index=False),
+                     os.path.join(staging, DATA_FILE))
+        _write_table(pa.Table.from_pandas(summary, preserve_index=False),
+                     os.path.join(staging, SUMMARY_FILE))
+        os.chmod(staging, 0o755)
+        os.rename(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def attach_dataset(directory):
+    """Memory-map a published dataset read-only"""
+    return SharedDataset(_read_table(os.path.join(directory, DATA_FILE)),
+                         _read_table(os.path.join(directory, SUMMARY_FILE)),
+                         path=directory)
+
+
+def load_shared_dataset(build, key="cz_data", root=None):
+    """Attach to the shared dataset `key`, building it first if needed
+
+    `build` is called with no arguments and must return the (data, summary)
+    DataFrames. It runs at most once per host: concurrent processes wait on a
+    file lock and then attach to the result. Delete the dataset directory (or
+    bump `key`) to force a rebuild.
+    """
+    root = root or default_root()
+    directory = os.path.join(root, key)
+    if os.path.isdir(directory):
+        return attach_dataset(directory)
+
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, f".{key}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.isdir(directory):
+                data, summary = build()
+                publish_dataset(data, summary, directory)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return attach_dataset(directory)
@@ -0,0 +1,357 @@
+"""
+Point-to-zone assignment for commuting zones.
+
+ZoneIndex answers exact point-in-polygon queries with a shapely STRtree over
+the zone boundaries. ZoneGrid puts a precomputed quadtree of cells over the
+extent of the zones in front of it: a dense grid at a base level and sorted
+cell keys for refined levels, each cell either lying inside exactly one zone,
+outside every zone, or on a boundary. Most points are answered by array
+indexing and a few binary searches; only points in boundary cells of the
+finest level fall back to the exact test.
+
+Points that fall just outside every zone (coastlines, geocoder jitter) can be
+snapped to the nearest zone within a tolerance in metres. The zones cover the
+whole world, where no single projection keeps distances, so candidates come
+from the lon/lat STRtree within a radius in degrees that is wide enough at the
+point's latitude, and distances are measured around each point (see
+local_distances).
+"""
+
+import os
+
+import numpy as np
+import shapely
+
+EMPTY = -1
+BOUNDARY = -2
+
+GRID_FILE = "zone_grid.npz"
+
+# Global equal-area projection, used for areas and area-weighted centroids
+EQUAL_AREA_CRS = "EPSG:6933"
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = EARTH_RADIUS_M * np.pi / 180
+# Half the circumference: every zone is closer than this
+MAX_DISTANCE_M = np.pi * EARTH_RADIUS_M
+
+
+def project_geometries(geometries, crs=EQUAL_AREA_CRS, source_crs="EPSG:4326"):
+    """Reproject an array of shapely geometries (lon/lat by default) to `crs`"""
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs(source_crs, crs, always_xy=True)
+    return shapely.transform(
+        np.asarray(geometries, dtype=object),
+        lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])),
+    )
+
+
+def local_distances(lon, lat, geometries):
+    """Metres from each point to the lon/lat geometry paired with it
+
+    Every geometry is measured in an equirectangular frame centred on its
+    point, with each vertex's longitude offset scaled by the cosine of its
+    mean latitude with the point. That is accurate to well under a percent
+    over the distances snapping and neighbour searches look at, at any
+    latitude and across the antimeridian.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    # A copy: set_coordinates replaces the array's geometries in place
+    geometries = np.array(geometries, dtype=object)
+    coords, owner = shapely.get_coordinates(geometries, return_index=True)
+    lat0 = lat[owner]
+    dlon = (coords[:, 0] - lon[owner] + 180) % 360 - 180
+    x = dlon * np.cos(np.radians((coords[:, 1] + lat0) / 2))
+    y = coords[:, 1] - lat0
+    shapely.set_coordinates(geometries, np.column_stack([x, y]) * METRES_PER_DEGREE)
+    return shapely.distance(geometries, shapely.points(0.0, 0.0))
+
+
+def degree_radius(lat, metres):
+    """Radius in degrees around points at `lat` that holds everything within `metres`"""
+    reach = np.asarray(metres, dtype=float) / METRES_PER_DEGREE
+    # A degree of longitude is shortest at the highest latitude in reach
+    return reach / np.cos(np.radians(np.minimum(np.abs(lat) + reach, 89.9)))
+
+
+class ZoneIndex:
+    """Exact point-in-polygon lookup of `fbcz_id_num` over a set of zones"""
+
+    def __init__(self, geometries, zone_ids):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.zone_ids = np.asarray(zone_ids, dtype=np.int32)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Index every zone of a cz_shared.SharedDataset"""
+        geometries = dataset.geometries(np.arange(len(dataset.data)))
+        return cls(geometries, dataset.data['fbcz_id_num'].to_numpy())
+
+    @property
+    def bounds(self):
+        return tuple(shapely.total_bounds(self.geometries))
+
+    def query_bounds(self, bounds):
+        """Sorted positions of the zones intersecting a (west, south, east, north) box"""
+        return np.sort(self.tree.query(shapely.box(*bounds), predicate="intersects"))
+
+    def assign(self, lon, lat, snap_tolerance=None):
+        """`fbcz_id_num` of the zone containing each point, EMPTY if none
+
+        With `snap_tolerance` (metres), points outside every zone get the
+        nearest zone within that distance.
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        points = shapely.points(lon, lat)
+        result = np.full(len(points), EMPTY, dtype=np.int32)
+        point_idx, zone_idx = self.tree.query(points, predicate="intersects")
+        # A point on a shared border matches both zones; the first one wins
+        result[point_idx[::-1]] = self.zone_ids[zone_idx[::-1]]
+        if snap_tolerance:
+            self.snap(lon, lat, result, snap_tolerance)
+        return result
+
+    def snap(self, lon, lat, result, snap_tolerance):
+        """Fill EMPTY entries of `result` with the nearest zone within `snap_tolerance` metres"""
+        missing = np.flatnonzero(result == EMPTY)
+        if len(missing):
+            ids, _ = self.nearest(lon[missing], lat[missing], max_distance=snap_tolerance)
+            result[missing] = ids[:, 0]
+        return result
+
+    def nearest(self, lon, lat, k=1, max_distance=None):
+        """The `k` nearest zones of each point and their distances in metres
+
+        Returns (ids, distances), both shaped (n_points, k) and sorted by
+        distance; zones inside `max_distance` are the only candidates and
+        missing neighbours are EMPTY / inf. Points inside a zone have that
+        zone first at distance 0.
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        points = shapely.points(lon, lat)
+        ids = np.full((len(points), k), EMPTY, dtype=np.int32)
+        distances = np.full((len(points), k), np.inf)
+        limit = MAX_DISTANCE_M if max_distance is None else float(max_distance)
+
+        # The zone nearest in degrees bounds the distance to the nearest zone;
+        # near the antimeridian, so does the one nearest across it
+        pending, zone_idx = self.tree.query_nearest(points, all_matches=False)
+        bound = local_distances(lon[pending], lat[pending], self.geometries[zone_idx])
+        far = np.flatnonzero(np.abs(lon[pending]) > 90)
+        if len(far):
+            across = lon[pending[far]] - 360 * np.sign(lon[pending[far]])
+            far_idx, far_zones = self.tree.query_nearest(shapely.points(across, lat[pending[far]]),
+                                                         all_matches=False)
+            far = far[far_idx]
+            bound[far] = np.minimum(bound[far], local_distances(lon[pending[far]], lat[pending[far]],
+                                                                 self.geometries[far_zones]))
+        # Grow a search radius per point until it holds k zones
+        radius = np.minimum(bound if k == 1 else np.maximum(bound * 2, 1000.0), limit)
+        while len(pending):
+            hits, zones = self._query_radius(lon[pending], lat[pending], degree_radius(lat[pending], radius))
+            hit_distances = local_distances(lon[pending[hits]], lat[pending[hits]], self.geometries[zones])
+            within = hit_distances <= radius[hits]
+            hits, zones, hit_distances = hits[within], zones[within], hit_distances[within]
+            counts = np.bincount(hits, minlength=len(pending))
+            done = (counts >= k) | (radius >= limit)
+
+            keep = done[hits]
+            hits, zones, hit_distances = hits[keep], zones[keep], hit_distances[keep]
+            order = np.lexsort((hit_distances, hits))
+            hits, zones, hit_distances = hits[order], zones[order], hit_distances[order]
+            rank = np.arange(len(hits)) - np.searchsorted(hits, hits)
+            top = rank < k
+            ids[pending[hits[top]], rank[top]] = self.zone_ids[zones[top]]
+            distances[pending[hits[top]], rank[top]] = hit_distances[top]
+
+            pending = pending[~done]
+            radius = np.minimum(radius[~done] * 2, limit)
+        return ids, distances
+
+    def _query_radius(self, lon, lat, radius):
+        """(point, zone) pairs of zones within `radius` degrees, also across the antimeridian"""
+        hits, zones = self.tree.query(shapely.points(lon, lat), predicate="dwithin", distance=radius)
+        pairs = [(hits, zones)]
+        for shift in (-360.0, 360.0):
+            # The same points in the next copy of the map, where their search
+            # window overlaps the other side of the ±180° line
+            shifted = lon + shift
+            near = np.flatnonzero((shifted - radius <= 180) & (shifted + radius >= -180))
+            if len(near):
+                near_hits, near_zones = self.tree.query(shapely.points(shifted[near], lat[near]),
+                                                        predicate="dwithin", distance=radius[near])
+                pairs.append((near[near_hits], near_zones))
+        if len(pairs) == 1:
+            return hits, zones
+        hits = np.concatenate([h for h, _ in pairs])
+        zones = np.concatenate([z for _, z in pairs])
+        # A wide window finds a zone in more than one copy
+        _, first = np.unique(hits.astype(np.int64) * len(self.geometries) + zones, return_index=True)
+        return hits[first], zones[first]
+
+    def distance_to_boundary(self, lon, lat):
+        """Metres from each point to the boundary of its zone (NaN outside every zone)"""
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        result = np.full(len(lon), np.nan)
+        point_idx, zone_idx = self.tree.query(shapely.points(lon, lat), predicate="intersects")
+        point_idx, zone_idx = point_idx[::-1], zone_idx[::-1]
+        result[point_idx] = local_distances(lon[point_idx], lat[point_idx],
+                                            shapely.boundary(self.geometries[zone_idx]))
+        return result
+
+
+def _classify(index, boxes):
+    """Zone id for boxes inside one zone, EMPTY outside all, BOUNDARY otherwise"""
+    values = np.full(len(boxes), EMPTY, dtype=np.int32)
+    box_idx, _ = index.tree.query(boxes, predicate="intersects")
+    values[box_idx] = BOUNDARY
+    box_idx, zone_idx = index.tree.query(boxes, predicate="within")
+    values[box_idx] = index.zone_ids[zone_idx]
+    return values
+
+
+class ZoneGrid:
+    """Precomputed quadtree of cells mapping points to zones"""
+
+    def __init__(self, extent, base, level_keys, level_values, index=None):
+        self.extent = tuple(float(v) for v in extent)
+        self.base = base
+        self.level_keys = list(level_keys)
+        self.level_values = list(level_values)
+        self.index = index
+
+    @property
+    def base_level(self):
+        return int(np.log2(self.base.shape[0]))
+
+    @property
+    def max_level(self):
+        return self.base_level + len(self.level_keys)
+
+    @classmethod
+    def build(cls, index, base_level=8, max_level=12):
+        """Classify cells of `index`'s extent down to `max_level`"""
+        minx, miny, maxx, maxy = index.bounds
+        # Pad so points on the outer edge still fall inside the last cell
+        pad_x = (maxx - minx) * 1e-9 or 1e-9
+        pad_y = (maxy - miny) * 1e-9 or 1e-9
+        extent = (minx, miny, maxx + pad_x, maxy + pad_y)
+
+        size = 2 ** base_level
+        rows, cols = np.divmod(np.arange(size * size, dtype=np.int64), size)
+        base = _classify(index, _cell_boxes(extent, base_level, rows, cols)).reshape(size, size)
+
+        level_keys, level_values = [], []
+        rows, cols = np.nonzero(base == BOUNDARY)
+        for level in range(base_level + 1, max_level + 1):
+            # Children of the previous level's boundary cells
+            rows = (rows[:, None] * 2 + np.array([0, 0, 1, 1])).ravel()
+            cols = (cols[:, None] * 2 + np.array([0, 1, 0, 1])).ravel()
+            keys = rows.astype(np.int64) * 2 ** level + cols
+            values = _classify(index, _cell_boxes(extent, level, rows, cols))
+            order = np.argsort(keys)
+            level_keys.append(keys[order])
+            level_values.append(values[order])
+            boundary = values == BOUNDARY
+            rows, cols = rows[boundary], cols[boundary]
+
+        return cls(extent, base, level_keys, level_values, index=index)
+
+    def lookup(self, lon, lat, snap_tolerance=None):
+        """Return (`fbcz_id_num` per point, fraction of points that needed the exact test)
+
+        With `snap_tolerance` (metres), points outside every zone get the
+        nearest zone within that distance.
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        minx, miny, maxx, maxy = self.extent
+        max_level = self.max_level
+
+        scale = 2 ** max_level
+        fx = (lon - minx) / (maxx - minx)
+        fy = (lat - miny) / (maxy - miny)
+        inside = (fx >= 0) & (fx < 1) & (fy >= 0) & (fy < 1)
+        col = np.where(inside, fx * scale, 0).astype(np.int64)
+        row = np.where(inside, fy * scale, 0).astype(np.int64)
+
+        shift = max_level - self.base_level
+        result = np.where(inside, self.base[row >> shift, col >> shift], EMPTY).astype(np.int32)
+
+        for offset, (keys, values) in enumerate(zip(self.level_keys, self.level_values)):
+            pending = np.flatnonzero(result == BOUNDARY)
+            if len(pending) == 0:
+                break
+            level = self.base_level + offset + 1
+            shift = max_level - level
+            cell = (row[pending] >> shift) * 2 ** level + (col[pending] >> shift)
+            result[pending] = values[np.searchsorted(keys, cell)]
+
+        pending = np.flatnonzero(result == BOUNDARY)
+        if len(pending):
+            if self.index is None:
+                raise ValueError("ZoneGrid needs a ZoneIndex for points on zone boundaries")
+            result[pending] = self.index.assign(lon[pending], lat[pending])
+
+        if snap_tolerance:
+            if self.index is None:
+                raise ValueError("ZoneGrid needs a ZoneIndex to snap points to zones")
+            self.index.snap(lon, lat, result, snap_tolerance)
+
+        exact_fraction = len(pending) / len(result) if len(result) else 0.0
+        return result, exact_fraction
+
+    def assign(self, lon, lat, snap_tolerance=None):
+        """`fbcz_id_num` of the zone containing each point, EMPTY if none"""
+        return self.lookup(lon, lat, snap_tolerance)[0]
+
+    @property
+    def nbytes(self):
+        return self.base.nbytes + sum(a.nbytes for a in self.level_keys + self.level_values)
+
+    def save(self, path):
+        """Write the grid arrays to an .npz file (atomically)"""
+        arrays = {"extent": np.array(self.extent), "base": self.base}
+        for level, (keys, values) in enumerate(zip(self.level_keys, self.level_values)):
+            arrays[f"keys_{level}"] = keys
+            arrays[f"values_{level}"] = values
+        staging = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(staging, **arrays)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path, index=None):
+        with np.load(path) as arrays:
+            levels = sum(1 for name in arrays.files if name.startswith("keys_"))
+            return cls(arrays["extent"], arrays["base"],
+                       [arrays[f"keys_{level}"] for level in range(levels)],
+                       [arrays[f"values_{level}"] for level in range(levels)],
+                       index=index)
+
+
+def _cell_boxes(extent, level, rows, cols):
+    minx, miny, maxx, maxy = extent
+    width = (maxx - minx) / 2 ** level
+    height = (maxy - miny) / 2 ** level
+    x0 = minx + cols * width
+    y0 = miny + rows * height
+    return shapely.box(x0, y0, x0 + width, y0 + height)
+
+
+def load_zone_grid(dataset, index=None, **build_options):
+    """Load the grid stored with a shared dataset, building and storing it if missing"""
+    index = index or ZoneIndex.from_dataset(dataset)
+    if dataset.path is None:
+        return ZoneGrid.build(index, **build_options)
+
+    path = os.path.join(dataset.path, GRID_FILE)
+    if os.path.exists(path):
+        return ZoneGrid.load(path, index=index)
+    grid = ZoneGrid.build(index, **build_options)
+    grid.save(path)
+    return grid
@@ -0,0 +1,224 @@
+"""
+Partitioned columnar store of the commuting zones table.
+
+The zone table is written as Parquet, hive-partitioned by country and, inside
+each partition, ordered along a Z-order curve of the zone centroids and split
+into small row groups. Every zone carries its bounding box, so the min/max
+statistics of each row group describe a compact area. query_zones turns
+country/region, population/area range and bbox filters into a pyarrow
+expression that is pushed down to partition pruning and row-group
+statistics, and reads only the requested columns.
+
+Usage: python cz_store.py build [--sample] [--dir zones_parquet] [--force]
+       python cz_store.py query [--country ...] [--bbox W S E N] [--explain] ...
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import cz_schema
+
+STORE_DIR = "zones_parquet"
+BBOX_COLUMNS = ['minx', 'miny', 'maxx', 'maxy']
+
+
+def _z_order(x, y, bounds, bits=16):
+    """Interleave the bits of quantized x/y into a Z-order (Morton) key"""
+    minx, miny, maxx, maxy = bounds
+    scale = 2 ** bits - 1
+    qx = ((x - minx) / ((maxx - minx) or 1) * scale).astype(np.uint64)
+    qy = ((y - miny) / ((maxy - miny) or 1) * scale).astype(np.uint64)
+    key = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(bits):
+        key |= ((qx >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        key |= ((qy >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return key
+
+
+def write_zone_store(data, directory, row_group_size=64):
+    """Write a compact zone table (see cz_schema) as a partitioned Parquet store"""
+    import shapely
+
+    geometries = shapely.from_wkb(data[cz_schema.WKB_COLUMN].to_numpy())
+    bbox = shapely.bounds(geometries).astype(np.float32)
+    centroids = shapely.centroid(geometries)
+    cx, cy = shapely.get_x(centroids), shapely.get_y(centroids)
+
+    table = data.copy()
+    for i, column in enumerate(BBOX_COLUMNS):
+        table[column] = bbox[:, i]
+    table['_z'] = _z_order(cx, cy, shapely.total_bounds(geometries))
+    table['country'] = table['country'].astype(str)
+    table = table.sort_values(['country', '_z'], kind='stable').drop(columns=['_z'])
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=parent)
+    try:
+        pq.write_to_dataset(
+            pa.Table.from_pandas(table, preserve_index=False),
+            staging,
+            partition_cols=['country'],
+            row_group_size=row_group_size,
+            max_rows_per_group=row_group_size,
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        os.rename(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _open(directory):
+    return ds.dataset(directory, format="parquet", partitioning="hive")
+
+
+def zone_filter(country=None, region=None, population=None, area=None, bbox=None):
+    """Build the pyarrow filter expression for a zone query
+
+    `country`/`region` take one value or a list, `population`/`area` a
+    (min, max) pair where either end may be None, and `bbox` a
+    (minx, miny, maxx, maxy) tuple matched against zone bounding boxes.
+    """
+    conditions = []
+    for column, value in (('country', country), ('region', region)):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(ds.field(column).isin(list(value)))
+        else:
+            conditions.append(ds.field(column) == value)
+
+    for column, value_range in (('win_population', population), ('area', area)):
+        if value_range is None:
+            continue
+        low, high = value_range
+        if low is not None:
+            conditions.append(ds.field(column) >= low)
+        if high is not None:
+            conditions.append(ds.field(column) <= high)
+
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        conditions += [
+            ds.field('maxx') >= minx,
+            ds.field('minx') <= maxx,
+            ds.field('maxy') >= miny,
+            ds.field('miny') <= maxy,
+        ]
+
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def query_zones(directory, country=None, region=None, population=None, area=None,
+                bbox=None, columns=None, geometry=False):
+    """Return the zones matching the filters as a DataFrame
+
+    Only `columns` (default: every attribute) are read; the WKB geometry
+    column is added when `geometry` is True.
+    """
+    dataset = _open(directory)
+    if columns is None:
+        columns = [name for name in dataset.schema.names
+                   if name != cz_schema.WKB_COLUMN and name not in BBOX_COLUMNS]
+    columns = list(columns)
+    if geometry and cz_schema.WKB_COLUMN not in columns:
+        columns.append(cz_schema.WKB_COLUMN)
+
+    expression = zone_filter(country, region, population, area, bbox)
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def explain_query(directory, **filters):
+    """Row groups a query reads after partition and statistics pruning"""
+    dataset = _open(directory)
+    expression = zone_filter(**filters)
+    total = read = 0
+    for fragment in dataset.get_fragments():
+        total += fragment.metadata.num_row_groups
+    for fragment in dataset.get_fragments(filter=expression):
+        read += len(fragment.split_by_row_group(expression, schema=dataset.schema))
+    return {
+        'row_groups_total': total,
+        'row_groups_read': read,
+        'fraction_read': read / total if total else 0.0,
+    }
+
+
+def filter_cluster_file(directory, country_name=None):
+    """Python counterpart of the R filter_cluster_file, reading one partition"""
+    return query_zones(directory, country=country_name, geometry=True)
+
+
+def dataset_frame(dataset):
+    """The zone table of a shared dataset with its WKB geometry, ready for write_zone_store"""
+    wkb = dataset.table.column(cz_schema.WKB_COLUMN).to_numpy(zero_copy_only=False)
+    return dataset.data.assign(**{cz_schema.WKB_COLUMN: wkb})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write the store of the current dataset")
+    build.add_argument("--sample", action="store_true", help="use the built-in sample data (no R needed)")
+    build.add_argument("--force", action="store_true", help="replace an existing store")
+    build.add_argument("--row-group-size", type=int, default=64)
+    query = commands.add_parser("query", help="print or save the zones matching the filters")
+    query.add_argument("--country", nargs="+")
+    query.add_argument("--region", nargs="+")
+    query.add_argument("--min-population", type=float)
+    query.add_argument("--max-population", type=float)
+    query.add_argument("--min-area", type=float)
+    query.add_argument("--max-area", type=float)
+    query.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    query.add_argument("--columns", nargs="+", help="columns to read (default: every attribute)")
+    query.add_argument("--output", help="write the zones to this CSV instead of printing them")
+    query.add_argument("--explain", action="store_true", help="only report the row groups the query reads")
+    for command in (build, query):
+        command.add_argument("--dir", default=STORE_DIR, help="store directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if os.path.exists(args.dir):
+            if not args.force:
+                parser.error(f"{args.dir} exists (use --force to replace it)")
+            shutil.rmtree(args.dir)
+        import export_reports
+
+        dataset = export_reports.load_dataset(sample=args.sample)
+        write_zone_store(dataset_frame(dataset), args.dir, row_group_size=args.row_group_size)
+        print(f"{len(dataset.data):,} zones written to {args.dir}")
+        return 0
+
+    filters = dict(country=args.country, region=args.region, bbox=args.bbox,
+                   population=(args.min_population, args.max_population),
+                   area=(args.min_area, args.max_area))
+    if args.explain:
+        plan = explain_query(args.dir, **filters)
+        print(f"{plan['row_groups_read']} of {plan['row_groups_total']} row groups read "
+              f"({plan['fraction_read']:.1%})")
+        return 0
+    zones = query_zones(args.dir, columns=args.columns, **filters)
+    if args.output:
+        zones.to_csv(args.output, index=False)
+        print(f"{len(zones):,} zones written to {args.output}")
+    else:
+        print(zones.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Server-side sorted, filtered and paginated view of the zone table.
+
+ZoneTable keeps the columns native (categoricals and 32-bit numbers) and
+precomputes one sort order per sortable column when it is built. A page
+request then only combines boolean filter masks, walks the precomputed
+order and materializes the requested slice of rows, so sorting and paging
+through every zone in Europe costs the same as a single country. Number
+formatting is left to the display layer (st.column_config).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns shown, in order, with their display labels
+TABLE_COLUMNS = {
+    'fbcz_id': 'Zone ID',
+    'country': 'Country',
+    'region': 'Region',
+    'win_population': 'Population',
+    'area': 'Area (km²)',
+    'win_roads_km': 'Roads (km)',
+}
+SEARCH_COLUMNS = ['fbcz_id', 'region']
+
+
+class ZoneTable:
+    """Sortable, filterable pages over a zone DataFrame"""
+
+    def __init__(self, data, columns=None):
+        columns = [c for c in (columns or TABLE_COLUMNS) if c in data]
+        self.data = data[columns].reset_index(drop=True)
+        self.columns = columns
+        self._orders = {}
+        self._valid = {}
+        for column in columns:
+            values = self.data[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Sort labels alphabetically, not in category order
+                values = values.astype(str).where(values.notna())
+            order = values.sort_values(kind='stable', na_position='last').index.to_numpy()
+            self._orders[column] = order
+            self._valid[column] = int(values.notna().sum())
+
+    def __len__(self):
+        return len(self.data)
+
+    def _order(self, sort_by, ascending):
+        order = self._orders[sort_by]
+        if ascending:
+            return order
+        # Descending keeps missing values at the end
+        valid = self._valid[sort_by]
+        return np.concatenate([order[:valid][::-1], order[valid:]])
+
+    def mask(self, country=None, search=None, min_population=None):
+        """Boolean row mask for the filters (None = no filter)"""
+        mask = np.ones(len(self.data), dtype=bool)
+        if country is not None:
+            mask &= (self.data['country'] == country).to_numpy()
+        if min_population is not None:
+            mask &= (self.data['win_population'] >= min_population).to_numpy()
+        if search:
+            matches = np.zeros(len(self.data), dtype=bool)
+            for column in SEARCH_COLUMNS:
+                if column in self.data:
+                    text = self.data[column].astype(str)
+                    matches |= text.str.contains(search, case=False, regex=False).to_numpy()
+            mask &= matches
+        return mask
+
+    def page(self, page=1, page_size=100, sort_by='win_population', ascending=False, **filters):
+        """(rows of the requested 1-based page, number of matching rows)"""
+        mask = self.mask(**filters)
+        order = self._order(sort_by, ascending)
+        positions = order[mask[order]]
+        start = (max(page, 1) - 1) * page_size
+        return self.data.iloc[positions[start:start + page_size]], len(positions)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Pre-rasterized XYZ tile pyramid of every zone in Europe.
+
+Drawing tens of thousands of polygons with folium is not feasible, so the
+Overview map is a raster layer instead: every zone is projected to Web
+Mercator once and burned into 256 px PNG tiles with cz_raster, one pyramid
+per metric (population, area) from `min_zoom` to `max_zoom`. Tiles are
+written under static/tiles/<version>/, which Streamlit serves at
+/app/static/ when `server.enableStaticServing` is on (.streamlit/config.toml).
+
+The version is a hash of the zone ids, values and geometry, so the pyramid is
+only re-rendered when the dataset changes; all but the few most recent
+versions are removed once a new one is published. Rendering happens at most
+once per host: concurrent processes wait on a file lock, as for cz_shared.
+
+Usage: python cz_tiles.py [--sample] [--max-zoom 7]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import cz_raster
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TILES_DIR = os.path.join(HERE, "static", "tiles")
+STATIC_URL = "app/static/tiles"
+MANIFEST_FILE = "manifest.json"
+TILE_SIZE = 256
+# Bump when the rendering changes so cached pyramids are re-rendered
+TILES_VERSION = 1
+KEEP_VERSIONS = 3
+
+# Metric name -> (zone table column, cz_raster ramp, legend label)
+METRICS = {
+    'population': ('win_population', 'population', 'Population'),
+    'area': ('area', 'area', 'Area (km²)'),
+}
+
+
+def dataset_version(dataset):
+    """Short hash of the zone ids, metric values and geometry of a dataset"""
+    import cz_shared
+
+    columns = ['fbcz_id_num'] + [column for column, _, _ in METRICS.values()] + [cz_shared.GEOMETRY_COLUMN]
+    return cz_shared.column_digest(dataset, columns, salt=f"tiles-{TILES_VERSION}")
+
+
+def _tile_range(bounds, zoom):
+    """Inclusive tile x/y ranges covering mercator `bounds` at `zoom`"""
+    n = 2 ** zoom
+    xmin, ymin, xmax, ymax = np.clip(bounds, 0, 1 - 1e-12)
+    return (int(xmin * n), int(xmax * n)), (int(ymin * n), int(ymax * n))
+
+
+def render_tile_pyramid(geometries, values, directory, min_zoom=3, max_zoom=7, outline_zoom=6):
+    """Render the PNG tiles of every metric in `values` ({metric: array}) to `directory`
+
+    Returns the manifest (bounds, zooms, value ranges and tile counts).
+    """
+    import shapely
+
+    projected = cz_raster.to_mercator(geometries)
+    tree = shapely.STRtree(projected)
+    bounds = shapely.total_bounds(projected)
+    lon_lat = shapely.total_bounds(np.asarray(geometries, dtype=object))
+
+    palettes, ranges = {}, {}
+    for metric, metric_values in values.items():
+        metric_values = np.asarray(metric_values, dtype=float)
+        finite = metric_values[np.isfinite(metric_values)]
+        # The 99th percentile keeps a few outliers from washing out the ramp
+        vmin = float(finite.min()) if len(finite) else 0.0
+        vmax = float(np.percentile(finite, 99)) if len(finite) else 1.0
+        palettes[metric] = cz_raster.linear_colors(metric_values, METRICS[metric][1], vmin, vmax, alpha=190)
+        ranges[metric] = {"vmin": vmin, "vmax": vmax}
+
+    tiles = {metric: 0 for metric in values}
+    for zoom in range(min_zoom, max_zoom + 1):
+        n = 2 ** zoom
+        (x_first, x_last), (y_first, y_last) = _tile_range(bounds, zoom)
+        for x in range(x_first, x_last + 1):
+            for y in range(y_first, y_last + 1):
+                tile_bounds = (x / n, y / n, (x + 1) / n, (y + 1) / n)
+                candidates = np.sort(tree.query(shapely.box(*tile_bounds)))
+                if len(candidates) == 0:
+                    continue
+                labels = cz_raster.rasterize(projected[candidates], tile_bounds, TILE_SIZE, TILE_SIZE)
+                if not labels.any():
+                    continue
+                outline = None
+                if zoom >= outline_zoom:
+                    outline = cz_raster.outline_mask(projected[candidates], tile_bounds, TILE_SIZE, TILE_SIZE)
+                for metric, palette in palettes.items():
+                    path = os.path.join(directory, metric, str(zoom), str(x), f"{y}.png")
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    cz_raster.write_png(path, cz_raster.colorize(labels, palette[candidates], outline))
+                    tiles[metric] += 1
+
+    return {
+        "bounds": [float(v) for v in lon_lat],
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "metrics": ranges,
+        "tiles": tiles,
+    }
+
+
+def load_tile_pyramid(dataset, root=TILES_DIR, **options):
+    """Manifest of the dataset's tile pyramid, rendering it first if needed
+
+    `options` are passed to render_tile_pyramid.
+    """
+    version = dataset_version(dataset)
+    directory = os.path.join(root, version)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, ".tiles.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(manifest_path):
+                    _publish_pyramid(dataset, root, version, **options)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _publish_pyramid(dataset, root, version, **options):
+    started = time.perf_counter()
+    geometries = dataset.geometries(np.arange(len(dataset.data)))
+    values = {metric: dataset.data[column].to_numpy(dtype=float) for metric, (column, _, _) in METRICS.items()}
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=root)
+    try:
+        manifest = render_tile_pyramid(geometries, values, staging, **options)
+        manifest.update(version=version, seconds=round(time.perf_counter() - started, 2))
+        with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(staging, 0o755)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    # Keep a few recent versions for processes still serving an older dataset
+    versions = [os.path.join(root, name) for name in os.listdir(root) if not name.startswith(".")]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def tile_url(manifest, metric, base_url_path=""):
+    """Leaflet URL template of a metric's tiles as served by Streamlit"""
+    prefix = f"/{base_url_path.strip('/')}" if base_url_path.strip("/") else ""
+    return f"{prefix}/{STATIC_URL}/{manifest['version']}/{metric}/{{z}}/{{x}}/{{y}}.png"
+
+
+def overview_map_html(manifest, metric, url, height=500):
+    """A standalone Leaflet page showing the tile layer over OpenStreetMap"""
+    west, south, east, north = manifest["bounds"]
+    start, end = (f"rgb{tuple(c)}" for c in cz_raster.COLOR_RAMPS[METRICS[metric][1]])
+    value_range = manifest["metrics"][metric]
+    label = METRICS[metric][2]
+    return f"""
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<div id="map" style="height: {height - 10}px;"></div>
+<div style="font: 12px sans-serif; margin-top: 2px;">
+  {label}: {value_range['vmin']:,.0f}
+  <span style="display: inline-block; width: 160px; height: 10px; vertical-align: middle;
+               background: linear-gradient(to right, {start}, {end});"></span>
+  {value_range['vmax']:,.0f}+
+</div>
+<script>
+  var map = L.map('map', {{minZoom: 2}});
+  L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
+    attribution: '&copy; OpenStreetMap contributors', maxZoom: 12
+  }}).addTo(map);
+  L.tileLayer('{url}', {{
+    minZoom: {manifest['min_zoom']}, maxNativeZoom: {manifest['max_zoom']}, maxZoom: 12,
+    bounds: [[{south}, {west}], [{north}, {east}]],
+    attribution: 'Commuting Zones: Meta Data for Good'
+  }}).addTo(map);
+  map.fitBounds([[{south}, {west}], [{north}, {east}]]);
+</script>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sample", action="store_true", help="render the built-in sample data (no R needed)")
+    parser.add_argument("--min-zoom", type=int, default=3)
+    parser.add_argument("--max-zoom", type=int, default=7)
+    args = parser.parse_args()
+
+    import export_reports
+    dataset = export_reports.load_dataset(sample=args.sample)
+    manifest = load_tile_pyramid(dataset, min_zoom=args.min_zoom, max_zoom=args.max_zoom)
+    print(f"version {manifest['version']}: {sum(manifest['tiles'].values())} tiles "
+          f"(zoom {manifest['min_zoom']}-{manifest['max_zoom']}) in {manifest.get('seconds', 0)}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
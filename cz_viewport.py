@@ -0,0 +1,96 @@
+"""
+Viewport-clipped map rendering.
+
+Instead of sending a whole country, the viewport maps draw only the zones
+that intersect what the browser shows. st_folium reports the map bounds and
+zoom after every pan or zoom, and each report reruns the page (st_folium
+has no client-side debounce); the app turns them into a query with the
+helpers below:
+
+    parse_view        bounds and zoom out of the st_folium return value
+    quantize_bounds   bounds widened to a grid of map tiles at that zoom, so
+                      small pans map to the same query (and cached layer)
+                      and do not redraw the zones
+    simplify_level    the simplification level for a zoom: the zones in view
+                      are simplified to about a pixel at that zoom
+    fit_view          the centre and zoom showing some bounds, for the
+                      first render before the browser has reported a view
+"""
+
+import math
+
+import numpy as np
+
+TILE_SIZE = 256
+MIN_LEVEL = 4
+MAX_LEVEL = 11
+# Simplification tolerance in screen pixels
+TOLERANCE_PX = 1.0
+# Above this many zones in view, the map asks to zoom in instead
+MAX_VIEW_ZONES = 5000
+MAX_LATITUDE = 85.05112878
+
+
+def parse_view(value):
+    """((west, south, east, north), zoom) of a st_folium return value, or None"""
+    if not value or not value.get("bounds") or value.get("zoom") is None:
+        return None
+    south_west, north_east = value["bounds"].get("_southWest"), value["bounds"].get("_northEast")
+    if not south_west or not north_east or south_west.get("lat") is None:
+        return None
+    bounds = (south_west["lng"], south_west["lat"], north_east["lng"], north_east["lat"])
+    return tuple(float(v) for v in bounds), int(value["zoom"])
+
+
+def _mercator_y(lat):
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    return (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2
+
+
+def _latitude(y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+def quantize_bounds(bounds, zoom):
+    """`bounds` widened outwards to whole tiles at `zoom`
+
+    Pans that stay within the same tiles give the same bounds, so the rerun
+    they trigger hits the cached layer and sends the browser an unchanged
+    layer.
+    """
+    west, south, east, north = bounds
+    n = 2 ** max(zoom, 0)
+    x0 = math.floor((max(west, -180.0) + 180) / 360 * n)
+    x1 = math.ceil((min(east, 180.0) + 180) / 360 * n)
+    # Mercator y grows southwards
+    y0 = max(math.floor(_mercator_y(north) * n), 0)
+    y1 = min(math.ceil(_mercator_y(south) * n), n)
+    return (round(x0 / n * 360 - 180, 6), round(_latitude(y1 / n), 6),
+            round(x1 / n * 360 - 180, 6), round(_latitude(y0 / n), 6))
+
+
+def simplify_level(zoom):
+    """Simplification level (a clamped zoom) used to draw a view at `zoom`"""
+    return int(min(max(zoom, MIN_LEVEL), MAX_LEVEL))
+
+
+def level_tolerance(level):
+    """Simplification tolerance in degrees of longitude for a level"""
+    return TOLERANCE_PX * 360 / (TILE_SIZE * 2 ** level)
+
+
+def simplify_geometries(geometries, level):
+    """Boundaries simplified for drawing at zoom `level`"""
+    import shapely
+
+    return shapely.simplify(np.asarray(geometries, dtype=object), level_tolerance(level), preserve_topology=True)
+
+
+def fit_view(bounds, width=800, height=600):
+    """(centre (lat, lon), zoom) showing `bounds` in a width x height map"""
+    west, south, east, north = bounds
+    x_span = max(east - west, 1e-9) / 360
+    y_span = max(_mercator_y(south) - _mercator_y(north), 1e-9)
+    zoom = math.floor(min(math.log2(width / TILE_SIZE / x_span), math.log2(height / TILE_SIZE / y_span)))
+    centre_y = (_mercator_y(south) + _mercator_y(north)) / 2
+    return (_latitude(centre_y), (west + east) / 2), int(min(max(zoom, 1), 18))
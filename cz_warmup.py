@@ -0,0 +1,109 @@
+"""
+Background cache warm-up for the Streamlit app.
+
+A Warmup runs a list of named steps in a daemon thread so the expensive
+parts of the first page view (dataset export, geometry parsing, aggregates,
+map building) happen before a user asks for them. Pages check which steps are
+finished, serve those from cache and show progress for the rest.
+
+Country popularity is remembered across restarts in a small JSON file so
+the warm-up can prebuild maps for the most requested countries first.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+
+
+class Warmup:
+    """Run warm-up steps in order on a background thread"""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.errors = {}
+        self.timings = {}
+        self._done = {name: threading.Event() for name, _ in self.steps}
+        self._current = None
+        self._thread = threading.Thread(target=self._run, name="cz-warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        for name, step in self.steps:
+            self._current = name
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                # A failed step is left to the normal (cold) code path
+                self.errors[name] = traceback.format_exc()
+            self.timings[name] = time.perf_counter() - started
+            self._done[name].set()
+        self._current = None
+
+    def wait(self, name, timeout=None):
+        """Block until step `name` has run (or `timeout` elapses)"""
+        return self._done[name].wait(timeout)
+
+    def is_done(self, name):
+        return self._done[name].is_set()
+
+    @property
+    def finished(self):
+        return all(event.is_set() for event in self._done.values())
+
+    @property
+    def fraction(self):
+        if not self.steps:
+            return 1.0
+        return sum(event.is_set() for event in self._done.values()) / len(self.steps)
+
+    @property
+    def status(self):
+        if self._current is None:
+            return "done" if self.finished else "starting"
+        return self._current
+
+
+class RequestCounter:
+    """Per-country request counts persisted to a JSON file shared by processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _update(self, change):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                counts = Counter(json.loads(content) if content else {})
+                change(counts)
+                f.seek(0)
+                f.truncate()
+                json.dump(dict(counts), f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def record(self, country):
+        def increment(counts):
+            counts[country] += 1
+        try:
+            self._update(increment)
+        except (OSError, ValueError):
+            pass
+
+    def most_requested(self, n):
+        try:
+            with open(self.path, "r") as f:
+                counts = Counter(json.load(f))
+        except (OSError, ValueError):
+            return []
+        return [country for country, _ in counts.most_common(n)]
@@ -0,0 +1,159 @@
+"""
+Zonal statistics per commuting zone over local raster files.
+
+The zones are burned once per raster grid (transform, shape and CRS) into a
+label raster holding the zone position + 1 for every pixel (0 = no zone).
+The labels are written block by block to a .npy file in a cache directory
+and memory-mapped afterwards, so later runs over any raster on the same grid
+(population, night lights, ...) skip rasterization. zonal_statistics then
+reads the value raster in windows of whole rows, pairs each window with the
+matching slice of the label map and folds it into per-zone sum and count
+with np.bincount, spreading the windows over a process pool. Neither the
+value raster nor the labels are ever held in memory whole: windows hold
+about `block_pixels` pixels (a few rows of a continent-wide raster), so a
+worker's memory does not grow with the raster's width.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_spatial
+
+# Pixels per window: about 100 MB per worker with the float64 values,
+# labels and masks of a window
+BLOCK_PIXELS = 4 * 2**20
+
+
+def _grid_key(profile, geometries):
+    digest = hashlib.sha1()
+    digest.update(repr((tuple(profile['transform']), profile['width'], profile['height'],
+                        str(profile['crs']))).encode())
+    for wkb in shapely.to_wkb(geometries):
+        digest.update(wkb)
+    return digest.hexdigest()[:20]
+
+
+def block_rows_for(width, block_pixels=BLOCK_PIXELS):
+    """Rows per window of a raster `width` pixels wide (at least one)"""
+    return max(1, int(block_pixels) // max(int(width), 1))
+
+
+def _row_windows(height, block_rows):
+    return [(start, min(start + block_rows, height)) for start in range(0, height, block_rows)]
+
+
+def _label_dtype(n_zones):
+    return np.uint16 if n_zones < np.iinfo(np.uint16).max else np.int32
+
+
+def load_zone_labels(raster_path, geometries, cache_dir, block_rows=None, block_pixels=BLOCK_PIXELS):
+    """Path of the memory-mappable label raster for `raster_path`'s grid
+
+    `geometries` are the zone polygons in lon/lat; they are reprojected to
+    the raster's CRS when it differs. Labels are burned `block_rows` rows at
+    a time, by default as many as fit in `block_pixels`.
+    """
+    import rasterio
+    from rasterio import features, windows
+
+    with rasterio.open(raster_path) as src:
+        profile = src.profile
+
+    geometries = np.asarray(geometries, dtype=object)
+    path = os.path.join(cache_dir, f"zone_labels_{_grid_key(profile, geometries)}.npy")
+    if os.path.exists(path):
+        return path
+
+    block_rows = block_rows or block_rows_for(profile['width'], block_pixels)
+    if profile['crs'] is not None and profile['crs'].to_string() != "EPSG:4326":
+        geometries = cz_spatial.project_geometries(geometries, profile['crs'].to_string())
+    tree = shapely.STRtree(geometries)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = f"{path}.{os.getpid()}.tmp.npy"
+    labels = np.lib.format.open_memmap(staging, mode="w+", dtype=_label_dtype(len(geometries)),
+                                       shape=(profile['height'], profile['width']))
+    for start, stop in _row_windows(profile['height'], block_rows):
+        window = windows.Window(0, start, profile['width'], stop - start)
+        bounds = windows.bounds(window, profile['transform'])
+        candidates = tree.query(shapely.box(*bounds))
+        if len(candidates) == 0:
+            continue
+        labels[start:stop] = features.rasterize(
+            ((geometries[i], i + 1) for i in candidates),
+            out_shape=(stop - start, profile['width']),
+            transform=windows.transform(window, profile['transform']),
+            fill=0,
+            dtype=labels.dtype,
+        )
+    labels.flush()
+    del labels
+    os.replace(staging, path)
+    return path
+
+
+def _window_sums(raster_path, labels_path, band, n_labels, row_ranges):
+    """Per-label (sum, count) over a list of row windows"""
+    import rasterio
+    from rasterio import windows
+
+    labels = np.load(labels_path, mmap_mode="r")
+    sums = np.zeros(n_labels)
+    counts = np.zeros(n_labels, dtype=np.int64)
+    with rasterio.open(raster_path) as src:
+        nodata = src.nodatavals[band - 1]
+        for start, stop in row_ranges:
+            values = src.read(band, window=windows.Window(0, start, src.width, stop - start))
+            block_labels = np.asarray(labels[start:stop]).ravel()
+            values = values.ravel().astype(float)
+            valid = (block_labels > 0) & ~np.isnan(values)
+            if nodata is not None:
+                valid &= values != nodata
+            sums += np.bincount(block_labels[valid], weights=values[valid], minlength=n_labels)
+            counts += np.bincount(block_labels[valid], minlength=n_labels)
+    return sums, counts
+
+
+def zonal_statistics(raster_path, geometries, zone_ids, cache_dir, band=1,
+                     block_rows=None, block_pixels=BLOCK_PIXELS, max_workers=None):
+    """Sum, mean and pixel count of a raster band per zone
+
+    Returns a DataFrame indexed by `zone_ids`. Pixels are assigned to the
+    zone containing their centre; nodata and NaN pixels are skipped. Windows
+    are `block_rows` rows, by default as many as fit in `block_pixels`.
+    """
+    import rasterio
+
+    labels_path = load_zone_labels(raster_path, geometries, cache_dir, block_rows=block_rows,
+                                   block_pixels=block_pixels)
+    with rasterio.open(raster_path) as src:
+        height = src.height
+        block_rows = block_rows or block_rows_for(src.width, block_pixels)
+
+    n_labels = len(zone_ids) + 1
+    row_ranges = _row_windows(height, block_rows)
+    sums = np.zeros(n_labels)
+    counts = np.zeros(n_labels, dtype=np.int64)
+
+    if len(row_ranges) > 1 and max_workers != 1:
+        workers = max_workers or os.cpu_count() or 1
+        batches = [row_ranges[i::workers] for i in range(workers) if row_ranges[i::workers]]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_window_sums, raster_path, labels_path, band, n_labels, batch)
+                       for batch in batches]
+            for future in futures:
+                batch_sums, batch_counts = future.result()
+                sums += batch_sums
+                counts += batch_counts
+    else:
+        sums, counts = _window_sums(raster_path, labels_path, band, n_labels, row_ranges)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums[1:] / counts[1:]
+    return pd.DataFrame({'sum': sums[1:], 'mean': means, 'count': counts[1:]},
+                        index=pd.Index(zone_ids, name='fbcz_id_num'))
@@ -146,7 +146,7 @@ def test_app():
         print("✅ All Python dependencies available")
         
         # Test sample data creation
-        from app import create_sample_data
+        from cz_data import create_sample_data
         data, summary = create_sample_data()
         print(f"✅ Sample data created: {len(data)} zones")
         
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Batch export of per-country commuting zone maps and reports.
+
+For every country this writes, under OUTPUT_DIR/<country>/:
+
+    map.html          the folium map of cz_maps.country_map, as in the app
+    map.png           the same zones rasterized headlessly by cz_raster
+    comparison.html   the chart of cz_maps.population_area_comparison
+    zones.csv         the country's zone table
+
+plus OUTPUT_DIR/summary.csv with the per-country totals. Countries are
+rendered on a process pool; every worker memory-maps the shared dataset
+instead of receiving a copy. Each country's manifest.json records a hash of
+its rows and geometry, and countries whose hash is unchanged are skipped, so
+a re-run after a data refresh only renders what changed. Nothing here
+imports app.py or Streamlit, so a worker's errors are reported as raised.
+
+Usage: python export_reports.py OUTPUT_DIR [--countries ...] [--workers N]
+                                [--force] [--sample]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import cz_data
+import cz_schema
+import cz_shared
+
+# Bump when the rendered outputs change so every country is re-exported
+EXPORT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+OUTPUT_FILES = ["map.html", "map.png", "comparison.html", "zones.csv"]
+ZONE_COLUMNS = ['fbcz_id', 'fbcz_id_num', 'region', 'win_population', 'area', 'win_roads_km']
+
+
+def country_slug(country):
+    return re.sub(r"[^A-Za-z0-9]+", "_", country).strip("_").lower()
+
+
+def country_positions(dataset):
+    """{country: row positions} of a shared dataset"""
+    countries = dataset.data['country'].astype(str)
+    return {country: np.flatnonzero(countries.to_numpy() == country) for country in sorted(countries.unique())}
+
+
+def country_fingerprint(dataset, positions, png_width):
+    """Hash of a country's attribute rows, geometry and render options"""
+    digest = hashlib.sha256(f"{EXPORT_VERSION}:{png_width}".encode())
+    rows = dataset.data.iloc[positions]
+    digest.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+    wkb = dataset.table.column(cz_shared.GEOMETRY_COLUMN).take(positions)
+    for value in wkb.to_pylist():
+        digest.update(value or b"")
+    return digest.hexdigest()
+
+
+def is_current(directory, fingerprint):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get("fingerprint") == fingerprint
+            and all(os.path.exists(os.path.join(directory, name)) for name in OUTPUT_FILES))
+
+
+_dataset = None
+
+
+def _worker_dataset(dataset_dir):
+    global _dataset
+    if _dataset is None or _dataset.path != dataset_dir:
+        _dataset = cz_shared.attach_dataset(dataset_dir)
+    return _dataset
+
+
+def export_country(dataset_dir, country, positions, directory, fingerprint, png_width=1200):
+    """Render one country's outputs into `directory`; returns (country, seconds)"""
+    import cz_maps
+    import cz_raster
+
+    started = time.perf_counter()
+    dataset = _worker_dataset(dataset_dir)
+    data = dataset.data
+    geometries = np.empty(len(data), dtype=object)
+    geometries[positions] = dataset.geometries(positions)
+    os.makedirs(directory, exist_ok=True)
+
+    def output(name):
+        # Write beside the target and rename, so readers never see partial files
+        return os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+
+    def publish(name):
+        os.replace(output(name), os.path.join(directory, name))
+
+    map_obj = cz_maps.country_map(data, country, "population", geometries=geometries)
+    map_obj.save(output("map.html"))
+    publish("map.html")
+
+    image = cz_raster.render_zones(geometries[positions], data['win_population'].to_numpy()[positions],
+                                   width=png_width)
+    cz_raster.write_png(output("map.png"), image)
+    publish("map.png")
+
+    chart = cz_maps.population_area_comparison(data, country)
+    chart.write_html(output("comparison.html"), include_plotlyjs="cdn")
+    publish("comparison.html")
+
+    data.iloc[positions][ZONE_COLUMNS].to_csv(output("zones.csv"), index=False)
+    publish("zones.csv")
+
+    with open(output(MANIFEST_FILE), "w") as f:
+        json.dump({"country": country, "fingerprint": fingerprint, "zones": len(positions),
+                   "files": OUTPUT_FILES, "export_version": EXPORT_VERSION}, f, indent=2)
+    publish(MANIFEST_FILE)
+    return country, time.perf_counter() - started
+
+
+def summary_table(data):
+    """Per-country totals, as on the Overview page"""
+    return data.groupby('country', observed=True).agg(
+        total_zones=('fbcz_id', 'size'),
+        total_population=('win_population', 'sum'),
+        total_area=('area', 'sum'),
+        avg_population=('win_population', 'mean'),
+        total_roads_km=('win_roads_km', 'sum'),
+    ).reset_index()
+
+
+def load_dataset(sample=False):
+    """The published shared dataset, exporting it from R first if needed"""
+    if sample:
+        data, summary = cz_data.create_sample_data()
+        return cz_shared.load_shared_dataset(lambda: (cz_schema.compact_zone_table(data), summary),
+                                             key=f"cz_sample_v{cz_schema.SCHEMA_VERSION}")
+    return cz_shared.load_shared_dataset(cz_data.export_commuting_zones_data,
+                                         key=f"cz_data_v{cz_schema.SCHEMA_VERSION}")
+
+
+def export_all(output_dir, dataset, countries=None, workers=None, force=False, png_width=1200, log=print):
+    """Export every (or the given) country, skipping unchanged ones
+
+    Returns {"exported": [...], "skipped": [...], "failed": {country: error}}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    positions = country_positions(dataset)
+    if countries:
+        unknown = sorted(set(countries) - set(positions))
+        if unknown:
+            raise KeyError(f"unknown countries: {', '.join(unknown)}")
+        positions = {country: positions[country] for country in countries}
+
+    summary_table(dataset.data).to_csv(os.path.join(output_dir, "summary.csv"), index=False)
+
+    report = {"exported": [], "skipped": [], "failed": {}}
+    tasks = []
+    for country, rows in positions.items():
+        directory = os.path.join(output_dir, country_slug(country))
+        fingerprint = country_fingerprint(dataset, rows, png_width)
+        if not force and is_current(directory, fingerprint):
+            report["skipped"].append(country)
+        else:
+            tasks.append((dataset.path, country, rows, directory, fingerprint, png_width))
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(export_country, *task): task[1] for task in tasks}
+            for future in as_completed(futures):
+                country = futures[future]
+                try:
+                    _, seconds = future.result()
+                except Exception as e:
+                    report["failed"][country] = str(e)
+                    log(f"FAILED {country}: {e}")
+                else:
+                    report["exported"].append(country)
+                    log(f"{country}: {seconds:.1f}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--countries", nargs="+", help="only export these countries")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPUs)")
+    parser.add_argument("--force", action="store_true", help="re-render unchanged countries too")
+    parser.add_argument("--png-width", type=int, default=1200)
+    parser.add_argument("--sample", action="store_true", help="export the built-in sample data (no R needed)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    dataset = load_dataset(sample=args.sample)
+    report = export_all(args.output_dir, dataset, countries=args.countries, workers=args.workers,
+                        force=args.force, png_width=args.png_width)
+    print(f"{len(report['exported'])} exported, {len(report['skipped'])} unchanged, "
+          f"{len(report['failed'])} failed in {time.perf_counter() - started:.1f}s")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Memory soak test for the Streamlit app.
+
+Runs app.py in-process with Streamlit's AppTest and CZ_MEMPROFILE=1, and
+visits every page and, on the map pages, every country, `--cycles` times.
+After each cycle it collects garbage and records the resident set size and
+the memory traced by tracemalloc. The first cycle warms the caches (the
+dataset, the per-country maps) and is the baseline; memory that keeps
+growing over the following cycles is a leak. The script prints the
+per-cycle figures, the largest allocation sites of the last cycle and the
+per-label summary of cz_memprof, and fails when the growth after the first
+cycle exceeds --max-growth-mb.
+
+Usage: python soak_memory.py [--cycles 4] [--max-growth-mb 50]
+                             [--countries ...] [--pages ...]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGES = ["Overview", "Geographic Maps", "Country Analysis", "Compare Countries", "Zone Details", "Leaderboard",
+         "About"]
+# Pages with a country selector as their first main-area selectbox
+COUNTRY_PAGES = {"Geographic Maps", "Country Analysis", "Zone Details"}
+
+
+def visit(at, page, countries):
+    """Render `page` once per country (once if it has no country selector)"""
+    at.sidebar.selectbox[0].select(page).run()
+    failures = [str(e.value) for e in at.exception]
+    if page in COUNTRY_PAGES:
+        available = list(at.main.selectbox[0].options)
+        for country in countries or available:
+            if country not in available:
+                raise KeyError(f"unknown country: {country}")
+            at.main.selectbox[0].select(country).run()
+            failures += [f"{country}: {e.value}" for e in at.exception]
+    return failures
+
+
+def measure(cz_memprof):
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    return cz_memprof.rss_bytes() / 2**20, traced / 2**20
+
+
+def soak(cycles=4, countries=None, pages=None, log=print):
+    """[(cycle, rss MB, traced MB)] after each cycle through the pages"""
+    os.environ["CZ_MEMPROFILE"] = "1"
+    sys.path.insert(0, HERE)
+    import cz_memprof
+    from streamlit.testing.v1 import AppTest
+
+    cz_memprof.start()
+    at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=300)
+    at.run()
+    results = []
+    for cycle in range(1, cycles + 1):
+        for page in pages or PAGES:
+            failures = visit(at, page, countries)
+            if failures:
+                raise RuntimeError(f"{page}: {failures[0]}")
+        rss, traced = measure(cz_memprof)
+        results.append((cycle, rss, traced))
+        log(f"cycle {cycle}: rss {rss:,.1f} MB, traced {traced:,.1f} MB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--max-growth-mb", type=float, default=50.0,
+                        help="allowed RSS growth after the warm-up cycle")
+    parser.add_argument("--countries", nargs="+", help="only cycle through these countries")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, help="only visit these pages")
+    args = parser.parse_args()
+    if args.cycles < 2:
+        parser.error("--cycles must be at least 2 (the first cycle is the baseline)")
+
+    results = soak(args.cycles, args.countries, args.pages)
+
+    import cz_memprof
+    print("\nLargest live allocation sites:")
+    for site, size, blocks in cz_memprof.current_top_sites():
+        print(f"  {size / 2**20:8.2f} MB {blocks:8d} blocks  {site}")
+    print("\nPer-label totals:")
+    print(cz_memprof.summary().round(2).to_string())
+
+    _, baseline_rss, baseline_traced = results[0]
+    _, final_rss, final_traced = results[-1]
+    growth = final_rss - baseline_rss
+    print(f"\nGrowth after the warm-up cycle: rss {growth:+,.1f} MB, "
+          f"traced {final_traced - baseline_traced:+,.1f} MB")
+    if growth > args.max_growth_mb:
+        print(f"FAIL: RSS grew by more than {args.max_growth_mb:,.0f} MB")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming per-zone aggregation of point data
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_aggregate
+import cz_spatial
+
+
+def make_index():
+    return cz_spatial.ZoneIndex([shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)], [1, 2])
+
+
+def make_points(n=30000, seed=3):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'longitude': rng.uniform(0, 2.5, n),
+        'latitude': rng.uniform(0, 1, n),
+        'amount': rng.lognormal(3, 1, n),
+        'day': rng.choice(['2024-01-01', '2024-01-02'], n),
+    })
+
+
+def test_streamed_chunks_match_in_memory_groupby(tmp_path):
+    points = make_points()
+    path = tmp_path / 'points.csv'
+    points.to_csv(path, index=False)
+
+    result = cz_aggregate.aggregate_points(str(path), make_index(), chunksize=4000,
+                                           value_cols=['amount'], group_cols=['day'])
+
+    zones = make_index().assign(points['longitude'], points['latitude'])
+    matched = points[zones != cz_spatial.EMPTY].assign(fbcz_id_num=zones[zones != cz_spatial.EMPTY])
+    expected = matched.groupby(['fbcz_id_num', 'day'])['amount'].agg(['size', 'sum', 'median'])
+
+    assert result['count'].tolist() == expected['size'].tolist()
+    np.testing.assert_allclose(result['amount_sum'], expected['sum'], rtol=1e-9)
+    np.testing.assert_allclose(result['amount_p50'], expected['median'], rtol=0.03)
+
+
+def test_progress_and_unmatched_points():
+    points = make_points(1000)
+    seen = []
+    aggregator = cz_aggregate.ZoneAggregator(make_index(), value_cols=['amount'])
+    for start in range(0, len(points), 250):
+        aggregator.add(points.iloc[start:start + 250])
+        seen.append(aggregator.rows)
+
+    result = aggregator.result()
+    assert seen == [250, 500, 750, 1000]
+    assert aggregator.unmatched == int((points['longitude'] > 2).sum())
+    assert result['count'].sum() + aggregator.unmatched == 1000
+
+
+def test_join_adds_per_capita_and_color_values():
+    result = cz_aggregate.aggregate_points([make_points(500)], make_index(), value_cols=['amount'])
+    zones = pd.DataFrame({
+        'fbcz_id_num': [1, 2], 'fbcz_id': ['Europe001', 'Europe002'], 'country': ['France', 'France'],
+        'win_population': [1000.0, 0.0], 'area': [10.0, 20.0],
+    })
+
+    joined = cz_aggregate.join_zone_attributes(result, zones)
+    values = cz_aggregate.to_color_values(joined, 'count_per_capita')
+
+    assert joined.loc[0, 'count_per_capita'] == joined.loc[0, 'count'] / 1000
+    assert np.isnan(joined.loc[1, 'count_per_capita'])
+    assert values.name == 'count_per_capita'
+    assert list(values.index) == ['Europe001', 'Europe002']
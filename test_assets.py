@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-hashed static GeoJSON assets
+"""
+
+import gzip
+import http.client
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+import shapely
+
+import cz_assets
+import cz_schema
+import cz_shared
+
+def make_dataset(population=(1000, 2000, 3000)):
+    boxes = [shapely.box(-1, 50, 1, 52), shapely.box(5, 45, 8, 48), shapely.Point(2, 46).buffer(1)]
+    data = pd.DataFrame({
+        'fbcz_id': ['Europe001', 'Europe002', 'Europe003'],
+        'fbcz_id_num': [1, 2, 3],
+        'country': ['United Kingdom', 'France', 'France'],
+        'win_population': list(population),
+        'area': [10.0, 20.0, 30.0],
+        'win_roads_km': [100.0, 200.0, 300.0],
+        'geography_wkt': shapely.to_wkt(boxes),
+    })
+    return cz_shared.SharedDataset.from_frames(cz_schema.compact_zone_table(data), pd.DataFrame())
+
+
+@pytest.fixture
+def published(tmp_path):
+    manifest = cz_assets.load_geojson_assets(make_dataset(), root=str(tmp_path))
+    return manifest, tmp_path / manifest['version']
+
+
+@pytest.fixture
+def server(published):
+    _, directory = published
+    httpd = cz_assets.make_server(port=0, root=str(directory.parent), prefix='/assets', quiet=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(httpd, path, **headers):
+    connection = http.client.HTTPConnection(*httpd.server_address[:2], timeout=10)
+    connection.request('GET', path, headers=headers)
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response, body
+
+
+def test_assets_are_named_after_their_content(published):
+    manifest, directory = published
+    france = manifest['countries']['France']
+    assert france['bounds'] == [1.0, 45.0, 8.0, 48.0]
+    assert [level['min_zoom'] for level in france['levels']] == [min_zoom for _, min_zoom in cz_assets.LEVELS]
+
+    for level in france['levels']:
+        content = (directory / level['file']).read_bytes()
+        assert cz_assets.ASSET_NAME.search(level['file'])['hash'] in level['file']
+        assert gzip.decompress((directory / (level['file'] + '.gz')).read_bytes()) == content
+        collection = json.loads(content)
+        assert [f['id'] for f in collection['features']] == ['Europe002', 'Europe003']
+        assert {'color_population', 'color_area', 'roads'} <= set(collection['features'][0]['properties'])
+    # The simplified circle is smaller than the full-detail one
+    sizes = [level['bytes'] for level in france['levels']]
+    assert sizes[0] < sizes[-1]
+
+
+def test_colors_match_the_inline_map(published):
+    manifest, directory = published
+    france = manifest['countries']['France']
+    # Each country on its own scale, as cz_maps.country_map draws it
+    assert france['scales'] == {'population': [2000.0, 3000.0], 'area': [20.0, 30.0]}
+    assert manifest['countries']['United Kingdom']['scales']['area'] == [10.0, 10.0]
+
+    features = json.loads((directory / france['levels'][0]['file']).read_bytes())['features']
+    population = cz_assets.colormap('population', 2000.0, 3000.0)
+    area = cz_assets.colormap('area', 20.0, 30.0)
+    assert [f['properties']['color_population'] for f in features] == [population(2000), population(3000)]
+    assert [f['properties']['color_area'] for f in features] == [area(20), area(30)]
+
+
+def test_assets_are_republished_only_when_the_data_changes(tmp_path):
+    root = str(tmp_path)
+    first = cz_assets.load_geojson_assets(make_dataset(), root=root)
+    manifest_path = os.path.join(root, first['version'], cz_assets.MANIFEST_FILE)
+    mtime = os.path.getmtime(manifest_path)
+    assert cz_assets.load_geojson_assets(make_dataset(), root=root) == first
+    assert os.path.getmtime(manifest_path) == mtime
+
+    changed = cz_assets.load_geojson_assets(make_dataset((5, 6, 7)), root=root)
+    assert changed['version'] != first['version']
+    files = lambda manifest: {level['file'] for level in manifest['countries']['France']['levels']}
+    assert files(changed) != files(first)
+
+
+def test_server_sends_cacheable_responses(published, server):
+    manifest, _ = published
+    name = manifest['countries']['United Kingdom']['levels'][-1]['file']
+    path = f"/assets/{manifest['version']}/{name}"
+
+    response, body = fetch(server, path)
+    assert response.status == 200
+    assert response.getheader('Cache-Control') == cz_assets.CACHE_FOREVER
+    assert response.getheader('Content-Type') == 'application/geo+json'
+    assert response.getheader('Access-Control-Allow-Origin') == '*'
+    etag = response.getheader('ETag')
+    assert etag == f'"{cz_assets.ASSET_NAME.search(name)["hash"]}"'
+    assert json.loads(body)['features'][0]['id'] == 'Europe001'
+
+    response, empty = fetch(server, path, **{'If-None-Match': etag})
+    assert response.status == 304 and empty == b''
+
+    response, compressed = fetch(server, path, **{'Accept-Encoding': 'gzip, deflate'})
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('ETag') != etag and response.getheader('Vary') == 'Accept-Encoding'
+    assert gzip.decompress(compressed) == body
+
+    response, body = fetch(server, f"/assets/{manifest['version']}/{cz_assets.MANIFEST_FILE}")
+    assert response.status == 200 and response.getheader('Cache-Control') == 'no-cache'
+    assert json.loads(body) == manifest
+
+
+def test_server_refuses_other_paths(published, server):
+    manifest, _ = published
+    name = manifest['countries']['United Kingdom']['levels'][0]['file']
+    for path in [f"/assets/{manifest['version']}/{name}.gz", f"/{manifest['version']}/{name}",
+                 "/assets/../../etc/passwd", "/assets/%2e%2e/%2e%2e/etc/passwd", "/assets/missing.geojson"]:
+        response, _ = fetch(server, path)
+        assert response.status == 404, path
+
+
+def test_asset_map_fetches_the_assets_by_url(published, monkeypatch):
+    manifest, _ = published
+    monkeypatch.delenv('CZ_ASSET_URL', raising=False)
+    url = cz_assets.base_url('/cz/')
+    assert url == '/cz/app/static/geojson'
+    monkeypatch.setenv('CZ_ASSET_URL', 'https://assets.example.org/geojson/')
+    assert cz_assets.base_url('/cz/') == 'https://assets.example.org/geojson'
+    html = cz_assets.asset_map(manifest, 'France', 'area', url).get_root().render()
+    for level in manifest['countries']['France']['levels']:
+        assert f"{url}/{manifest['version']}/{level['file']}" in html
+    assert 'color_area' in html and 'Europe002' not in html
+    # The inline map's popup, tooltip and per-country legend
+    assert 'bindPopup' in html and "bindTooltip('Zone: '" in html
+    assert '.text("Area (km\\u00b2)")' in html
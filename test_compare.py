@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the multi-country comparison layers
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_compare
+import cz_rank
+
+
+def make_zones():
+    boxes = [shapely.box(-1, 50, 1, 52), shapely.box(1, 50, 3, 52), shapely.box(5, 45, 8, 48)]
+    data = pd.DataFrame({
+        'fbcz_id': ['Europe001', 'Europe002', 'Europe003'],
+        'country': pd.Categorical(['United Kingdom', 'United Kingdom', 'France']),
+        'win_population': np.array([1000, 5000, np.nan], dtype='float32'),
+        'area': np.array([10, 20, 30], dtype='float32'),
+        'win_roads_km': np.array([1, 2, 3], dtype='float32'),
+    })
+    return data, np.array(boxes, dtype=object)
+
+
+def test_scale_covers_all_zones():
+    data, _ = make_zones()
+    rankings = cz_rank.RankingIndex(data)
+    assert cz_compare.color_scale(rankings, 'population', upper=1.0) == (1000.0, 5000.0)
+    assert cz_compare.color_scale(rankings, 'area') == (10.0, 30.0)
+
+
+def test_layer_colors_do_not_depend_on_the_selection():
+    data, geometries = make_zones()
+    scale = (0.0, 10000.0)
+    uk = data['country'] == 'United Kingdom'
+    values = data['win_population'].to_numpy(dtype=float)
+
+    layer = cz_compare.country_layer(data[uk], geometries[uk], values[uk], scale)
+    alone = cz_compare.country_layer(data.iloc[[1]], geometries[[1]], values[[1]], scale)
+
+    assert [feature['id'] for feature in layer['features']] == ['Europe001', 'Europe002']
+    assert layer['features'][1]['properties']['color'] == alone['features'][0]['properties']['color']
+    assert layer['bbox'] == [-1.0, 50.0, 3.0, 52.0]
+    geometry = shapely.from_geojson(json.dumps(layer['features'][0]['geometry']))
+    assert shapely.equals(geometry, geometries[0])
+
+
+def test_missing_values_and_boundaries():
+    data, geometries = make_zones()
+    geometries[0] = None
+    values = data['win_population'].to_numpy(dtype=float)
+
+    layer = cz_compare.country_layer(data, geometries, values, (0.0, 10000.0))
+    assert [feature['id'] for feature in layer['features']] == ['Europe002', 'Europe003']
+    missing = layer['features'][1]['properties']
+    assert missing['value'] is None and missing['population'] is None
+    assert missing['color'] == '#c8c8c8'
+
+
+def test_map_spans_every_layer():
+    data, geometries = make_zones()
+    values = data['area'].to_numpy(dtype=float)
+    layers = {country: cz_compare.country_layer(data[mask], geometries[mask], values[mask], (10.0, 30.0), 'area')
+              for country in ['United Kingdom', 'France']
+              for mask in [(data['country'] == country).to_numpy()]}
+
+    assert cz_compare.layer_bounds(layers.values()) == [[45.0, -1.0], [52.0, 8.0]]
+    html = cz_compare.comparison_map(layers, (10.0, 30.0), 'Area (km²)', 'area').get_root().render()
+    assert 'Europe001' in html and 'Europe003' in html
+    # Rendering must not add ids or styles to the cached layers
+    assert set(layers['France']['features'][0]['properties']) == {
+        'fbcz_id', 'country', 'population', 'area', 'value', 'color'}
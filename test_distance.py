@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for blocked zone-to-zone distance matrices
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_distance
+
+
+def make_centroids(n=500, seed=4):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'fbcz_id_num': np.arange(100, 100 + n),
+                         'lon': rng.uniform(-10, 30, n), 'lat': rng.uniform(35, 70, n)})
+
+
+def test_known_distance_london_paris():
+    matrix = cz_distance.haversine_matrix([-0.1276, 2.3522], [51.5072, 48.8566])
+
+    assert matrix.dtype == np.float32
+    assert abs(matrix[0, 1] - 343.5) < 2
+    assert matrix[0, 0] == 0
+
+
+def test_blocks_and_memmap_match_single_pass(tmp_path):
+    centroids = make_centroids()
+    full = cz_distance.haversine_matrix(centroids['lon'], centroids['lat'], block_size=10_000)
+    path = str(tmp_path / 'distances.npy')
+    blocked = cz_distance.haversine_matrix(centroids['lon'], centroids['lat'], block_size=37, path=path)
+
+    np.testing.assert_array_equal(full, blocked)
+    np.testing.assert_array_equal(np.load(path, mmap_mode='r'), full)
+    np.testing.assert_allclose(full, full.T)
+
+
+def test_sparse_cutoff_and_queries():
+    centroids = make_centroids()
+    dense = cz_distance.ZoneDistances.from_centroids(centroids, block_size=64)
+    sparse = cz_distance.ZoneDistances.from_centroids(centroids, block_size=64, max_distance=300)
+
+    expected = dense.matrix[(dense.matrix <= 300) & ~np.eye(len(centroids), dtype=bool)]
+    assert sparse.sparse and sparse.matrix.nnz == len(expected)
+    near = np.argwhere((dense.matrix <= 300) & ~np.eye(len(centroids), dtype=bool))[0]
+    far = np.argwhere(dense.matrix > 300)[0]
+    near_a, near_b = centroids['fbcz_id_num'].to_numpy()[near]
+    far_a, far_b = centroids['fbcz_id_num'].to_numpy()[far]
+    assert sparse.distance(near_a, near_b) == dense.distance(near_a, near_b) == dense.matrix[tuple(near)]
+    assert sparse.distance(far_a, far_b) == np.inf
+    pd.testing.assert_series_equal(sparse.within(100, 300), dense.within(100, 300))
+
+
+def test_sparse_distances_along_the_equator():
+    centroids = pd.DataFrame({'fbcz_id_num': [1, 2, 3], 'lon': [0.0, 1.0, 5.0], 'lat': [0.0, 0.0, 0.0]})
+    sparse = cz_distance.ZoneDistances.from_centroids(centroids, max_distance=300)
+
+    # One degree of a great circle is 111.195 km
+    assert sparse.distance(1, 2) == np.float32(cz_distance.EARTH_RADIUS_KM * np.pi / 180)
+    assert sparse.distance(1, 3) == np.inf
+
+
+def test_zone_centroids_of_squares():
+    # Central Europe, Sydney and Alaska: the projection is global
+    boxes = [shapely.box(10, 50, 10.2, 50.2), shapely.box(151, -34, 151.2, -33.8), shapely.box(-150, 64, -149.8, 64.2)]
+    lon, lat = cz_distance.zone_centroids(boxes)
+
+    np.testing.assert_allclose(lon, [10.1, 151.1, -149.9], atol=1e-3)
+    np.testing.assert_allclose(lat, [50.1, -33.9, 64.1], atol=1e-3)
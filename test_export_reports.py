@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-country batch export with output caching
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import shapely
+
+import cz_schema
+import cz_shared
+import export_reports
+
+
+def make_zones(population_offset=0):
+    boxes = [shapely.box(x, 45, x + 1, 46) for x in range(4)] + [shapely.box(10, 50, 11, 51)]
+    return pd.DataFrame({
+        'region': ['Europe'] * 5,
+        'fbcz_id': [f'Europe{i:03d}' for i in range(1, 6)],
+        'fbcz_id_num': range(1, 6),
+        'cz_gen_ds': ['2023-03-01'] * 5,
+        'win_population': [1000 + population_offset, 2000, 3000, 4000, 5000],
+        'win_roads_km': [10.0, 20.0, 30.0, 40.0, 50.0],
+        'area': [100.0, 200.0, 300.0, 400.0, 500.0],
+        'country': ['France'] * 4 + ['Czech Republic'],
+        'geography_wkt': shapely.to_wkt(boxes),
+    })
+
+
+def publish(tmp_path, key, data):
+    summary = pd.DataFrame({'country': ['France', 'Czech Republic']})
+    return cz_shared.load_shared_dataset(lambda: (cz_schema.compact_zone_table(data), summary),
+                                         key=key, root=str(tmp_path / 'shared'))
+
+
+def test_exports_every_country_and_skips_unchanged(tmp_path):
+    output = str(tmp_path / 'reports')
+    dataset = publish(tmp_path, 'v1', make_zones())
+
+    first = export_reports.export_all(output, dataset, workers=2, log=lambda message: None)
+    again = export_reports.export_all(output, dataset, workers=2, log=lambda message: None)
+
+    assert sorted(first['exported']) == ['Czech Republic', 'France'] and not first['failed']
+    assert sorted(again['skipped']) == ['Czech Republic', 'France'] and not again['exported']
+    france = os.path.join(output, 'france')
+    assert sorted(f for f in os.listdir(france) if not f.startswith('.')) == sorted(
+        export_reports.OUTPUT_FILES + [export_reports.MANIFEST_FILE])
+    with open(os.path.join(france, 'map.png'), 'rb') as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+    assert len(pd.read_csv(os.path.join(france, 'zones.csv'))) == 4
+    summary = pd.read_csv(os.path.join(output, 'summary.csv')).set_index('country')
+    assert summary.loc['France', 'total_population'] == 10000
+
+    # A change in one country's rows only re-renders that country
+    changed = publish(tmp_path, 'v2', make_zones(population_offset=5))
+    update = export_reports.export_all(output, changed, workers=2, log=lambda message: None)
+    assert update['exported'] == ['France'] and update['skipped'] == ['Czech Republic']
+    with open(os.path.join(france, export_reports.MANIFEST_FILE)) as f:
+        assert json.load(f)['zones'] == 4
+
+
+
+def test_workers_report_the_original_error(tmp_path):
+    data = make_zones()
+    # No Czech zone has a boundary left to center its map on
+    data.loc[data['country'] != 'France', 'geography_wkt'] = 'POLYGON EMPTY'
+    dataset = publish(tmp_path, 'v1', data)
+
+    report = export_reports.export_all(str(tmp_path / 'reports'), dataset, workers=1, log=lambda message: None)
+
+    assert report['exported'] == ['France']
+    assert 'NaN' in report['failed']['Czech Republic']
+
+
+def test_workers_do_not_import_streamlit():
+    code = "import sys, export_reports, cz_maps; print('streamlit' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrent geocoding pipeline against a local fake geocoder
+"""
+
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import shapely
+
+import cz_geocode
+import cz_spatial
+
+PLACES = {
+    "Lyon, France": (45.76, 4.84),
+    "Lille, France": (50.63, 3.06),
+    "Metz, France": (49.12, 6.18),
+}
+
+
+class FakeGeocoder(BaseHTTPRequestHandler):
+    """Google-style geocoder: the first request for each address is rate limited"""
+
+    def do_GET(self):
+        server = self.server
+        address = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)["address"][0]
+        with server.lock:
+            server.requests.append(address)
+            server.events.append("request")
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            first = address not in server.seen
+            server.seen.add(address)
+        time.sleep(server.latency)
+
+        if first and server.throttle_first:
+            code, body = 429, {}
+        elif address.startswith("DENIED"):
+            code, body = 200, {"status": "REQUEST_DENIED", "error_message": "The provided API key is invalid."}
+        elif address in PLACES:
+            lat, lng = PLACES[address]
+            code, body = 200, {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+        else:
+            code, body = 200, {"status": "ZERO_RESULTS", "results": []}
+
+        with server.lock:
+            server.active -= 1
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGeocoder)
+    server.lock = threading.Lock()
+    server.requests, server.seen, server.events = [], set(), []
+    server.active = server.max_active = 0
+    server.latency, server.throttle_first = 0.05, False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/geocode/json"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrency_limit_and_tokens_taken_just_before_requests(fake_server, monkeypatch):
+    events = fake_server.events = []
+
+    class RecordingBucket(cz_geocode.TokenBucket):
+        async def acquire(self):
+            await super().acquire()
+            with fake_server.lock:
+                events.append("token")
+
+    monkeypatch.setattr(cz_geocode, "TokenBucket", RecordingBucket)
+    queries = [f"Town {i}, France" for i in range(30)]
+    geocoder = cz_geocode.AsyncGeocoder(url=fake_server.url, concurrency=4, rate=200, burst=4)
+    answers = asyncio.run(geocoder.geocode_all(queries))
+
+    assert len(answers) == 30 and all(a[2] == "ZERO_RESULTS" for a in answers.values())
+    assert fake_server.max_active <= 4
+    # Only requests holding a slot have a token: none are saved up for a burst
+    unspent = 0
+    for event in events:
+        unspent += 1 if event == "token" else -1
+        assert unspent <= 4
+    assert events.count("token") == events.count("request") == 30
+
+
+def test_token_bucket_holds_the_rate():
+    now = [0.0]
+    taken = []
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    async def take(count):
+        bucket = cz_geocode.TokenBucket(rate=10, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(count):
+            await bucket.acquire()
+            taken.append(round(now[0], 6))
+
+    asyncio.run(take(6))
+    # A burst of two, then one token every 1/rate seconds
+    assert taken == [0.0, 0.0, 0.1, 0.2, 0.3, 0.4]
+
+
+def test_retries_and_dataframe_columns(fake_server):
+    fake_server.throttle_first = True
+    data = pd.DataFrame({"location": ["Lyon", "Lille", "Lyon", "Nowhere"],
+                         "country": ["France"] * 4})
+
+    result = cz_geocode.get_location_lat_long(data, url=fake_server.url, backoff=0.01, rate=100)
+
+    assert result["latitude"].round(2).tolist()[:3] == [45.76, 50.63, 45.76]
+    assert result["latitude"].isna().tolist() == [False, False, False, True]
+    assert result["geocode_status"].tolist() == ["OK", "OK", "OK", "ZERO_RESULTS"]
+    # Three distinct addresses, each throttled once
+    assert len(fake_server.requests) == 6
+
+
+def test_checkpoint_resumes_without_repeating_requests(fake_server, tmp_path):
+    checkpoint = str(tmp_path / "geocode.jsonl")
+    data = pd.DataFrame({"location": ["Lyon", "Lille", "Metz"], "country": ["France"] * 3})
+    cz_geocode.get_location_lat_long(data.iloc[:2], url=fake_server.url, checkpoint=checkpoint)
+    with open(checkpoint, "a") as f:
+        f.write('{"query": "Metz')  # interrupted mid-write
+
+    fake_server.requests.clear()
+    result = cz_geocode.get_location_lat_long(data, url=fake_server.url, checkpoint=checkpoint)
+
+    assert fake_server.requests == ["Metz, France"]
+    assert result["latitude"].notna().all()
+    assert len(cz_geocode.load_checkpoint(checkpoint)) == 3
+
+
+def test_commuting_zones_matches_geocoded_rows(fake_server):
+    index = cz_spatial.ZoneIndex([shapely.box(4, 45, 5, 46), shapely.box(2.5, 50, 3.5, 51)], [7, 8])
+    data = pd.DataFrame({"city": ["Lyon", "Lille", "Metz", "Atlantis"], "nation": ["France"] * 4})
+
+    result = cz_geocode.commuting_zones(data, "city", "nation", url=fake_server.url, index=index)
+
+    assert result["fbcz_id_num"].tolist() == [7, 8, cz_spatial.EMPTY, cz_spatial.EMPTY]
+
+
+def test_request_denied_raises(fake_server):
+    geocoder = cz_geocode.AsyncGeocoder(url=fake_server.url)
+
+    with pytest.raises(cz_geocode.GeocodeError, match="API key is invalid"):
+        asyncio.run(geocoder.geocode_all(["DENIED, France"]))
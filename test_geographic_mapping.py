@@ -4,67 +4,32 @@ Test script for geographic mapping functionality
 """
 
 import pandas as pd
-import json
-import subprocess
 import sys
 from shapely.wkt import loads
 import geopandas as gpd
 import folium
 from streamlit_folium import folium_static
 
+import cz_rworker
+
 def test_data_extraction():
-    """Test if we can extract data with geometry from R"""
+    """Test if the persistent R worker starts and answers requests"""
     print("Testing data extraction from R...")
     
-    # Create R script to extract data with geometry
-    r_script = '''
-    library(CommutingZones)
-    library(dplyr)
-    library(jsonlite)
-    library(sf)
-    
-    # Load data
-    data(cz_data)
-    
-    # Convert to data frame and handle geometry
-    cz_df <- as.data.frame(cz_data)
-    
-    # Keep geometry for mapping
-    cz_df$geography_wkt <- as.character(cz_data$geography)
-    
-    # Convert to JSON
-    json_data <- toJSON(cz_df, pretty = TRUE)
-    
-    # Write to file
-    writeLines(json_data, "test_commuting_zones_data.json")
-    
-    cat("Data exported successfully\\n")
-    '''
-    
-    # Write R script to file
-    with open("test_extract_data.R", "w") as f:
-        f.write(r_script)
-    
-    # Run R script
-    result = subprocess.run(["Rscript", "test_extract_data.R"], 
-                          capture_output=True, text=True)
-    
-    if result.returncode == 0:
-        print("✅ R script executed successfully")
-        return True
-    else:
-        print(f"❌ R script failed: {result.stderr}")
-        return False
+    try:
+        if cz_rworker.get_worker().ping():
+            print("✅ R worker started successfully")
+            return True
+    except (OSError, cz_rworker.RWorkerError) as e:
+        print(f"❌ R worker failed: {str(e)}")
+    return False
 
 def test_data_loading():
-    """Test if we can load the JSON data"""
+    """Test if we can load the zone table with geometry from the R worker"""
     print("\nTesting data loading...")
     
     try:
-        with open("test_commuting_zones_data.json", "r") as f:
-            data = json.load(f)
-        
-        df = pd.DataFrame(data)
+        df, _ = cz_rworker.get_worker().zone_tables()
         print(f"✅ Data loaded successfully: {len(df)} rows")
         print(f"   Columns: {list(df.columns)}")
         
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for build-time validation and repair of zone boundaries
+"""
+
+import pandas as pd
+import shapely
+
+import cz_geometry
+import cz_schema
+
+SQUARE_CCW = 'POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))'
+SQUARE_CW = 'POLYGON((0 0, 0 1, 1 1, 1 0, 0 0))'
+BOWTIE = 'POLYGON((0 0, 1 1, 1 0, 0 1, 0 0))'
+UNCLOSED = 'POLYGON((0 0, 1 0, 1 1, 0 1))'
+
+
+def test_repairs_are_applied_and_reported():
+    geometries, status = cz_geometry.repair_geometries(
+        [SQUARE_CCW, SQUARE_CW, BOWTIE, UNCLOSED, None, 'POLYGON EMPTY'])
+
+    assert list(status) == ['ok', 'reoriented', 'made valid (Self-intersection)', 'closed rings',
+                            'missing', 'missing']
+    assert shapely.is_valid(geometries[:4]).all()
+    assert shapely.is_missing(geometries[4:]).all()
+    # The self-intersecting bowtie keeps both of its triangles
+    assert shapely.get_num_geometries(geometries[2]) == 2
+    assert shapely.area(geometries[2]) == 0.5
+
+
+def test_boundaries_that_collapse_when_made_valid_are_missing():
+    geometries, status = cz_geometry.repair_geometries(
+        pd.Series(['POLYGON((0 0, 1 1, 2 2, 0 0))', float('nan'), SQUARE_CCW], dtype=object))
+
+    assert list(status) == ['made valid (Self-intersection); missing', 'missing', 'ok']
+    assert shapely.is_missing(geometries[:2]).all() and shapely.is_valid(geometries[2])
+
+
+def test_polygons_follow_geojson_winding():
+    geometries, _ = cz_geometry.repair_geometries(
+        [SQUARE_CW, 'POLYGON((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 2 1, 2 2, 1 2, 1 1))'])
+
+    exteriors = shapely.get_exterior_ring(geometries)
+    assert shapely.is_ccw(exteriors).all()
+    assert not shapely.is_ccw(shapely.get_interior_ring(geometries[1], 0))
+
+
+def test_compact_table_stores_the_repair_status():
+    raw = pd.DataFrame({
+        'fbcz_id': ['Europe001', 'Europe002', 'Europe003'],
+        'fbcz_id_num': [1, 2, 3],
+        'country': ['France', 'France', 'Spain'],
+        'geography_wkt': [SQUARE_CCW, BOWTIE, UNCLOSED],
+    })
+    compact = cz_schema.compact_zone_table(raw)
+
+    parsed = shapely.from_wkb(compact['geography_wkb'].to_numpy())
+    assert shapely.is_valid(parsed).all()
+    report = cz_geometry.repair_report(compact)
+    assert list(report['fbcz_id']) == ['Europe002', 'Europe003']
+    assert list(report['geometry_repair'].astype(str)) == ['made valid (Self-intersection)', 'closed rings']
+
+
+def test_report_of_a_table_without_status_is_empty():
+    assert cz_geometry.repair_report(pd.DataFrame({'fbcz_id': ['Europe001']})).empty
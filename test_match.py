@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for chunked matching of uploaded files to zones
+"""
+
+import gc
+import gzip
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_match
+import cz_spatial
+
+
+def make_point_matcher():
+    index = cz_spatial.ZoneIndex([shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)], [10, 11])
+    labels = pd.Series(['Europe010', 'Europe011'], index=[10, 11])
+    return cz_match.PointMatcher(index, labels, lon_col='lng', lat_col='lat')
+
+
+def test_points_stream_to_gzip_in_chunks(tmp_path):
+    rng = np.random.default_rng(7)
+    n = 2500
+    points = pd.DataFrame({'site': np.arange(n), 'lng': rng.uniform(-0.5, 2.5, n), 'lat': rng.uniform(0, 1, n)})
+    points.loc[3, 'lng'] = np.nan
+    source = io.BytesIO(points.to_csv(index=False).encode())
+    output = str(tmp_path / 'matched.csv.gz')
+    reports, previews = [], []
+
+    state = cz_match.match_csv(source, make_point_matcher(), output, chunksize=1000,
+                               progress=lambda s: reports.append((s.rows, s.fraction)), preview=previews.append)
+
+    with gzip.open(output, 'rt') as f:
+        result = pd.read_csv(f)
+    inside = points['lng'].between(0, 2, inclusive='neither')
+    expected = np.where(points['lng'] < 1, 10, 11)
+    assert state.rows == n and state.chunks == 3 and state.matched == inside.sum()
+    assert [rows for rows, _ in reports] == [1000, 2000, 2500] and reports[-1][1] == 1.0
+    assert len(previews) == 1 and len(previews[0]) == 1000
+    assert result['site'].tolist() == list(range(n))
+    np.testing.assert_array_equal(result.loc[inside, 'fbcz_id_num'], expected[inside])
+    assert result.loc[~inside, 'fbcz_id'].isna().all()
+    assert (result.loc[inside, 'fbcz_id'] == 'Europe0' + result.loc[inside, 'fbcz_id_num'].astype(int).astype(str)).all()
+
+
+def test_zipcodes_with_and_without_country():
+    zip_table = pd.DataFrame({
+        'zipcode': [10115, 75001, 10115, 2000],
+        'country_iso3': ['DEU', 'FRA', 'USA', 'AUS'],
+        'fbcz_id': ['Europe001', 'Europe002', 'America003', 'Oceania004'],
+        'fbcz_id_num': [1, 2, 3, 4],
+    })
+    upload = "zip,iso3\n10115,deu\n75001,FRA\n02000,AUS\n10115,USA\n99999,FRA\n"
+
+    out = io.StringIO()
+    cz_match.match_csv(io.BytesIO(upload.encode()), cz_match.ZipMatcher(zip_table, 'zip', 'iso3'), out)
+    with_country = pd.read_csv(io.StringIO(out.getvalue()))
+    out = io.StringIO()
+    cz_match.match_csv(io.BytesIO(upload.encode()), cz_match.ZipMatcher(zip_table, 'zip'), out)
+    without_country = pd.read_csv(io.StringIO(out.getvalue()))
+
+    assert with_country['fbcz_id_num'].tolist()[:2] == [1, 2] and with_country['fbcz_id_num'][3] == 3
+    assert with_country['fbcz_id_num'].tolist()[2] == 4 and with_country['fbcz_id_num'].isna().tolist()[4]
+    # 10115 exists in two countries: ambiguous without the country column
+    assert without_country['fbcz_id_num'].isna().tolist() == [True, False, False, True, True]
+
+
+def test_output_parts_are_complete_csvs_as_they_grow(tmp_path):
+    points = pd.DataFrame({'site': np.arange(3000), 'lng': 0.5, 'lat': 0.5})
+    output = str(tmp_path / 'matched.csv.gz')
+    snapshots = []
+
+    def report(state):
+        # Every part on disk reads as a whole CSV while matching goes on
+        snapshots.append(sum(len(pd.read_csv(path)) for path in state.parts))
+
+    state = cz_match.match_csv(io.BytesIO(points.to_csv(index=False).encode()), make_point_matcher(), output,
+                               chunksize=500, progress=report, part_bytes=3000)
+
+    assert snapshots == [500, 1000, 1500, 2000, 2500, 3000]
+    assert len(state.parts) > 1 and state.parts[0] == output
+    assert state.parts[1] == str(tmp_path / 'matched-2.csv.gz')
+    assert all(os.path.getsize(path) <= 3000 for path in state.parts)
+    result = pd.concat([pd.read_csv(path) for path in state.parts])
+    assert result['site'].tolist() == list(range(3000)) and (result['fbcz_id'] == 'Europe010').all()
+
+
+def test_match_outputs_are_removed(tmp_path):
+    output = cz_match.MatchOutput("sites_zones.csv.gz", directory=str(tmp_path))
+    path = output.path
+    assert os.path.basename(os.path.dirname(path)).startswith(cz_match.OUTPUT_PREFIX)
+    with open(path, 'w'):
+        pass
+    assert output.exists
+    url = cz_match.download_url(path, "/explorer/", directory=str(tmp_path))
+    assert url == f"/explorer/app/static/matched/{os.path.basename(output.directory)}/sites_zones.csv.gz"
+    output.remove()
+    assert not os.path.exists(output.directory)
+
+    # Dropping the last reference (the session state going away) removes it too
+    output = cz_match.MatchOutput(directory=str(tmp_path))
+    directory = output.directory
+    del output
+    gc.collect()
+    assert not os.path.exists(directory)
+
+    stale, fresh = (cz_match.MatchOutput(directory=str(tmp_path)) for _ in range(2))
+    os.utime(stale.directory, (0, 0))
+    assert cz_match.remove_stale_outputs(str(tmp_path)) == 1
+    assert not os.path.exists(stale.directory) and os.path.exists(fresh.directory)
+    assert cz_match.output_name("my sites (2024).csv") == "my_sites_2024_zones.csv.gz"
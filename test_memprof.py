@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in memory instrumentation
+"""
+
+import threading
+import tracemalloc
+
+import pytest
+
+import cz_memprof
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+    was_tracing = tracemalloc.is_tracing()
+    monkeypatch.setattr(cz_memprof, "ENABLED", True)
+    if not was_tracing:
+        tracemalloc.start(cz_memprof.TRACE_FRAMES)
+    cz_memprof.clear()
+    yield
+    cz_memprof.clear()
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def allocate(megabytes):
+    return bytearray(megabytes * 2**20)
+
+
+def test_track_records_deltas_and_allocation_sites(profiling):
+    kept = []
+    with cz_memprof.track("allocate"):
+        kept.append(allocate(8))
+        allocate(16)
+
+    [record] = cz_memprof.records()
+    assert record["label"] == "allocate" and record["depth"] == 0
+    assert 8 * 2**20 <= record["traced_delta"] < 9 * 2**20
+    # The temporary 16 MB buffer only shows in the peak
+    assert record["traced_peak"] >= 24 * 2**20
+    site, size, blocks = record["top_sites"][0]
+    assert site.endswith("test_memprof.py:" + str(allocate.__code__.co_firstlineno + 1))
+    assert size >= 8 * 2**20 and blocks >= 1
+
+
+def test_nested_blocks_keep_their_own_peaks(profiling):
+    with cz_memprof.track("outer"):
+        allocate(16)
+        with cz_memprof.track("inner"):
+            allocate(4)
+
+    inner, outer = cz_memprof.records()
+    assert (inner["label"], inner["depth"]) == ("inner", 1)
+    assert (outer["label"], outer["depth"]) == ("outer", 0)
+    assert 4 * 2**20 <= inner["traced_peak"] < 16 * 2**20
+    # The inner block reset tracemalloc's peak, but the outer one still sees its 16 MB
+    assert outer["traced_peak"] >= 16 * 2**20
+
+
+def test_blocks_in_other_threads_do_not_reset_a_peak(profiling):
+    allocated, other_done = threading.Event(), threading.Event()
+
+    def other_session():
+        allocated.wait()
+        with cz_memprof.track("other"):
+            allocate(1)
+        other_done.set()
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    with cz_memprof.track("warmup"):
+        allocate(32)
+        allocated.set()
+        other_done.wait()
+    thread.join()
+
+    records = {record["label"]: record for record in cz_memprof.records()}
+    assert records["warmup"]["traced_peak"] >= 32 * 2**20
+    assert records["other"]["depth"] == 0 and records["other"]["traced_peak"] < 32 * 2**20
+
+
+def test_profiled_functions_and_summary(profiling):
+    @cz_memprof.profiled()
+    def build(megabytes):
+        return allocate(megabytes)
+
+    kept = [build(2), build(2)]
+    summary = cz_memprof.summary()
+    assert summary.loc["build", "calls"] == 2
+    assert summary.loc["build", "traced_delta_mb"] == pytest.approx(4, abs=0.5)
+    assert len(kept) == 2
+
+
+def test_disabled_profiling_records_nothing(monkeypatch):
+    monkeypatch.setattr(cz_memprof, "ENABLED", False)
+    cz_memprof.clear()
+
+    @cz_memprof.profiled("noop")
+    def noop():
+        return 1
+
+    with cz_memprof.track("block"):
+        assert noop() == 1
+    assert cz_memprof.records() == []
+    assert cz_memprof.summary().empty
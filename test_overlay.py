@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for area-weighted interpolation between zones and user polygons
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_overlay
+
+
+def make_layers():
+    # Two zones side by side; three targets cutting across them
+    zones = [shapely.box(10.0, 50.0, 10.2, 50.2), shapely.box(10.2, 50.0, 10.4, 50.2)]
+    targets = [shapely.box(10.0, 50.0, 10.1, 50.2), shapely.box(10.1, 50.0, 10.3, 50.2),
+               shapely.box(10.3, 50.0, 10.4, 50.2)]
+    # Densify so shared edges stay shared after projection
+    return shapely.segmentize(zones, 0.01), shapely.segmentize(targets, 0.01)
+
+
+def build(max_workers=1):
+    zones, targets = make_layers()
+    return cz_overlay.build_overlay_weights(zones, [1, 2], targets, ['a', 'b', 'c'],
+                                            zone_groups=['France', 'Germany'], max_workers=max_workers)
+
+
+def test_extensive_values_are_split_by_area():
+    weights = build()
+    population = pd.DataFrame({'win_population': [1000.0, 3000.0]}, index=pd.Index([1, 2], name='fbcz_id_num'))
+
+    result = weights.zones_to_targets(population)
+
+    np.testing.assert_allclose(result['win_population'], [500, 2000, 1500], rtol=0.01)
+    assert np.isclose(result['win_population'].sum(), 4000, rtol=1e-4)
+
+
+def test_intensive_values_are_area_weighted_means():
+    weights = build()
+    rate = pd.DataFrame({'rate': [1.0, 3.0]}, index=[1, 2])
+
+    result = weights.zones_to_targets(rate, extensive=False)
+
+    np.testing.assert_allclose(result['rate'], [1.0, 2.0, 3.0], rtol=0.01)
+
+
+def test_targets_back_to_zones_and_process_pool(tmp_path):
+    weights = build(max_workers=2)
+    counts = pd.DataFrame({'stores': [2.0, 4.0, 6.0]}, index=['a', 'b', 'c'])
+
+    result = weights.targets_to_zones(counts)
+    np.testing.assert_allclose(result['stores'], [4.0, 8.0], rtol=0.01)
+
+    path = str(tmp_path / 'weights.npz')
+    weights.save(path)
+    loaded = cz_overlay.OverlayWeights.load(path)
+    assert (loaded.matrix != weights.matrix).nnz == 0
+    assert loaded.target_ids.tolist() == ['a', 'b', 'c']
+
+
+def test_cache_round_trips_string_ids(tmp_path):
+    zones, targets = make_layers()
+    zone_ids = pd.Series(['Europe001', 'Europe002'], dtype=object)
+    target_ids = pd.Series(['a', 'b', 'c']).astype('string')
+    path = str(tmp_path / 'weights.npz')
+
+    first = cz_overlay.load_overlay_weights(path, zones, zone_ids, targets, target_ids, max_workers=1)
+    again = cz_overlay.load_overlay_weights(path, zones, zone_ids, targets, target_ids, max_workers=1)
+
+    assert again.zone_ids.tolist() == first.zone_ids.tolist() == ['Europe001', 'Europe002']
+    assert again.target_ids.tolist() == ['a', 'b', 'c']
+    assert (again.matrix != first.matrix).nnz == 0
+    values = pd.DataFrame({'stores': [2.0, 4.0, 6.0]}, index=['a', 'b', 'c'])
+    np.testing.assert_allclose(again.targets_to_zones(values)['stores'], [4.0, 8.0], rtol=0.01)
+
+
+def test_cache_keeps_python_int_ids_and_notices_changed_inputs(tmp_path):
+    zones, targets = make_layers()
+    zone_ids = pd.Series([1, 2], dtype=object)
+    path = str(tmp_path / 'weights.npz')
+    cz_overlay.load_overlay_weights(path, zones, zone_ids, targets, ['a', 'b', 'c'], max_workers=1)
+
+    cached = cz_overlay.load_overlay_weights(path, zones, zone_ids, targets, ['a', 'b', 'c'], max_workers=1)
+    population = pd.DataFrame({'win_population': [1000.0, 3000.0]}, index=[1, 2])
+    np.testing.assert_allclose(cached.zones_to_targets(population)['win_population'], [500, 2000, 1500],
+                               rtol=0.01)
+
+    # The same path with a new target layer is rebuilt, not served stale
+    merged = [shapely.union(targets[0], targets[1]), targets[2]]
+    rebuilt = cz_overlay.load_overlay_weights(path, zones, zone_ids, merged, ['ab', 'c'], max_workers=1)
+    assert rebuilt.target_ids.tolist() == ['ab', 'c']
+    assert cz_overlay.OverlayWeights.load(path).target_ids.tolist() == ['ab', 'c']
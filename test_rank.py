@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the precomputed zone ranking index
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cz_rank
+
+
+def make_zones(n=600, seed=6):
+    rng = np.random.default_rng(seed)
+    population = rng.uniform(1e3, 1e6, n).astype('float32')
+    population[::50] = np.nan
+    return pd.DataFrame({
+        'fbcz_id': [f"Europe{i:04d}" for i in range(n)],
+        'country': pd.Categorical(rng.choice(['Spain', 'France', 'Austria', 'Malta'], n)),
+        'win_population': population,
+        'area': rng.uniform(10, 5000, n).astype('float32'),
+        'win_roads_km': rng.uniform(0, 900, n).astype('float32'),
+    })
+
+
+@pytest.mark.parametrize('metric', list(cz_rank.METRICS))
+def test_top_matches_nlargest(metric):
+    zones = make_zones()
+    rankings = cz_rank.RankingIndex(zones)
+    values = cz_rank.METRICS[metric][1](zones).astype(float)
+
+    expected = zones.assign(value=values).nlargest(10, 'value')
+    assert rankings.top(metric, 10)['fbcz_id'].tolist() == expected['fbcz_id'].tolist()
+
+    france = zones.assign(value=values)[zones['country'] == 'France'].nlargest(15, 'value')
+    top = rankings.top(metric, 15, country='France')
+    assert top['fbcz_id'].tolist() == france['fbcz_id'].tolist()
+    assert top['country_rank'].tolist() == list(range(1, 16))
+    np.testing.assert_allclose(top[metric], france['value'], rtol=1e-6)
+
+
+def test_zone_rank_and_missing_values():
+    zones = make_zones()
+    rankings = cz_rank.RankingIndex(zones)
+    population = zones['win_population']
+
+    zone = zones.iloc[7]
+    europe_rank, country_rank = rankings.zone_rank(zone['fbcz_id'], 'population')
+    assert europe_rank == (population > zone['win_population']).sum() + 1
+    in_country = population[zones['country'] == zone['country']]
+    assert country_rank == (in_country > zone['win_population']).sum() + 1
+
+    assert rankings.zone_rank('Europe0050', 'population') == (0, 0)
+    assert rankings.ranked_count('population') == 600 - 12
+    malta = rankings.ranked_count('population', 'Malta')
+    assert len(rankings.top('population', 1000, country='Malta')) == malta
+    assert len(rankings.top('population', 10, country='Malta', offset=malta - 3)) == 3
+    with pytest.raises(KeyError):
+        rankings.top('population', country='Atlantis')
+
+
+def test_quantile_reads_the_sorted_order():
+    zones = make_zones()
+    rankings = cz_rank.RankingIndex(zones)
+    population = zones['win_population'].dropna().astype(float)
+
+    assert rankings.quantile('population', 0.0) == population.min()
+    assert rankings.quantile('population', 1.0) == population.max()
+    assert rankings.quantile('population', 0.5) == population.quantile(0.5, interpolation='nearest')
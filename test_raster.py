@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the NumPy polygon rasterizer and PNG encoder
+"""
+
+import struct
+import zlib
+
+import numpy as np
+import shapely
+
+import cz_raster
+
+
+def decode_png(data):
+    """Minimal decoder for the unfiltered RGBA PNGs written by cz_raster"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    position, chunks = 8, {}
+    while position < len(data):
+        length, = struct.unpack(">I", data[position:position + 4])
+        kind = data[position + 4:position + 8]
+        body = data[position + 8:position + 8 + length]
+        assert struct.unpack(">I", data[position + 8 + length:position + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = chunks.get(kind, b"") + body
+        position += 12 + length
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width * 4 + 1)
+    return raw[:, 1:].reshape(height, width, 4)
+
+
+def test_rasterize_matches_pixel_centre_containment():
+    geometries = [
+        shapely.Polygon([(1, 1), (30, 3), (25, 28), (5, 20)], holes=[[(10, 10), (15, 10), (15, 15), (10, 15)]]),
+        shapely.MultiPolygon([shapely.box(32, 0, 40, 8), shapely.box(33.3, 12.2, 38.7, 29.9)]),
+        shapely.Point(-3, 15).buffer(6),
+    ]
+    labels = cz_raster.rasterize(geometries, (0, 0, 40, 30), 40, 30)
+
+    rows, cols = np.mgrid[0:30, 0:40] + 0.5
+    expected = np.zeros((30, 40), dtype=np.int32)
+    for i, geometry in enumerate(geometries):
+        expected[shapely.contains_xy(geometry, cols, rows)] = i + 1
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_render_and_png_round_trip():
+    geometries = [shapely.box(-5, 50, 0, 55), shapely.box(0, 50, 2, 58)]
+    image = cz_raster.render_zones(geometries, [1.0, 3.0], width=120)
+
+    assert image.shape[1] == 120 and image.shape[0] > 120
+    decoded = decode_png(cz_raster.encode_png(image))
+    np.testing.assert_array_equal(decoded, image)
+    colors = {tuple(c) for c in image.reshape(-1, 4)}
+    assert (173, 216, 230, 255) in colors and (0, 0, 139, 255) in colors
+    assert cz_raster.OUTLINE_COLOR in colors
+
+
+def test_linear_colors_missing_values():
+    colors = cz_raster.linear_colors([0.0, np.nan, 10.0], 'area')
+
+    assert tuple(colors[0]) == (144, 238, 144, 255)
+    assert tuple(colors[1]) == cz_raster.MISSING_COLOR
+    assert tuple(colors[2]) == (0, 100, 0, 255)
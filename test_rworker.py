@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent R worker protocol, using a Python stand-in for Rscript
+"""
+
+import os
+import stat
+import sys
+
+import pytest
+
+import cz_rworker
+
+FAKE_RSCRIPT = '''#!{python}
+import json, os, struct, sys
+import pyarrow as pa
+
+out = os.fdopen(int(sys.argv[-1]), "wb")
+for line in sys.stdin:
+    request = json.loads(line)
+    # Like an R package function printing on the way
+    print("Matching", request["op"], flush=True)
+    if request["op"] == "crash":
+        print("fatal: lost the cluster file", file=sys.stderr, flush=True)
+        sys.exit(3)
+    if request["op"] == "short":
+        out.write(b"A" + struct.pack("<d", 100) + b"truncated")
+        out.flush()
+        sys.exit(1)
+    if request["op"] == "filter_cluster_file":
+        table = pa.table({{"country": [request["args"]["country_name"]], "fbcz_id": ["Europe001"]}})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        status, payload = b"A", sink.getvalue().to_pybytes()
+    else:
+        status, payload = b"E", ("unknown op: " + request["op"]).encode()
+    out.write(status + struct.pack("<d", len(payload)) + payload)
+    out.flush()
+'''
+
+
+@pytest.fixture
+def worker(tmp_path):
+    path = tmp_path / "Rscript"
+    path.write_text(FAKE_RSCRIPT.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    worker = cz_rworker.RWorker(rscript=str(path))
+    yield worker
+    worker.close()
+
+
+def test_requests_reuse_one_process(worker):
+    first = worker.filter_cluster_file("France")
+    pid = worker._process.pid
+    second = worker.filter_cluster_file("Spain")
+
+    assert first['country'].tolist() == ['France']
+    assert second['country'].tolist() == ['Spain']
+    assert worker._process.pid == pid
+
+
+def test_errors_from_r_are_raised(worker):
+    with pytest.raises(cz_rworker.RWorkerError, match="unknown op: nope"):
+        worker.call("nope")
+    assert worker.running
+
+
+def test_printed_output_does_not_corrupt_the_frames(worker):
+    for country in ["France", "Spain", "Italy"]:
+        assert worker.filter_cluster_file(country)['country'].tolist() == [country]
+    assert "Matching filter_cluster_file" in worker._stderr
+
+
+def test_worker_restarts_after_crash(worker):
+    with pytest.raises(cz_rworker.RWorkerError, match="exited unexpectedly") as error:
+        worker.call("crash")
+    assert "fatal: lost the cluster file" in str(error.value)
+    assert not worker.running
+
+    assert worker.filter_cluster_file("Italy")['country'].tolist() == ['Italy']
+
+
+def test_truncated_frame_is_an_error(worker):
+    with pytest.raises(cz_rworker.RWorkerError, match="exited unexpectedly"):
+        worker.call("short")
+    assert not worker.running
+
+
+def test_script_is_not_written_to_working_directory(worker):
+    worker.filter_cluster_file("France")
+
+    assert os.path.dirname(worker._script_path) != os.getcwd()
+    assert not os.path.exists("extract_data.R")
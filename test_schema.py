@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact zone table schema
+"""
+
+import pandas as pd
+import shapely
+
+import cz_schema
+
+
+def make_raw_table(rows=200):
+    return pd.DataFrame({
+        'region': ['Europe'] * rows,
+        'fbcz_id': [f'Europe{i:03d}' for i in range(rows)],
+        'fbcz_id_num': [float(i) for i in range(rows)],
+        'cz_gen_ds': ['2023-03-01'] * rows,
+        'win_population': [1000.0 * i for i in range(rows)],
+        'win_roads_km': [None] + [12.5] * (rows - 1),
+        'area': [3.25] * rows,
+        'country': ['United Kingdom', 'France'] * (rows // 2),
+        'geography_wkt': [shapely.Point(i / 7, 50 + i / 13).buffer(0.1).wkt for i in range(rows)],
+    })
+
+
+def test_compact_dtypes():
+    compact = cz_schema.compact_zone_table(make_raw_table())
+
+    assert isinstance(compact['country'].dtype, pd.CategoricalDtype)
+    assert isinstance(compact['region'].dtype, pd.CategoricalDtype)
+    assert compact['fbcz_id_num'].dtype == 'int32'
+    assert compact['win_population'].dtype == 'float32'
+    assert compact['win_roads_km'].isna().iloc[0]
+    assert compact['cz_gen_ds'].iloc[0] == pd.Timestamp('2023-03-01')
+    assert 'geography_wkt' not in compact
+
+
+def test_wkb_round_trips_geometry():
+    raw = make_raw_table(4)
+    compact = cz_schema.compact_zone_table(raw)
+
+    parsed = shapely.from_wkb(compact['geography_wkb'].to_numpy())
+    expected = shapely.from_wkt(raw['geography_wkt'].to_numpy())
+    assert shapely.equals(parsed, expected).all()
+
+
+def test_memory_report_shows_reduction():
+    raw = make_raw_table()
+    report = cz_schema.memory_report(raw, cz_schema.compact_zone_table(raw))
+
+    assert report.loc['TOTAL', 'reduction'] > 1.5
+    assert report.loc['geography_wkt', 'compact_dtype'] == 'binary[pyarrow]'
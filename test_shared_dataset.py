@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the host-wide shared dataset
+"""
+
+import pandas as pd
+
+import cz_schema
+import cz_shared
+
+
+def make_frames():
+    data = pd.DataFrame({
+        'fbcz_id': ['Europe001', 'Europe002', 'Europe003'],
+        'win_population': [1000.0, 2000.0, 3000.0],
+        'area': [10.5, 20.5, 30.5],
+        'country': ['United Kingdom', 'United Kingdom', 'France'],
+        'geography_wkt': ['POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))'] * 3,
+    })
+    summary = pd.DataFrame({'country': ['France', 'United Kingdom'], 'total_zones': [1, 2]})
+    return cz_schema.compact_zone_table(data), summary
+
+
+def test_build_runs_once_per_host(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return make_frames()
+
+    first = cz_shared.load_shared_dataset(build, root=str(tmp_path))
+    second = cz_shared.load_shared_dataset(build, root=str(tmp_path))
+
+    assert len(calls) == 1
+    assert first.shared and second.shared
+    pd.testing.assert_frame_equal(first.data, second.data)
+    assert list(second.summary['country']) == ['France', 'United Kingdom']
+
+
+def test_attached_columns_are_read_only_views(tmp_path):
+    dataset = cz_shared.load_shared_dataset(make_frames, root=str(tmp_path))
+    population = dataset.data['win_population'].to_numpy()
+
+    assert population.tolist() == [1000.0, 2000.0, 3000.0]
+    assert not population.flags.writeable
+
+
+def test_geometry_is_parsed_on_request(tmp_path):
+    dataset = cz_shared.load_shared_dataset(make_frames, root=str(tmp_path))
+
+    assert 'geography_wkb' not in dataset.data
+    geometries = dataset.geometries([0, 2])
+    assert len(geometries) == 2
+    assert geometries[1].area == 1.0
+
+
+def test_in_process_fallback_is_not_shared():
+    dataset = cz_shared.SharedDataset.from_frames(*make_frames())
+
+    assert not dataset.shared
+    assert len(dataset.data) == 3
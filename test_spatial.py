@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for exact and grid-based point-to-zone assignment
+"""
+
+import numpy as np
+import pytest
+import shapely
+
+import cz_spatial
+
+
+def make_index():
+    geometries = [
+        shapely.box(0, 0, 1, 1),
+        shapely.box(1, 0, 2, 1),
+        shapely.Polygon([(0, 1), (2, 1), (1, 2)]),
+        shapely.Point(3, 3).buffer(0.5),
+    ]
+    return cz_spatial.ZoneIndex(geometries, [10, 11, 12, 13])
+
+
+def random_points(n=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-0.5, 4, n), rng.uniform(-0.5, 4, n)
+
+
+def test_exact_assignment():
+    index = make_index()
+    result = index.assign([0.5, 1.5, 1.0, 3.0, 5.0], [0.5, 0.5, 1.5, 3.0, 5.0])
+
+    assert result.tolist() == [10, 11, 12, 13, cz_spatial.EMPTY]
+
+
+def test_grid_matches_exact_assignment():
+    index = make_index()
+    grid = cz_spatial.ZoneGrid.build(index, base_level=4, max_level=8)
+    lon, lat = random_points()
+
+    result, exact_fraction = grid.lookup(lon, lat)
+
+    np.testing.assert_array_equal(result, index.assign(lon, lat))
+    assert 0 < exact_fraction < 0.05
+
+
+def test_grid_round_trips_through_npz(tmp_path):
+    index = make_index()
+    grid = cz_spatial.ZoneGrid.build(index, base_level=3, max_level=6)
+    path = str(tmp_path / cz_spatial.GRID_FILE)
+    grid.save(path)
+
+    loaded = cz_spatial.ZoneGrid.load(path, index=index)
+    lon, lat = random_points(2000, seed=2)
+
+    assert loaded.max_level == 6
+    np.testing.assert_array_equal(loaded.assign(lon, lat), grid.assign(lon, lat))
+
+
+def make_european_index():
+    # Two 0.1° squares in central Europe, 0.1° apart along the parallel
+    geometries = [shapely.box(10.0, 50.0, 10.1, 50.1), shapely.box(10.2, 50.0, 10.3, 50.1)]
+    return cz_spatial.ZoneIndex(geometries, [1, 2])
+
+
+def test_nearest_zone_and_distance_in_metres():
+    index = make_european_index()
+    ids, distances = index.nearest([10.05, 10.11, 10.5], [50.05, 50.05, 50.05], k=2)
+
+    assert ids[:, 0].tolist() == [1, 1, 2]
+    assert ids[:, 1].tolist() == [2, 2, 1]
+    assert distances[0, 0] == 0
+    # 0.01° of longitude at 50°N is roughly 715 m
+    assert 650 < distances[1, 0] < 780
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+
+def test_nearest_respects_max_distance():
+    index = make_european_index()
+    ids, distances = index.nearest([10.11, 11.0], [50.05, 50.05], k=2, max_distance=1000)
+
+    assert ids.tolist() == [[1, cz_spatial.EMPTY], [cz_spatial.EMPTY, cz_spatial.EMPTY]]
+    assert np.isinf(distances[1]).all()
+
+
+def test_snap_tolerance_assigns_near_misses():
+    index = make_european_index()
+    lon, lat = [10.101, 10.15, 10.05], [50.05, 50.05, 50.05]
+
+    assert index.assign(lon, lat).tolist() == [cz_spatial.EMPTY, cz_spatial.EMPTY, 1]
+    assert index.assign(lon, lat, snap_tolerance=200).tolist() == [1, cz_spatial.EMPTY, 1]
+
+    grid = cz_spatial.ZoneGrid.build(index, base_level=3, max_level=5)
+    assert grid.assign(lon, lat, snap_tolerance=200).tolist() == [1, cz_spatial.EMPTY, 1]
+
+
+def test_distance_to_boundary():
+    index = make_european_index()
+    distances = index.distance_to_boundary([10.05, 10.09, 10.15], [50.05, 50.05, 50.05])
+
+    assert distances[1] < distances[0]
+    assert 650 < distances[1] < 780
+    assert np.isnan(distances[2])
+
+
+def test_query_bounds_returns_intersecting_zones():
+    index = make_index()
+    assert list(index.query_bounds((0.2, 0.2, 0.4, 0.4))) == [0]
+    assert list(index.query_bounds((0.5, 0.5, 1.5, 1.5))) == [0, 1, 2]
+    # The circle's envelope reaches (2.5, 2.5) but the circle itself does not
+    assert list(index.query_bounds((2.4, 2.4, 2.6, 2.6))) == []
+
+
+def test_distances_hold_outside_europe():
+    from pyproj import Geod
+
+    geod = Geod(ellps="WGS84")
+    # Sydney, northern Norway and Quito, where a European projection is far off
+    for lon0, lat0 in [(151.0, -34.0), (18.9, 69.6), (-78.5, -0.2)]:
+        zone = shapely.box(lon0, lat0, lon0 + 0.1, lat0 + 0.1)
+        index = cz_spatial.ZoneIndex([zone], [7])
+        lon, lat = lon0 + 0.12, lat0 + 0.05
+        ids, distances = index.nearest([lon], [lat])
+
+        _, _, expected = geod.inv(lon0 + 0.1, lat, lon, lat)
+        assert ids[0, 0] == 7
+        assert abs(distances[0, 0] - expected) < 0.005 * expected
+        assert index.assign([lon], [lat], snap_tolerance=1.05 * expected).tolist() == [7]
+        assert index.assign([lon], [lat], snap_tolerance=0.95 * expected).tolist() == [cz_spatial.EMPTY]
+    assert shapely.equals(index.geometries[0], zone)
+
+
+def test_snapping_across_the_antimeridian():
+    index = cz_spatial.ZoneIndex([shapely.box(179.9, -17.1, 180.0, -17.0), shapely.box(170, -17.1, 170.1, -17.0)],
+                                 [1, 2])
+    # 0.05 and 0.01 degrees of longitude at 17 degrees south are about 5.3 and 1.06 km
+    ids, distances = index.nearest([-179.95, -179.99], [-17.05, -17.05])
+    assert ids[:, 0].tolist() == [1, 1]
+    assert 5200 < distances[0, 0] < 5400 and 1000 < distances[1, 0] < 1100
+
+    ids, distances = index.nearest([-179.99], [-17.05], max_distance=5000)
+    assert ids.tolist() == [[1]] and 1000 < distances[0, 0] < 1100
+    ids, distances = index.nearest([-179.99], [-17.05], k=2, max_distance=5000)
+    assert ids.tolist() == [[1, cz_spatial.EMPTY]]
+    assert index.assign([-179.99, -179.95], [-17.05, -17.05], snap_tolerance=5000).tolist() == [1, cz_spatial.EMPTY]
+
+    # And the other way round
+    east = cz_spatial.ZoneIndex([shapely.box(-180.0, 60.0, -179.9, 60.1)], [3])
+    assert east.assign([179.98], [60.05], snap_tolerance=2000).tolist() == [3]
+
+
+def test_grid_without_index_cannot_snap():
+    index = make_european_index()
+    grid = cz_spatial.ZoneGrid.build(index, base_level=3, max_level=5)
+    bare = cz_spatial.ZoneGrid(grid.extent, grid.base, grid.level_keys, grid.level_values)
+
+    assert bare.assign([10.05], [50.05]).tolist() == [1]
+    with pytest.raises(ValueError, match="needs a ZoneIndex"):
+        bare.assign([10.101], [50.05], snap_tolerance=200)
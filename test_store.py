@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for predicate-pushdown queries over the partitioned zone store
+"""
+
+import pandas as pd
+import pytest
+import shapely
+
+import cz_schema
+import cz_store
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    rows = []
+    for c, country in enumerate(['France', 'Spain', 'United Kingdom']):
+        for i in range(200):
+            x, y = c * 20 + (i % 20), (i // 20)
+            rows.append({
+                'region': 'Europe',
+                'fbcz_id': f'Europe{c}{i:03d}',
+                'fbcz_id_num': c * 1000 + i,
+                'cz_gen_ds': '2023-03-01',
+                'win_population': float(i * 1000),
+                'win_roads_km': 10.0,
+                'area': float(i),
+                'country': country,
+                'geography_wkt': shapely.box(x, y, x + 1, y + 1).wkt,
+            })
+    data = cz_schema.compact_zone_table(pd.DataFrame(rows))
+    directory = str(tmp_path_factory.mktemp("store") / cz_store.STORE_DIR)
+    cz_store.write_zone_store(data, directory, row_group_size=16)
+    return directory
+
+
+def test_country_query_matches_filter_cluster_file(store):
+    zones = cz_store.filter_cluster_file(store, "Spain")
+
+    assert len(zones) == 200
+    assert set(zones['country']) == {'Spain'}
+    assert cz_schema.WKB_COLUMN in zones
+
+
+def test_range_and_region_filters(store):
+    zones = cz_store.query_zones(store, country=['France', 'Spain'], region='Europe',
+                                 population=(50000, 60000), columns=['fbcz_id', 'win_population'])
+
+    assert list(zones.columns) == ['fbcz_id', 'win_population']
+    assert len(zones) == 22
+    assert zones['win_population'].between(50000, 60000).all()
+
+
+def test_bbox_query_prunes_row_groups(store):
+    bbox = (2.5, 2.5, 4.5, 3.5)
+    zones = cz_store.query_zones(store, bbox=bbox, geometry=True)
+    boxes = shapely.from_wkb(zones[cz_schema.WKB_COLUMN].to_numpy())
+
+    assert sorted(zones['fbcz_id_num']) == [42, 43, 44, 62, 63, 64]
+    assert shapely.intersects(boxes, shapely.box(*bbox)).all()
+
+    plan = cz_store.explain_query(store, bbox=bbox)
+    assert plan['row_groups_total'] >= 36
+    assert plan['fraction_read'] < 0.1
+
+
+def test_country_filter_prunes_partitions(store):
+    plan = cz_store.explain_query(store, country='United Kingdom', area=(0, 10))
+
+    assert plan['row_groups_total'] == 39
+    assert plan['row_groups_read'] <= 2
+
+
+def test_command_line_queries(store, tmp_path, capsys):
+    output = str(tmp_path / 'zones.csv')
+    assert cz_store.main(['query', '--dir', store, '--country', 'Spain', '--min-population', '190000',
+                          '--columns', 'fbcz_id', 'win_population', '--output', output]) == 0
+    zones = pd.read_csv(output)
+    assert zones['fbcz_id'].tolist() == [f'Europe1{i:03d}' for i in range(190, 200)]
+
+    assert cz_store.main(['query', '--dir', store, '--country', 'France', '--explain']) == 0
+    assert 'row groups read' in capsys.readouterr().out
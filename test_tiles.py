@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached Overview raster tile pyramid
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import cz_schema
+import cz_shared
+import cz_tiles
+
+
+def make_dataset(population=(1000, 2000, 3000)):
+    boxes = [shapely.box(-1, 50, 1, 52), shapely.box(5, 45, 8, 48), shapely.box(20, 60, 25, 63)]
+    data = pd.DataFrame({
+        'fbcz_id': ['Europe001', 'Europe002', 'Europe003'],
+        'fbcz_id_num': [1, 2, 3],
+        'country': ['United Kingdom', 'France', 'Finland'],
+        'win_population': list(population),
+        'area': [10.0, 20.0, 30.0],
+        'geography_wkt': shapely.to_wkt(boxes),
+    })
+    return cz_shared.SharedDataset.from_frames(cz_schema.compact_zone_table(data), pd.DataFrame())
+
+
+def test_pyramid_tiles_cover_the_zones(tmp_path):
+    manifest = cz_tiles.load_tile_pyramid(make_dataset(), root=str(tmp_path), min_zoom=3, max_zoom=5)
+    directory = tmp_path / manifest['version']
+
+    assert manifest['bounds'] == [-1.0, 45.0, 25.0, 63.0]
+    assert manifest['metrics']['population']['vmin'] == 1000
+    tiles = sorted(p.relative_to(directory / 'area').as_posix() for p in (directory / 'area').rglob('*.png'))
+    assert len(tiles) == manifest['tiles']['area'] == manifest['tiles']['population']
+    # Zoom 3 tile 4/2 holds the United Kingdom and France zones
+    assert '3/4/2.png' in tiles
+    url = cz_tiles.tile_url(manifest, 'area', '/cz/')
+    assert url == f"/cz/app/static/tiles/{manifest['version']}/area/{{z}}/{{x}}/{{y}}.png"
+
+
+def test_pyramid_is_rerendered_only_when_the_data_changes(tmp_path):
+    root = str(tmp_path)
+    first = cz_tiles.load_tile_pyramid(make_dataset(), root=root, max_zoom=4)
+    manifest_path = os.path.join(root, first['version'], cz_tiles.MANIFEST_FILE)
+    mtime = os.path.getmtime(manifest_path)
+
+    again = cz_tiles.load_tile_pyramid(make_dataset(), root=root, max_zoom=4)
+    assert again == first and os.path.getmtime(manifest_path) == mtime
+
+    versions = {first['version']}
+    for population in [(5, 6, 7), (8, 9, 10), (11, 12, 13)]:
+        versions.add(cz_tiles.load_tile_pyramid(make_dataset(population), root=root, max_zoom=4)['version'])
+    assert len(versions) == 4
+    remaining = [name for name in os.listdir(root) if not name.startswith('.')]
+    assert len(remaining) == cz_tiles.KEEP_VERSIONS and first['version'] not in remaining
+
+
+def test_overview_html_points_at_the_tiles():
+    manifest = {'version': 'abc', 'bounds': [-1, 45, 25, 63], 'min_zoom': 3, 'max_zoom': 7,
+                'metrics': {'population': {'vmin': 0, 'vmax': 10}}}
+    html = cz_tiles.overview_map_html(manifest, 'population', '/app/static/tiles/abc/population/{z}/{x}/{y}.png')
+
+    assert "L.tileLayer('/app/static/tiles/abc/population/{z}/{x}/{y}.png'" in html
+    assert "maxNativeZoom: 7" in html and "[[45, -1], [63, 25]]" in html
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for viewport-clipped map rendering
+"""
+
+import shapely
+
+import cz_viewport
+
+
+def folium_value(west, south, east, north, zoom):
+    return {"bounds": {"_southWest": {"lat": south, "lng": west}, "_northEast": {"lat": north, "lng": east}},
+            "zoom": zoom}
+
+
+def test_parse_view():
+    assert cz_viewport.parse_view(folium_value(-1, 51, 0.5, 52, 9)) == ((-1.0, 51.0, 0.5, 52.0), 9)
+    assert cz_viewport.parse_view(None) is None
+    # st_folium's default value before the map has reported anything
+    empty = {"bounds": {"_southWest": {"lat": None, "lng": None}, "_northEast": {"lat": None, "lng": None}},
+             "zoom": 6}
+    assert cz_viewport.parse_view(empty) is None
+
+
+def test_quantized_bounds_cover_the_view_and_absorb_small_pans():
+    view = (-1.2, 51.3, 0.4, 52.1)
+    west, south, east, north = cz_viewport.quantize_bounds(view, 8)
+    assert west <= view[0] and south <= view[1] and east >= view[2] and north >= view[3]
+    # One tile at zoom 8 is 1.4 degrees wide
+    assert east - west < view[2] - view[0] + 2 * 360 / 2 ** 8
+
+    nudged = (-1.19, 51.31, 0.41, 52.11)
+    assert cz_viewport.quantize_bounds(nudged, 8) == (west, south, east, north)
+    assert cz_viewport.quantize_bounds(view, 9) != (west, south, east, north)
+
+
+def test_quantized_bounds_stay_on_the_map():
+    west, south, east, north = cz_viewport.quantize_bounds((-250, -89, 250, 89), 2)
+    assert (west, east) == (-180, 180)
+    assert -86 < south < -85 and 85 < north < 86
+
+
+def test_simplification_follows_the_zoom():
+    assert cz_viewport.simplify_level(1) == cz_viewport.MIN_LEVEL
+    assert cz_viewport.simplify_level(18) == cz_viewport.MAX_LEVEL
+    assert cz_viewport.level_tolerance(6) == 2 * cz_viewport.level_tolerance(7)
+
+    circle = shapely.Point(0, 50).buffer(0.5, quad_segs=64)
+    coarse, fine = (cz_viewport.simplify_geometries([circle], level)[0] for level in (5, 11))
+    assert shapely.get_num_coordinates(coarse) < shapely.get_num_coordinates(fine)
+    assert shapely.is_valid(coarse)
+
+
+def test_fit_view_shows_the_bounds():
+    (lat, lon), zoom = cz_viewport.fit_view((-8, 50, 2, 59), width=800, height=600)
+    assert 50 < lat < 59 and lon == -3
+    assert zoom == 5
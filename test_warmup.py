@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the background cache warm-up
+"""
+
+import threading
+
+import cz_warmup
+
+
+def test_steps_run_in_order_and_failures_are_recorded():
+    ran = []
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        ran.append("slow")
+
+    def broken():
+        raise ValueError("no R")
+
+    warmup = cz_warmup.Warmup([
+        ("dataset", slow),
+        ("maps", broken),
+        ("aggregates", lambda: ran.append("aggregates")),
+    ]).start()
+
+    assert not warmup.is_done("dataset")
+    assert warmup.fraction == 0.0
+    release.set()
+    assert warmup.wait("aggregates", timeout=5)
+
+    assert ran == ["slow", "aggregates"]
+    assert warmup.finished and warmup.status == "done"
+    assert "no R" in warmup.errors["maps"]
+
+
+def test_request_counter_ranks_countries(tmp_path):
+    counter = cz_warmup.RequestCounter(str(tmp_path / "requests.json"))
+    assert counter.most_requested(3) == []
+
+    for country in ["France", "Spain", "France", "Italy", "France", "Spain"]:
+        counter.record(country)
+
+    assert counter.most_requested(2) == ["France", "Spain"]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for zonal statistics over local rasters
+"""
+
+import os
+
+import numpy as np
+import pytest
+import shapely
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.transform import from_origin
+
+import cz_zonal
+
+
+@pytest.fixture
+def raster(tmp_path):
+    # 0.01° pixels over 10–10.4°E, 50–50.2°N; value = 1 left half, 3 right half
+    values = np.ones((20, 40), dtype="float32")
+    values[:, 20:] = 3
+    values[0, 0] = -9999
+    path = str(tmp_path / "grid.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=40, height=20, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(10.0, 50.2, 0.01, 0.01), nodata=-9999) as dst:
+        dst.write(values, 1)
+    return path
+
+
+def zones():
+    return [shapely.box(10.0, 50.0, 10.2, 50.2), shapely.box(10.2, 50.0, 10.4, 50.2), shapely.box(20, 0, 21, 1)]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_sum_mean_count_per_zone(raster, tmp_path, max_workers):
+    stats = cz_zonal.zonal_statistics(raster, zones(), [7, 8, 9], str(tmp_path / "cache"),
+                                      block_rows=6, max_workers=max_workers)
+
+    assert stats['count'].tolist() == [399, 400, 0]
+    assert stats['sum'].tolist() == [399.0, 1200.0, 0.0]
+    assert stats.loc[8, 'mean'] == 3.0
+    assert np.isnan(stats.loc[9, 'mean'])
+
+
+def test_labels_are_cached_per_grid(raster, tmp_path):
+    cache = str(tmp_path / "cache")
+    first = cz_zonal.load_zone_labels(raster, zones(), cache)
+    modified = os.path.getmtime(first)
+    second = cz_zonal.load_zone_labels(raster, zones(), cache)
+
+    assert first == second and os.path.getmtime(second) == modified
+    labels = np.load(second, mmap_mode="r")
+    assert labels.shape == (20, 40)
+    assert set(np.unique(labels)) == {1, 2}
+
+
+def test_windows_of_wide_rasters_fit_the_pixel_budget(tmp_path, monkeypatch):
+    # A continent-wide raster gets a few rows per window, not a fixed 1024
+    assert cz_zonal.block_rows_for(200_000) == cz_zonal.BLOCK_PIXELS // 200_000 < 1024
+    assert cz_zonal.block_rows_for(10**8) == 1
+    assert cz_zonal.block_rows_for(40, block_pixels=1000) == 25
+
+    width, height = 5000, 8
+    path = str(tmp_path / "wide.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(0.0, 0.08, 0.01, 0.01)) as dst:
+        dst.write(np.full((height, width), 2, dtype="float32"), 1)
+
+    windows = []
+    real_windows = cz_zonal._row_windows
+    monkeypatch.setattr(cz_zonal, "_row_windows",
+                        lambda *args: windows.append(real_windows(*args)) or windows[-1])
+    stats = cz_zonal.zonal_statistics(path, [shapely.box(0, 0, 25, 0.08)], [1], str(tmp_path / "cache"),
+                                      block_pixels=2 * width, max_workers=1)
+
+    assert stats.loc[1, 'count'] == 2500 * height and stats.loc[1, 'sum'] == 2 * 2500 * height
+    assert all(stop - start == 2 for ranges in windows for start, stop in ranges)